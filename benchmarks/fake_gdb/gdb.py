@@ -0,0 +1,703 @@
+#!/bin/python3
+# An offline stand-in for the parts of GDB's Python API that syrup uses, so that
+# the recording and replay scripts can be run and measured outside GDB. The
+# inferior is simulated from a scripted schedule: every thread is a sequence of
+# operations (creating another thread or executing an instruction at an
+# address), and the schedule fixes the order the operations run in when the
+# threads are not constrained by scheduler locking.
+#
+# Like GDB, exceptions raised by listeners and posted events are printed to the
+# output rather than propagated, and an exception raised by Breakpoint.stop()
+# stops the inferior.
+import collections
+
+BP_BREAKPOINT = 1
+BP_HARDWARE_BREAKPOINT = 2
+BP_WATCHPOINT = 6
+BP_HARDWARE_WATCHPOINT = 7
+BP_READ_WATCHPOINT = 8
+BP_ACCESS_WATCHPOINT = 9
+WP_READ = 1
+WP_WRITE = 2
+WP_ACCESS = 3
+
+MAIN_THREAD_ID = 1
+
+class error(RuntimeError):
+	pass
+
+class GdbError(Exception):
+	pass
+
+class Quit(Exception):
+	def __init__(self, exit_code=0):
+		super().__init__(exit_code)
+		self.exit_code = exit_code
+
+# Events
+class EventRegistry:
+	def __init__(self):
+		self._listeners = []
+
+	def connect(self, listener):
+		self._listeners.append(listener)
+
+	def disconnect(self, listener):
+		self._listeners.remove(listener)
+
+	def fire(self, event):
+		for listener in list(self._listeners):
+			try:
+				listener(event)
+			except Quit:
+				raise
+			except Exception as exception:
+				# GDB prints exceptions raised by listeners and carries on
+				_simulator.output.append(f"Python Exception {type(exception)}: {exception}")
+
+class _Events:
+	def __init__(self):
+		self.stop = EventRegistry()
+		self.cont = EventRegistry()
+		self.new_thread = EventRegistry()
+		self.exited = EventRegistry()
+		self.new_objfile = EventRegistry()
+		self.breakpoint_created = EventRegistry()
+		self.breakpoint_deleted = EventRegistry()
+		self.before_prompt = EventRegistry()
+
+events = _Events()
+
+class StopEvent:
+	pass
+
+class BreakpointEvent(StopEvent):
+	def __init__(self, breakpoints):
+		self.breakpoints = breakpoints
+		self.breakpoint = breakpoints[0]
+
+class SignalEvent(StopEvent):
+	def __init__(self, stop_signal):
+		self.stop_signal = stop_signal
+
+class NewThreadEvent:
+	def __init__(self, inferior_thread):
+		self.inferior_thread = inferior_thread
+
+class ExitedEvent:
+	def __init__(self, exit_code, inferior):
+		self.exit_code = exit_code
+		self.inferior = inferior
+
+# Values and frames
+class Value:
+	def __init__(self, value):
+		self._value = value
+
+	def __int__(self):
+		return self._value
+
+	def __index__(self):
+		return self._value
+
+	def __eq__(self, other):
+		return int(self) == int(other)
+
+	def __hash__(self):
+		return hash(self._value)
+
+	def __str__(self):
+		return str(self._value)
+
+	def __repr__(self):
+		return f"Value({self._value})"
+
+class Frame:
+	def __init__(self, thread, pc, older=None, name=None):
+		self._thread = thread
+		self._pc = pc
+		self._older = older
+		self._name = name
+
+	def pc(self):
+		return self._pc
+
+	def older(self):
+		return self._older
+
+	def name(self):
+		return self._name
+
+	def is_valid(self):
+		return True
+
+	def read_register(self, register):
+		return Value(self._thread.registers.get(register, 0))
+
+class InferiorThread:
+	def __init__(self, inferior, num):
+		self.inferior = inferior
+		self.num = num
+		self.global_num = num
+		self.ptid = (inferior.pid, num, 0)
+		self.name = None
+		self.registers = {"rax": 0, "eax": 0, "rip": 0}
+		self.pc = 0
+		self.in_syscall = False
+		self.next_operation = 0
+
+	def is_valid(self):
+		return self in self.inferior._threads.values()
+
+	def is_running(self):
+		return False
+
+	def is_stopped(self):
+		return True
+
+	def is_exited(self):
+		return not self.is_valid()
+
+	def switch(self):
+		_simulator.selected_thread = self
+
+class Inferior:
+	def __init__(self, simulator, pid):
+		self._simulator = simulator
+		self.num = 1
+		self.pid = pid
+		self._threads = collections.OrderedDict()
+		self.memory = {}
+
+	def threads(self):
+		return tuple(reversed(self._threads.values()))
+
+	def is_valid(self):
+		return True
+
+	def read_memory(self, address, length):
+		return memoryview(bytes(
+			self.memory.get(address + offset, 0) for offset in range(length)
+		))
+
+	def write_memory(self, address, buffer, length=None):
+		data = bytes(buffer)[:length]
+		for offset, byte in enumerate(data):
+			self.memory[address + offset] = byte
+
+class Objfile:
+	def __init__(self, filename, build_id):
+		self.filename = filename
+		self.username = filename
+		self.build_id = build_id
+
+	def is_valid(self):
+		return True
+
+class Progspace:
+	def __init__(self, filename):
+		self.filename = filename
+
+	def objfiles(self):
+		return objfiles()
+
+	def solib_name(self, address):
+		return solib_name(address)
+
+# Breakpoints
+class Breakpoint:
+	def __init__(self, spec, type=BP_BREAKPOINT, wp_class=WP_WRITE,
+			internal=False, temporary=False):
+		self.location = spec
+		self.type = type
+		self.temporary = temporary
+		self.enabled = True
+		self.silent = False
+		self.thread = None
+		self.task = None
+		self.ignore_count = 0
+		self.hit_count = 0
+		self.condition = None
+		self.visible = not internal
+		self._address = _simulator.resolve(spec)
+		_simulator.add_breakpoint(self)
+
+	def is_valid(self):
+		return self.number in _simulator.breakpoints
+
+	def delete(self):
+		_simulator.delete_breakpoint(self)
+
+def breakpoints():
+	return tuple(_simulator.breakpoints.values())
+
+# A thread program is a list of (operation, argument) pairs. The operations are
+# OPERATION_CREATE, which creates the thread given as the argument through the
+# clone syscall, and OPERATION_EXECUTE, which executes the instruction at the
+# address given as the argument. OPERATION_WRITE additionally increments the
+# shared counter, which makes lost updates visible to the caller.
+OPERATION_CREATE = "create"
+OPERATION_EXECUTE = "execute"
+OPERATION_READ = "read"
+OPERATION_WRITE = "write"
+
+class Program:
+	def __init__(self, thread_programs, schedule, symbols=None,
+			clone_site=0x7ffff7f8e2ec, counter_address=0x555555558014,
+			mappings=None, disassembly=None, filename="a.out", files=""):
+		self.thread_programs = thread_programs
+		self.schedule = schedule
+		self.symbols = symbols or {}
+		self.clone_site = clone_site
+		self.counter_address = counter_address
+		self.mappings = mappings or DEFAULT_MAPPINGS
+		self.disassembly = disassembly or {}
+		self.filename = filename
+		self.files = files
+
+DEFAULT_MAPPINGS = [
+	(0x555555554000, 0x555555555000, 0x0, "/work/a.out"),
+	(0x555555555000, 0x555555556000, 0x1000, "/work/a.out"),
+	(0x555555557000, 0x555555559000, 0x2000, "/work/a.out"),
+	(0x7ffff7f80000, 0x7ffff7f87000, 0x0, "/lib/x86_64-linux-gnu/libpthread.so.0"),
+	(0x7ffff7f87000, 0x7ffff7f98000, 0x7000, "/lib/x86_64-linux-gnu/libpthread.so.0"),
+]
+
+class Simulator:
+	def __init__(self):
+		self.reset(None)
+
+	def reset(self, program):
+		self.program = program
+		self.inferior = None
+		self.selected_thread = None
+		self.selected_pc = {}
+		self.breakpoints = collections.OrderedDict()
+		self.breakpoints_by_address = collections.defaultdict(list)
+		self.breakpoint_number = 0
+		self.catch_clone = False
+		self.scheduler_locking = False
+		self.schedule_position = 0
+		self.posted_events = collections.deque()
+		self.running = False
+		self.output = []
+		self.stop_count = 0
+		self.exit_code = None
+		self.next_thread_id = MAIN_THREAD_ID
+		self.forks = {}
+		self.next_fork_number = 1
+		self.current_fork_number = None
+
+	def resolve(self, spec):
+		if spec.startswith("*"):
+			return int(spec[1:].split()[0], 0)
+		if spec in self.program.symbols:
+			return self.program.symbols[spec]
+		raise error(f"Function \"{spec}\" not defined.")
+
+	def add_breakpoint(self, breakpoint):
+		self.breakpoint_number += 1
+		breakpoint.number = self.breakpoint_number
+		self.breakpoints[breakpoint.number] = breakpoint
+		self.breakpoints_by_address[breakpoint._address].append(breakpoint)
+
+	def delete_breakpoint(self, breakpoint):
+		if self.breakpoints.pop(breakpoint.number, None) is not None:
+			self.breakpoints_by_address[breakpoint._address].remove(breakpoint)
+
+	def delete_all_breakpoints(self):
+		self.breakpoints.clear()
+		self.breakpoints_by_address.clear()
+
+	def run(self):
+		self.forks = {}
+		self.next_fork_number = 1
+		self.current_fork_number = None
+		self.inferior = Inferior(self, 4242)
+		self.schedule_position = 0
+		self.exit_code = None
+		self.executed = []
+		main_thread = self._add_thread(MAIN_THREAD_ID)
+		self.selected_thread = main_thread
+		main_address = self.program.symbols.get("main")
+		if main_address is not None:
+			main_thread.pc = main_address
+			if self._hit(main_thread, main_address):
+				return
+		self.resume()
+
+	def resume(self):
+		while True:
+			thread = self._next_thread_to_run()
+			if thread is None:
+				self._exit()
+				return
+			if self._step(thread):
+				return
+
+	def _next_thread_to_run(self):
+		threads = self.inferior._threads
+		if self.scheduler_locking:
+			thread = self.selected_thread
+			if thread is None or not thread.is_valid():
+				return None
+			if thread.next_operation >= len(self.program.thread_programs[thread.num]):
+				self._finish_thread(thread)
+				self.selected_thread = self._first_runnable_thread()
+				return self.selected_thread
+			return thread
+		while self.schedule_position < len(self.program.schedule):
+			thread_id = self.program.schedule[self.schedule_position]
+			thread = threads.get(thread_id)
+			if thread is not None and \
+					thread.next_operation < len(self.program.thread_programs[thread_id]):
+				return thread
+			self.schedule_position += 1
+		return self._first_runnable_thread()
+
+	def _first_runnable_thread(self):
+		for thread in list(self.inferior._threads.values()):
+			if thread.next_operation < len(self.program.thread_programs[thread.num]):
+				return thread
+			self._finish_thread(thread)
+		return None
+
+	def _finish_thread(self, thread):
+		if thread.num != MAIN_THREAD_ID and thread.is_valid():
+			del self.inferior._threads[thread.num]
+
+	def _step(self, thread):
+		operation, argument = self.program.thread_programs[thread.num][thread.next_operation]
+		if operation == OPERATION_CREATE:
+			return self._step_create(thread, argument)
+		thread.next_operation += 1
+		self._advance_schedule(thread)
+		self.executed.append((thread.num, argument))
+		if operation == OPERATION_READ:
+			thread.registers["rax"] = thread.registers["eax"] = self._counter()
+		elif operation == OPERATION_WRITE:
+			self._set_counter(thread.registers["eax"] + 1)
+		return self._hit(thread, argument)
+
+	def _step_create(self, thread, created_thread_id):
+		if self.catch_clone and not thread.in_syscall:
+			thread.in_syscall = True
+			return self._catch(thread)
+		if thread.in_syscall != "returning":
+			created_thread = self._add_thread(created_thread_id)
+			previously_selected_thread = self.selected_thread
+			self.selected_thread = thread
+			events.new_thread.fire(NewThreadEvent(created_thread))
+			self.selected_thread = previously_selected_thread
+			if self.catch_clone:
+				thread.in_syscall = "returning"
+				return self._catch(thread)
+		thread.in_syscall = False
+		thread.next_operation += 1
+		self._advance_schedule(thread)
+		return False
+
+	# Like the kernel, the number of the syscall is kept in orig_rax, and the
+	# thread stops just after its syscall instruction.
+	def _catch(self, thread):
+		self.selected_thread = thread
+		thread.pc = CLONE_ADDRESS
+		thread.registers["orig_rax"] = CLONE_SYSCALL_NUMBER
+		self.inferior.write_memory(CLONE_ADDRESS - len(SYSCALL_INSTRUCTION), SYSCALL_INSTRUCTION)
+		self.stop_count += 1
+		events.stop.fire(StopEvent())
+		return True
+
+	def _advance_schedule(self, thread):
+		if not self.scheduler_locking and \
+				self.schedule_position < len(self.program.schedule) and \
+				self.program.schedule[self.schedule_position] == thread.num:
+			self.schedule_position += 1
+
+	def _hit(self, thread, address):
+		thread.pc = address
+		thread.registers["rip"] = address
+		hit_breakpoints = []
+		for breakpoint in list(self.breakpoints_by_address.get(address, ())):
+			if not breakpoint.enabled:
+				continue
+			if breakpoint.thread is not None and breakpoint.thread != thread.global_num:
+				continue
+			if breakpoint.ignore_count > 0:
+				breakpoint.ignore_count -= 1
+				continue
+			breakpoint.hit_count += 1
+			previously_selected_thread = self.selected_thread
+			self.selected_thread = thread
+			should_stop = True
+			if hasattr(breakpoint, "stop"):
+				try:
+					should_stop = breakpoint.stop()
+				except Exception as exception:
+					# GDB prints exceptions raised by stop() and stops
+					self.output.append(f"Python Exception {type(exception)}: {exception} (in stop() of thread {thread.num} at {address:#x})")
+			if not should_stop:
+				self.selected_thread = previously_selected_thread
+				continue
+			hit_breakpoints.append(breakpoint)
+		if len(hit_breakpoints) == 0:
+			return False
+		self.selected_thread = thread
+		for breakpoint in hit_breakpoints:
+			if breakpoint.temporary:
+				breakpoint.delete()
+		self.stop_count += 1
+		events.stop.fire(BreakpointEvent(hit_breakpoints))
+		return True
+
+	def _add_thread(self, thread_id):
+		thread = InferiorThread(self.inferior, thread_id)
+		self.inferior._threads[thread_id] = thread
+		return thread
+
+	def _exit(self):
+		self.exit_code = self._counter()
+		inferior = self.inferior
+		inferior._threads.clear()
+		self.selected_thread = None
+		events.exited.fire(ExitedEvent(self.exit_code, inferior))
+		# Like GDB, switch to another checkpoint once the process has exited
+		if self.current_fork_number is not None:
+			del self.forks[self.current_fork_number]
+			self.current_fork_number = None
+			if len(self.forks) > 0:
+				self._switch_to_fork(max(self.forks))
+
+	# Checkpoints copy the state of the inferior, standing in for the forked
+	# processes of GDB. The process being run is numbered 0 once there are any,
+	# and is held in the simulator rather than in forks.
+	def checkpoint(self):
+		if self.current_fork_number is None:
+			self.current_fork_number = 0
+			self.forks[0] = None
+		fork_number = self.next_fork_number
+		self.next_fork_number += 1
+		self.forks[fork_number] = self._inferior_state()
+		return f"checkpoint {fork_number}: fork returned pid {4242 + fork_number}.\n"
+
+	def restart(self, fork_number):
+		if fork_number not in self.forks:
+			raise error(f"Not found: checkpoint id {fork_number}")
+		if self.current_fork_number is not None:
+			self.forks[self.current_fork_number] = self._inferior_state()
+		self._switch_to_fork(fork_number)
+
+	def delete_fork(self, fork_number):
+		if fork_number not in self.forks:
+			raise error(f"Invalid checkpoint number {fork_number}")
+		if fork_number == self.current_fork_number:
+			raise error("Please switch to another checkpoint before deleting the current one")
+		del self.forks[fork_number]
+
+	def _switch_to_fork(self, fork_number):
+		threads, memory, selected_thread, schedule_position, executed = self.forks[fork_number]
+		self.forks[fork_number] = None
+		self.current_fork_number = fork_number
+		self.inferior._threads.clear()
+		for thread_state in threads:
+			thread = self._add_thread(thread_state.num)
+			thread.registers = dict(thread_state.registers)
+			thread.pc = thread_state.pc
+			thread.in_syscall = thread_state.in_syscall
+			thread.next_operation = thread_state.next_operation
+		self.inferior.memory = dict(memory)
+		self.selected_thread = self.inferior._threads.get(selected_thread)
+		self.schedule_position = schedule_position
+		self.executed = list(executed)
+
+	def _inferior_state(self):
+		threads = []
+		for thread in self.inferior._threads.values():
+			thread_state = InferiorThread(self.inferior, thread.num)
+			thread_state.registers = dict(thread.registers)
+			thread_state.pc = thread.pc
+			thread_state.in_syscall = thread.in_syscall
+			thread_state.next_operation = thread.next_operation
+			threads.append(thread_state)
+		selected_thread = None if self.selected_thread is None else self.selected_thread.num
+		return threads, dict(self.inferior.memory), selected_thread, \
+			self.schedule_position, list(self.executed)
+
+	def _counter(self):
+		return int.from_bytes(
+			self.inferior.read_memory(self.program.counter_address, 4), "little"
+		)
+
+	def _set_counter(self, value):
+		self.inferior.write_memory(
+			self.program.counter_address, (value & 0xffffffff).to_bytes(4, "little")
+		)
+
+	def execute(self, command, from_tty, to_string):
+		words = command.split()
+		output = None
+		if len(words) == 0:
+			pass
+		elif words[0] in ("run", "r", "start"):
+			self.run()
+		elif words[0] in ("continue", "c"):
+			if self.inferior is None or len(self.inferior._threads) == 0:
+				raise error("The program is not being run.")
+			self.resume()
+		elif words[0] == "thread" and len(words) == 2:
+			thread = self.inferior._threads.get(int(words[1]))
+			if thread is None:
+				raise error(f"Invalid thread ID: {words[1]}")
+			self.selected_thread = thread
+		elif words[:2] == ["set", "scheduler-locking"]:
+			self.scheduler_locking = words[2] in ("on", "step", "replay")
+		elif words[0] == "set":
+			pass
+		elif words[:2] == ["show", "endian"]:
+			output = "The target endianness is set automatically (currently little endian)."
+		elif words[0] == "checkpoint":
+			if self.inferior is None or len(self.inferior._threads) == 0:
+				raise error("The program is not being run.")
+			output = self.checkpoint()
+			# Like GDB, only report the new checkpoint to the terminal
+			if not from_tty:
+				output = ""
+		elif words[0] == "restart" and len(words) == 2:
+			self.restart(int(words[1]))
+		elif words[:2] == ["delete", "checkpoint"] and len(words) == 3:
+			self.delete_fork(int(words[2]))
+		elif words[0] == "delete":
+			self.delete_all_breakpoints()
+			self.catch_clone = False
+		elif words[:3] == ["catch", "syscall", "clone"]:
+			self.catch_clone = True
+		elif words[:2] == ["info", "registers"]:
+			frame = selected_frame()
+			output = "\n".join(
+				f"{register} 0x{int(frame.read_register(register)):x}"
+				for register in words[2:]
+			)
+		elif words[:3] == ["info", "proc", "mappings"]:
+			output = _mappings_output(self.program.mappings)
+		elif words[:2] == ["info", "files"]:
+			output = self.program.files
+		elif words[0] == "disassemble":
+			output = self.program.disassembly.get(" ".join(words[1:]), "")
+		elif words[0] == "kill":
+			if self.inferior is None or len(self.inferior._threads) == 0:
+				raise error("The program is not being run.")
+			self.inferior._threads.clear()
+			self.selected_thread = None
+			self.forks = {}
+			self.current_fork_number = None
+		elif words[0] == "quit":
+			raise Quit(int(words[1]) if len(words) > 1 else 0)
+		else:
+			raise error(f"Undefined command: \"{words[0]}\".")
+		if output is not None and not to_string:
+			self.output.append(output)
+		return output if to_string else None
+
+CLONE_ADDRESS = 0x7ffff7e95a50
+CLONE_SYSCALL_NUMBER = 56
+SYSCALL_INSTRUCTION = b"\x0f\x05"
+
+def _mappings_output(mappings):
+	lines = ["process 4242", "Mapped address spaces:", "",
+		"          Start Addr           End Addr       Size     Offset objfile"]
+	for start, end, offset, objfile in mappings:
+		lines.append(f"      {start:#18x} {end:#18x} {end - start:#10x} {offset:#10x} {objfile}")
+	return "\n".join(lines) + "\n"
+
+_simulator = Simulator()
+
+def execute(command, from_tty=False, to_string=False):
+	return _simulator.execute(command, from_tty, to_string)
+
+def post_event(event):
+	_simulator.posted_events.append(event)
+
+def selected_thread():
+	return _simulator.selected_thread
+
+def selected_inferior():
+	return _simulator.inferior
+
+def inferiors():
+	return (_simulator.inferior,)
+
+def selected_frame():
+	thread = _simulator.selected_thread
+	if thread is None:
+		raise error("No frame selected.")
+	if thread.pc == CLONE_ADDRESS:
+		caller = Frame(thread, _simulator.program.clone_site, name="create_thread")
+		return Frame(thread, CLONE_ADDRESS, older=caller, name="clone")
+	return Frame(thread, thread.pc)
+
+def newest_frame():
+	return selected_frame()
+
+def objfiles():
+	filenames = []
+	for _, _, _, objfile in _simulator.program.mappings:
+		if objfile not in filenames:
+			filenames.append(objfile)
+	return [Objfile(filename, f"build-id-{index}") for index, filename in enumerate(filenames)]
+
+def current_progspace():
+	return Progspace(_simulator.program.filename)
+
+def solib_name(address):
+	main_objfile = _simulator.program.mappings[0][3]
+	for start, end, _, objfile in _simulator.program.mappings:
+		if start <= address < end:
+			return None if objfile == main_objfile else objfile
+	return None
+
+def write(text, stream=None):
+	_simulator.output.append(text)
+
+def flush(stream=None):
+	pass
+
+# Driving the simulation
+def load_program(program):
+	global events
+	events = _Events()
+	_simulator.reset(program)
+
+def run_posted_events():
+	try:
+		while len(_simulator.posted_events) > 0:
+			event = _simulator.posted_events.popleft()
+			try:
+				event()
+			except Quit:
+				raise
+			except Exception as exception:
+				# GDB prints exceptions raised by posted events and carries on
+				_simulator.output.append(f"Python Exception {type(exception)}: {exception}")
+	except Quit as quit:
+		return quit.exit_code
+	return None
+
+def simulator():
+	return _simulator
+
+# The simulated program has no debugging information, so GDB knows no symbols
+# with types.
+def lookup_global_symbol(name, domain=None):
+	return None
+
+def lookup_static_symbol(name, domain=None):
+	return None
+
+# Only taking the address of a symbol is supported.
+def parse_and_eval(expression):
+	symbol = expression.replace(" ", "").replace("(long)", "").lstrip("&")
+	if symbol == "counter":
+		return Value(_simulator.program.counter_address)
+	if symbol in _simulator.program.symbols:
+		return Value(_simulator.program.symbols[symbol])
+	raise error(f"No symbol \"{symbol}\" in current context.")
@@ -0,0 +1,188 @@
+#!/bin/python3
+
+# Measures the cost of the recording and replay scripts per checkpoint, by
+# running them against the fake GDB in benchmarks/fake_gdb. The simulated traces
+# under simulations are used as fixtures where they exist, and synthetic traces
+# of the same shape are used for the other thread counts.
+#
+# The time the fake GDB spends simulating the program on its own is measured
+# separately and subtracted, so the numbers reported are the cost of syrup's
+# listeners and breakpoint handlers, including their setup. Errors reported by
+# syrup or raised from its listeners are summarised on stderr, and make the
+# benchmarks exit with 1 once they have all run.
+#
+# Usage: python3 benchmarks/run-benchmarks.py [--threads 4 16 500 5000]
+import os
+import sys
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(BENCHMARK_DIRECTORY)
+SYRUP_DIRECTORY = os.path.join(REPOSITORY_DIRECTORY, "syrup")
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, "fake_gdb"))
+sys.path.insert(0, BENCHMARK_DIRECTORY)
+sys.path.append(SYRUP_DIRECTORY)
+
+import argparse
+import gc
+import importlib.util
+import json
+import tempfile
+import time
+import gdb
+import simulated_program
+from logger import logger
+
+DEFAULT_THREAD_COUNTS = [4, 16, 500, 5000]
+SIMULATED_TRACE_FILE = os.path.join(
+	REPOSITORY_DIRECTORY, "simulations", "breakpoints", "{}-threads-old-gdb", "simulated"
+)
+TRACE_FILE = "./checkpoints.jsonl"
+CLONE_SITE_CACHE_FILE = "./clone_sites.json"
+
+# Keeps the errors logged by syrup so that they can be summarised, rather than
+# printed among the results.
+class CollectingSink:
+	def __init__(self):
+		self.lines = []
+
+	def write(self, line):
+		self.lines.append(line)
+
+	def flush(self):
+		pass
+
+class BenchmarkResult:
+	def __init__(self, name, thread_count, checkpoint_count, stop_count, seconds, baseline_seconds):
+		self.name = name
+		self.thread_count = thread_count
+		self.checkpoint_count = checkpoint_count
+		self.stop_count = stop_count
+		self.seconds = seconds
+		self.baseline_seconds = baseline_seconds
+
+	def microseconds_per_checkpoint(self):
+		return 1e6 * max(self.seconds - self.baseline_seconds, 0) / max(self.checkpoint_count, 1)
+
+	def as_dictionary(self):
+		return {
+			"benchmark": self.name,
+			"threads": self.thread_count,
+			"checkpoints": self.checkpoint_count,
+			"stops": self.stop_count,
+			"seconds": round(self.seconds, 4),
+			"baseline_seconds": round(self.baseline_seconds, 4),
+			"microseconds_per_checkpoint": round(self.microseconds_per_checkpoint(), 2)
+		}
+
+	def __str__(self):
+		return f"{self.name:<20} {self.thread_count:>7} {self.checkpoint_count:>11} " \
+			f"{self.stop_count:>7} {self.seconds:>9.3f} {self.microseconds_per_checkpoint():>12.2f}"
+
+RESULT_HEADING = f"{'benchmark':<20} {'threads':>7} {'checkpoints':>11} {'stops':>7} " \
+	f"{'seconds':>9} {'us/checkpoint':>12}"
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Benchmark recording and replay against a fake GDB")
+	parser.add_argument("--threads", type=int, nargs="+", default=DEFAULT_THREAD_COUNTS)
+	parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the fastest is kept")
+	parser.add_argument("--json", help="also write the results to this file")
+	return parser.parse_args()
+
+def fixture_trace(thread_count):
+	simulated_trace_file = SIMULATED_TRACE_FILE.format(thread_count)
+	if os.path.isfile(simulated_trace_file):
+		return simulated_program.load_simulated_trace(simulated_trace_file)
+	return simulated_program.synthetic_trace(thread_count)
+
+def load_script(name):
+	spec = importlib.util.spec_from_file_location(
+		name.replace("-", "_"),
+		os.path.join(SYRUP_DIRECTORY, f"{name}.py")
+	)
+	script = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(script)
+	return script
+
+def timed(function):
+	gc.collect()
+	start = time.perf_counter()
+	function()
+	return time.perf_counter() - start
+
+def fastest(repeat, function):
+	return min(timed(function) for _ in range(repeat))
+
+def run_program_without_syrup(trace):
+	gdb.load_program(simulated_program.program_from_trace(trace))
+	gdb.execute("run")
+
+def record(trace):
+	gdb.load_program(simulated_program.program_from_trace(trace))
+	load_script("write-json").main()
+	gdb.run_posted_events()
+
+def replay(trace, trace_file_name):
+	gdb.load_program(simulated_program.program_from_trace(trace))
+	read_json = load_script("read-json")
+	read_json.CHECKPOINT_FILE_LOCATION = trace_file_name
+	read_json.main()
+	gdb.run_posted_events()
+
+# Returns the number of errors.
+def report_errors(name, log_sink):
+	errors = [line for line in gdb.simulator().output if "Exception" in line] + log_sink.lines
+	if len(errors) > 0:
+		print(f"{name}: {len(errors)} errors, the first was: {errors[0]}", file=sys.stderr)
+	log_sink.lines = []
+	return len(errors)
+
+# Returns the results along with the number of errors reported.
+def benchmark(thread_count, repeat, log_sink):
+	trace = fixture_trace(thread_count)
+	checkpoint_count = len(trace)
+	baseline_seconds = fastest(repeat, lambda: run_program_without_syrup(trace))
+	results = []
+	error_count = 0
+
+	if os.path.isfile(CLONE_SITE_CACHE_FILE):
+		os.remove(CLONE_SITE_CACHE_FILE)
+	seconds = timed(lambda: record(trace))
+	error_count += report_errors("record discovering clone sites", log_sink)
+	results.append(BenchmarkResult("record (discovery)", thread_count, checkpoint_count,
+		gdb.simulator().stop_count, seconds, baseline_seconds))
+
+	seconds = fastest(repeat, lambda: record(trace))
+	error_count += report_errors("record", log_sink)
+	results.append(BenchmarkResult("record (cached)", thread_count, checkpoint_count,
+		gdb.simulator().stop_count, seconds, baseline_seconds))
+
+	seconds = fastest(repeat, lambda: replay(trace, TRACE_FILE))
+	error_count += report_errors("replay", log_sink)
+	results.append(BenchmarkResult("replay", thread_count, checkpoint_count,
+		gdb.simulator().stop_count, seconds, baseline_seconds))
+	return results, error_count
+
+def main():
+	arguments = parse_arguments()
+	logger.set_level(logger.ERROR)
+	log_sink = CollectingSink()
+	logger.use_sink(log_sink)
+	results = []
+	error_count = 0
+	json_file_name = None if arguments.json is None else os.path.abspath(arguments.json)
+	with tempfile.TemporaryDirectory() as working_directory:
+		os.chdir(working_directory)
+		print(RESULT_HEADING)
+		for thread_count in arguments.threads:
+			thread_count_results, thread_count_error_count = benchmark(thread_count, arguments.repeat, log_sink)
+			for result in thread_count_results:
+				print(result)
+				results.append(result)
+			error_count += thread_count_error_count
+	if json_file_name is not None:
+		with open(json_file_name, "w+") as results_file:
+			json.dump([result.as_dictionary() for result in results], results_file, indent=2)
+	if error_count > 0:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
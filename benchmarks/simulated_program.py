@@ -0,0 +1,157 @@
+#!/bin/python3
+# Builds programs for the fake GDB from the traces under simulations, or from
+# synthetic traces of the same shape. The traces come from the counter example,
+# where the main thread creates every other thread and each created thread runs
+# increment, which reads and then writes the shared counter once.
+import ast
+import random
+import gdb
+
+MAIN_THREAD_ID = 1
+MAIN_ADDRESS = 0x5555555551c7
+START_ROUTINE_ADDRESS = 0x5555555551a9
+COUNTER_READ_ADDRESS = 0x5555555551bb
+COUNTER_WRITE_ADDRESS = 0x5555555551c4
+CLONE_SITE_ADDRESS = 0x7ffff7f8e2ec
+THREAD_OPERATIONS = [START_ROUTINE_ADDRESS, COUNTER_READ_ADDRESS, COUNTER_WRITE_ADDRESS]
+
+# The output of "info files" and of disassembling .text that site discovery
+# sees for the counter example.
+INFO_FILES = """Symbols from "/work/a.out".
+Native process:
+	Using the running image of child process 4242.
+Local exec file:
+	`/work/a.out', file type elf64-x86-64.
+	Entry point: 0x5555555550c0
+	0x0000555555554318 - 0x0000555555554334 is .interp
+	0x00005555555550c0 - 0x0000555555555305 is .text
+	0x0000555555557df0 - 0x0000555555557df8 is .init_array
+	0x0000555555558000 - 0x0000555555558010 is .data
+	0x0000555555558010 - 0x0000555555558018 is .bss
+	0x00007ffff7f80318 - 0x00007ffff7f80400 is .data in /lib/x86_64-linux-gnu/libpthread.so.0
+	0x00007ffff7f81000 - 0x00007ffff7f90000 is .text in /lib/x86_64-linux-gnu/libpthread.so.0
+"""
+TEXT_DISASSEMBLY_RANGE = "0x5555555550c0,0x555555555305"
+TEXT_DISASSEMBLY = """Dump of assembler code from 0x5555555550c0 to 0x555555555305:
+   0x00005555555550c0 <_start+0>:\tendbr64
+   0x00005555555550c4 <_start+4>:\txor    %ebp,%ebp
+   0x0000555555555180 <__do_global_dtors_aux+0>:\tcmpb   $0x0,0x2e89(%rip)        # 0x555555558010 <completed.0>
+   0x0000555555555187 <__do_global_dtors_aux+7>:\tmovb   $0x1,0x2e82(%rip)        # 0x555555558010 <completed.0>
+   0x00005555555551a9 <increment+0>:\tendbr64
+   0x00005555555551ad <increment+4>:\tpush   %rbp
+   0x00005555555551ae <increment+5>:\tmov    %rsp,%rbp
+   0x00005555555551b1 <increment+8>:\tmov    %rdi,-0x18(%rbp)
+   0x00005555555551b5 <increment+12>:\tmovl   $0x0,-0x4(%rbp)
+   0x00005555555551bb <increment+18>:\tmov    0x2e53(%rip),%eax        # 0x555555558014 <counter>
+   0x00005555555551c1 <increment+24>:\tadd    $0x1,%eax
+   0x00005555555551c4 <increment+27>:\tmov    %eax,0x2e4a(%rip)        # 0x555555558014 <counter>
+   0x00005555555551ca <increment+33>:\tnop
+   0x00005555555551cb <increment+34>:\tpop    %rbp
+   0x00005555555551cc <increment+35>:\tret
+   0x00005555555551c7 <main+0>:\tendbr64
+   0x0000555555555200 <main+57>:\tlea    -0x5e(%rip),%rax        # 0x5555555551a9 <increment>
+   0x0000555555555207 <main+64>:\tmov    %rax,%rdx
+   0x000055555555520a <main+67>:\tmov    $0x0,%esi
+   0x000055555555520f <main+72>:\tmov    %rbx,%rdi
+   0x0000555555555214 <main+77>:\tcall   0x5555555550a0 <pthread_create@plt>
+   0x0000555555555250 <main+137>:\tmov    0x2dbe(%rip),%eax        # 0x555555558014 <counter>
+End of assembler dump.
+"""
+
+# The simulated files hold the recorded checkpoints followed by the final value
+# of the counter.
+def load_simulated_trace(simulated_file_name):
+	with open(simulated_file_name) as simulated_file:
+		checkpoints, _, _ = simulated_file.read().rstrip().rpartition("\n")
+	return ast.literal_eval(checkpoints)
+
+# Creates a trace of the counter example with the given number of threads,
+# interleaving the threads at random in the way a real recording would.
+def synthetic_trace(thread_count, seed=0):
+	generator = random.Random(seed)
+	created_threads = list(range(MAIN_THREAD_ID + 1, MAIN_THREAD_ID + 1 + thread_count))
+	remaining_operations = {}
+	main_thread_is_in_clone = False
+	checkpoints = []
+	while len(created_threads) > 0 or main_thread_is_in_clone or len(remaining_operations) > 0:
+		runnable_threads = list(remaining_operations)
+		if len(created_threads) > 0 or main_thread_is_in_clone:
+			runnable_threads.append(MAIN_THREAD_ID)
+		thread = generator.choice(runnable_threads)
+		if thread != MAIN_THREAD_ID:
+			location = remaining_operations[thread].pop(0)
+			if len(remaining_operations[thread]) == 0:
+				del remaining_operations[thread]
+		elif main_thread_is_in_clone:
+			location = CLONE_SITE_ADDRESS
+			main_thread_is_in_clone = False
+		else:
+			remaining_operations[created_threads.pop(0)] = list(THREAD_OPERATIONS)
+			main_thread_is_in_clone = True
+			continue
+		checkpoints.append({
+			"action": "",
+			"id": len(checkpoints),
+			"location": f"*{hex(location)}",
+			"thread": thread
+		})
+	return checkpoints
+
+# Threads are numbered in the order they are created, and the main thread
+# creates the nth thread just before it returns from the clone syscall at its
+# nth thread creation checkpoint. The schedule runs the operations in the order
+# of the trace, creating each thread just before its first checkpoint if the
+# main thread has not returned from creating it yet.
+def program_from_trace(checkpoints):
+	created_threads = sorted(set(checkpoint["thread"] for checkpoint in checkpoints) - {MAIN_THREAD_ID})
+	thread_programs = {thread: [] for thread in [MAIN_THREAD_ID] + created_threads}
+	creation_count = 0
+	for checkpoint in checkpoints:
+		thread = checkpoint["thread"]
+		location = int(checkpoint["location"].lstrip("*"), 16)
+		if thread == MAIN_THREAD_ID and location == CLONE_SITE_ADDRESS and \
+				creation_count < len(created_threads):
+			thread_programs[MAIN_THREAD_ID].append((gdb.OPERATION_CREATE, created_threads[creation_count]))
+			creation_count += 1
+		thread_programs[thread].append((_operation_at(location), location))
+	for created_thread in created_threads[creation_count:]:
+		thread_programs[MAIN_THREAD_ID].append((gdb.OPERATION_CREATE, created_thread))
+	return gdb.Program(
+		thread_programs,
+		_schedule(checkpoints, thread_programs[MAIN_THREAD_ID]),
+		symbols={"main": MAIN_ADDRESS, "increment": START_ROUTINE_ADDRESS},
+		files=INFO_FILES,
+		disassembly={TEXT_DISASSEMBLY_RANGE: TEXT_DISASSEMBLY}
+	)
+
+def _schedule(checkpoints, main_thread_program):
+	schedule = []
+	main_thread_position = 0
+	created_threads = set([MAIN_THREAD_ID])
+	for checkpoint in checkpoints:
+		thread = checkpoint["thread"]
+		while thread not in created_threads or thread == MAIN_THREAD_ID:
+			operation, argument = main_thread_program[main_thread_position]
+			schedule.append(MAIN_THREAD_ID)
+			main_thread_position += 1
+			if operation == gdb.OPERATION_CREATE:
+				created_threads.add(argument)
+			elif thread == MAIN_THREAD_ID:
+				break
+		if thread != MAIN_THREAD_ID:
+			schedule.append(thread)
+	return schedule
+
+def thread_creations(program):
+	return [
+		{"creator_thread": MAIN_THREAD_ID, "created_thread": created_thread}
+		for operation, created_thread in program.thread_programs[MAIN_THREAD_ID]
+		if operation == gdb.OPERATION_CREATE
+	]
+
+def _operation_at(location):
+	if location == COUNTER_READ_ADDRESS:
+		return gdb.OPERATION_READ
+	if location == COUNTER_WRITE_ADDRESS:
+		return gdb.OPERATION_WRITE
+	return gdb.OPERATION_EXECUTE
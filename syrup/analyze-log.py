@@ -0,0 +1,104 @@
+#!/bin/python3
+
+# Summarises the log of a GDB session running syrup, such as the actual files
+# under simulations, and optionally compares the checkpoints in it with the
+# expected checkpoints. Latencies are only reported for logs written with
+# SYRUP_LOG_TIMESTAMPS=1, and checkpoints are only found in logs written with
+# SYRUP_LOG_LEVEL=DEBUG, as syrup logs them at debug level.
+#
+# Usage: python3 syrup/analyze-log.py simulations/breakpoints/4-threads-old-gdb/actual
+#	--expected simulations/breakpoints/4-threads-old-gdb/simulated
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+import argparse
+from log_analyzer.log_analyzer import LogAnalyzer, OrderDiff, iter_expected_checkpoints, \
+		DEFAULT_MISMATCH_LIMIT
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Summarise a log of a GDB session running syrup")
+	parser.add_argument("log", help="log of the GDB session")
+	parser.add_argument("--expected", help="simulated file or trace holding the expected checkpoints")
+	parser.add_argument("--actions", type=int, default=5, help="most common actions shown per phase")
+	parser.add_argument("--mismatches", type=int, default=DEFAULT_MISMATCH_LIMIT,
+		help="mismatches with the expected checkpoints shown")
+	parser.add_argument("--module-base", action="append", default=[], metavar="MODULE=ADDRESS",
+		help="base address of a module, to compare its offsets with absolute addresses")
+	return parser.parse_args()
+
+def parse_module_bases(module_base_arguments):
+	module_bases = {}
+	for module_base_argument in module_base_arguments:
+		module, _, base = module_base_argument.partition("=")
+		module_bases[module] = int(base, 16)
+	return module_bases
+
+def print_phase(phase, action_limit):
+	print(f"{phase.name}: {phase.line_count} lines, {phase.stop_count()} stops, "
+		f"{phase.checkpoint_count} checkpoints, {phase.thread_switch_count} thread switches, "
+		f"{phase.new_thread_count} new threads, {phase.exited_thread_count} exited threads")
+	for kind, count in sorted(phase.stops_by_kind.items()):
+		print(f"\t{kind} stops: {count}")
+	for location, count in sorted(phase.stops_by_location.items()):
+		print(f"\t\tat {location}: {count}")
+	print_distribution("actions per stop", phase.actions_per_stop)
+	print_distribution("actions per checkpoint", phase.actions_per_checkpoint)
+	for action, count in phase.actions.most_common(action_limit):
+		print(f"\t{count:>8} {action}")
+
+def print_distribution(name, distribution):
+	total = sum(distribution.values())
+	if total == 0:
+		return
+	mean = sum(value * count for value, count in distribution.items()) / total
+	print(f"\t{name}: mean {mean:.2f}, max {max(distribution)}, "
+		f"distribution {dict(sorted(distribution.items()))}")
+
+def print_histogram(name, histogram):
+	if histogram.count == 0:
+		return
+	print(f"{name}: {histogram.count} samples, mean {1e6 * histogram.mean():.1f} us, "
+		f"p50 < {1e6 * histogram.quantile(0.5):.0f} us, p90 < {1e6 * histogram.quantile(0.9):.0f} us, "
+		f"p99 < {1e6 * histogram.quantile(0.99):.0f} us, max {1e6 * histogram.largest:.0f} us")
+	largest_count = max(count for _, count in histogram.buckets())
+	for bound, count in histogram.buckets():
+		bar = "#" * round(40 * count / largest_count)
+		print(f"\t< {1e6 * bound:>10.0f} us {count:>8} {bar}")
+
+def print_diff(diff):
+	print(f"order: {diff.actual_count} checkpoints in the log, {diff.expected_count} expected, "
+		f"{diff.mismatch_count} positions differ")
+	first_divergence = diff.first_divergence()
+	if first_divergence is None:
+		print("\tthe log matches the expected order")
+		return
+	print(f"\tfirst divergence at {first_divergence}")
+	for mismatch in diff.mismatches[1:]:
+		print(f"\t{mismatch}")
+
+def main():
+	arguments = parse_arguments()
+	diff = None
+	if arguments.expected is not None:
+		diff = OrderDiff(
+			iter_expected_checkpoints(arguments.expected),
+			arguments.mismatches,
+			parse_module_bases(arguments.module_base)
+		)
+	analyzer = LogAnalyzer(diff).analyse_file(arguments.log)
+	if analyzer.checkpoint_count() == 0 and analyzer.stop_count() > 0:
+		print("warning: the log has stops but no checkpoints, which are only logged at debug level; "
+			"record or replay with SYRUP_LOG_LEVEL=DEBUG to analyse them", file=sys.stderr)
+	for phase in analyzer.phases.values():
+		if phase.line_count > 0:
+			print_phase(phase, arguments.actions)
+	print_histogram("stop handling latency", analyzer.stop_handling_latency)
+	print_histogram("resume latency", analyzer.resume_latency)
+	print_histogram("checkpoint interval", analyzer.checkpoint_interval)
+	if diff is not None:
+		print_diff(diff.finish())
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,73 @@
+#!/bin/python3
+import gdb
+import hashlib
+import json
+import os
+import tempfile
+from logger.logger import log, warning
+
+FILE_HASH_CHUNK_SIZE = 1 << 20
+
+# Thread creation checkpoints are the return addresses of the clone syscall.
+# They only depend on the binaries that are loaded into the inferior, so they
+# are cached on disk under a key derived from those binaries. This allows later
+# recordings of the same program to skip discovering them.
+#
+# Recordings running at the same time may share the cache file, so it is
+# written whole to a temporary file that then replaces it, and the clone sites
+# other recordings cached since it was loaded are kept. A file that cannot be
+# read is taken for an empty cache.
+class CloneSiteCache:
+	def __init__(self, cache_file_name):
+		self._cache_file_name = cache_file_name
+		self._clone_sites = self._load()
+
+	def get_clone_sites(self, binary_key):
+		if binary_key not in self._clone_sites:
+			return None
+		return set(self._clone_sites[binary_key])
+
+	def put_clone_sites(self, binary_key, clone_sites):
+		log(f"Caching clone sites {clone_sites} for {binary_key}")
+		self._clone_sites.update(self._load())
+		self._clone_sites[binary_key] = sorted(clone_sites)
+		cache_directory = os.path.dirname(os.path.abspath(self._cache_file_name))
+		with tempfile.NamedTemporaryFile("w", dir=cache_directory, prefix=".clone_sites.",
+				suffix=".tmp", delete=False) as cache_file:
+			json.dump(self._clone_sites, cache_file, indent=2)
+		os.replace(cache_file.name, self._cache_file_name)
+
+	def _load(self):
+		if not os.path.isfile(self._cache_file_name):
+			return {}
+		try:
+			with open(self._cache_file_name) as cache_file:
+				clone_sites = json.load(cache_file)
+		except ValueError as exception:
+			warning(f"Ignoring the clone site cache {self._cache_file_name}, which cannot be read: {exception}")
+			return {}
+		if not isinstance(clone_sites, dict):
+			warning(f"Ignoring the clone site cache {self._cache_file_name}, which is not an object")
+			return {}
+		return clone_sites
+
+# The key covers every object file loaded into the inferior, as the clone
+# sites live in the threading library rather than in the program itself.
+def current_binary_key():
+	objfile_keys = map(_objfile_key, gdb.objfiles())
+	return hashlib.sha256("\n".join(objfile_keys).encode()).hexdigest()
+
+def _objfile_key(objfile):
+	build_id = getattr(objfile, "build_id", None)
+	if build_id is not None:
+		return build_id
+	if objfile.filename is not None and os.path.isfile(objfile.filename):
+		return _file_hash(objfile.filename)
+	return str(objfile.filename)
+
+def _file_hash(file_name):
+	file_hash = hashlib.sha256()
+	with open(file_name, "rb") as binary_file:
+		for chunk in iter(lambda: binary_file.read(FILE_HASH_CHUNK_SIZE), b""):
+			file_hash.update(chunk)
+	return file_hash.hexdigest()
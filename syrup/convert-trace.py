@@ -0,0 +1,37 @@
+#!/bin/python3
+
+# Converts a recorded trace, in any of the formats that checkpoint_parser reads,
+# into a trace archive.
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+import argparse
+from replay_reader.checkpoint_parser import checkpoint_parser
+from trace_archive.trace_archive import TraceArchive, COMPRESSION_NONE, \
+		COMPRESSION_ZLIB, COMPRESSION_LZMA
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Convert a recorded trace into a trace archive")
+	parser.add_argument("trace", help="trace recorded by write-json.py")
+	parser.add_argument("archive", help="file to write the trace archive to")
+	parser.add_argument(
+		"--compression",
+		choices=[COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_LZMA],
+		default=COMPRESSION_ZLIB
+	)
+	return parser.parse_args()
+
+def main():
+	arguments = parse_arguments()
+	trace = checkpoint_parser(arguments.trace)
+	archive = TraceArchive.from_checkpoints(trace.get_header(), trace.iter_checkpoints())
+	archive.save(arguments.archive, arguments.compression)
+	print(
+		f"Archived {len(archive)} checkpoints at {len(archive.locations)} locations: "
+		f"{os.path.getsize(arguments.trace)} bytes to {os.path.getsize(arguments.archive)} bytes"
+	)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,90 @@
+#!/bin/python3
+
+# Compares two recordings of the same program, such as a trace and the log of
+# a replay of it, or the actual and simulated files under simulations. Prints
+# where they first diverge, which threads ran different checkpoints, and how
+# many pairs of conflicting accesses to each shared variable were reordered.
+# Either file may be a trace in any format, a simulated file or a GDB log.
+#
+# Usage: python3 syrup/diff-traces.py simulations/breakpoints/4-threads-old-gdb/simulated
+#	checkpoints.jsonl --module-base a.out=0x555555554000
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+import argparse
+import json
+from trace_diff.trace_diff import TraceDiff, DEFAULT_EXAMPLE_LIMIT
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Find where two recordings of a program diverge")
+	parser.add_argument("first", help="trace, simulated file or log")
+	parser.add_argument("second", help="trace, simulated file or log")
+	parser.add_argument("--module-base", action="append", default=[], metavar="MODULE=ADDRESS",
+		help="base address of a module, to compare its offsets with absolute addresses")
+	parser.add_argument("--examples", type=int, default=DEFAULT_EXAMPLE_LIMIT,
+		help="threads and variables that differ shown")
+	parser.add_argument("--json", help="also write the differences to this file")
+	return parser.parse_args()
+
+def parse_module_bases(module_base_arguments):
+	module_bases = {}
+	for module_base_argument in module_base_arguments:
+		module, _, base = module_base_argument.partition("=")
+		module_bases[module] = int(base, 16)
+	return module_bases
+
+def print_divergence(diff):
+	table = diff.checkpoint_table
+	print(f"{diff.first.file_name}: {len(diff.first)} checkpoints ({diff.first.kind})")
+	print(f"{diff.second.file_name}: {len(diff.second)} checkpoints ({diff.second.kind})")
+	if diff.is_same():
+		print("the traces are the same")
+		return
+	print(f"first divergence at checkpoint {diff.divergence}: {table.describe(diff.first_checkpoint)}, "
+		f"then {table.describe(diff.second_checkpoint)}")
+
+def print_threads(diff, example_limit):
+	thread_diffs = [thread_diff for thread_diff in diff.thread_diffs if not thread_diff.is_same()]
+	if len(thread_diffs) == 0:
+		print(f"every one of the {len(diff.thread_diffs)} threads hit the same checkpoints, "
+			f"only interleaved differently")
+		return
+	print(f"{len(thread_diffs)} of {len(diff.thread_diffs)} threads hit different checkpoints")
+	table = diff.checkpoint_table
+	for thread_diff in thread_diffs[:example_limit]:
+		print(f"\tthread {thread_diff.thread}: {thread_diff.first_count} and {thread_diff.second_count} "
+			f"checkpoints, first differing at its checkpoint {thread_diff.divergence}: "
+			f"{_location(table, thread_diff.first_checkpoint)}, then {_location(table, thread_diff.second_checkpoint)}")
+
+def print_variables(diff, example_limit):
+	print(f"{diff.reordered_count()} pairs of conflicting accesses reordered")
+	variable_diffs = sorted(diff.variable_diffs, key=lambda variable_diff: -variable_diff.reordered_count)
+	for variable_diff in variable_diffs[:example_limit]:
+		if variable_diff.divergence is None:
+			continue
+		print(f"\t{variable_diff.variable}: {variable_diff.reordered_count} pairs reordered out of "
+			f"{variable_diff.matched_count} matched accesses, first accessed in a different order at "
+			f"access {variable_diff.divergence}, by thread {_thread(variable_diff.first_thread)}, "
+			f"then thread {_thread(variable_diff.second_thread)}")
+
+def _location(table, checkpoint_id):
+	return "nothing" if checkpoint_id is None else table.location(checkpoint_id)
+
+def _thread(thread):
+	return "none" if thread is None else thread
+
+def main():
+	arguments = parse_arguments()
+	diff = TraceDiff(arguments.first, arguments.second, parse_module_bases(arguments.module_base))
+	print_divergence(diff)
+	if not diff.is_same():
+		print_threads(diff, arguments.examples)
+		print_variables(diff, arguments.examples)
+	if arguments.json is not None:
+		with open(arguments.json, "w+") as json_file:
+			json.dump(diff.as_dictionary(arguments.examples), json_file, indent=2)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,119 @@
+#!/bin/python3
+
+# Replays alternative orders of the checkpoints of a recorded trace across a
+# pool of GDB processes, and reports how often each outcome was reached. The
+# trace must have its thread creations matched, as replay has to create each
+# thread before switching to it. By default only one order is replayed from
+# each class of orders that differ only in how independent checkpoints are
+# interleaved, which needs the shared variable accesses recorded in the header.
+# Several schedules can be replayed one after another in each GDB, restarting
+# each from a GDB checkpoint rather than from the beginning of the program.
+#
+# Usage: python3 syrup/explore.py checkpoints.jsonl examples/counter-2-threads/a.out
+#	--schedules 1000 --examples outcomes
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+import argparse
+import itertools
+import json
+from replay_reader.checkpoint_parser import checkpoint_parser
+from explorer.explorer import Explorer, random_schedules, DEFAULT_OUTCOME_PATTERN, DEFAULT_TIMEOUT
+from explorer.partial_order_reduction import ScheduleEnumerator
+
+STRATEGY_PARTIAL_ORDER_REDUCTION = "dpor"
+STRATEGY_RANDOM = "random"
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Replay alternative orders of a recorded trace in parallel")
+	parser.add_argument("trace", help="trace recorded by write-json.py")
+	parser.add_argument("program", help="program the trace was recorded from")
+	parser.add_argument("--schedules", type=int, default=100, help="number of orders to replay")
+	parser.add_argument(
+		"--strategy",
+		choices=[STRATEGY_PARTIAL_ORDER_REDUCTION, STRATEGY_RANDOM],
+		default=STRATEGY_PARTIAL_ORDER_REDUCTION,
+		help="replay one order per class of equivalent orders, or random orders"
+	)
+	parser.add_argument("--seed", type=int, default=0, help="seed for random orders")
+	parser.add_argument("--workers", type=int, help="GDB processes to run at once, one per core by default")
+	parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds allowed for each replay")
+	parser.add_argument("--gdb", default="gdb", help="GDB executable to run")
+	parser.add_argument("--outcome-pattern", default=DEFAULT_OUTCOME_PATTERN,
+		help="regular expression whose first group is the value reported for each replay")
+	parser.add_argument("--schedules-per-gdb", type=int, default=1,
+		help="schedules replayed one after another in each GDB")
+	parser.add_argument("--fork-checkpoint-ids", default="",
+		help="comma separated ids of checkpoints to take GDB checkpoints at, for later schedules to restart "
+			"from. Only checkpoints hit before the first thread is created can be used, as GDB checkpoints "
+			"only copy a single thread, and later ones are skipped with a warning")
+	parser.add_argument("--examples", help="directory to keep a schedule reaching each outcome in")
+	parser.add_argument("--json", help="also write the outcomes to this file")
+	return parser.parse_args()
+
+def print_progress(results):
+	print(f"\r{results.schedule_count} schedules replayed", end="", file=sys.stderr, flush=True)
+
+def print_results(results):
+	print(file=sys.stderr)
+	print(f"{results.schedule_count} schedules replayed, {len(results.outcome_counts)} outcomes")
+	for outcome, count in results.outcome_counts.most_common():
+		example = results.example_schedules.get(outcome)
+		print(f"\t{count:>8} {outcome.status}, exit code {outcome.exit_code}, value {outcome.value}"
+			+ ("" if example is None else f", for example {example}"))
+
+def write_results(results, json_file_name):
+	with open(json_file_name, "w+") as json_file:
+		json.dump([
+			{
+				**outcome._asdict(),
+				"count": count,
+				"example": results.example_schedules.get(outcome)
+			}
+			for outcome, count in results.outcome_counts.most_common()
+		], json_file, indent=2)
+
+def print_reduction(enumerator):
+	skipped_count = enumerator.skipped_count()
+	if skipped_count is None:
+		print(f"Stopped after {enumerator.emitted_count} classes of equivalent orders, "
+			f"out of {enumerator.total_schedule_count()} orders")
+	else:
+		print(f"{enumerator.emitted_count} classes of equivalent orders, "
+			f"skipped {skipped_count} of {enumerator.total_schedule_count()} orders")
+
+def main():
+	arguments = parse_arguments()
+	trace = checkpoint_parser(arguments.trace)
+	if arguments.examples is not None:
+		os.makedirs(arguments.examples, exist_ok=True)
+	explorer = Explorer(
+		os.path.abspath(arguments.program),
+		trace.get_header(),
+		arguments.workers,
+		arguments.gdb,
+		arguments.timeout,
+		arguments.outcome_pattern,
+		arguments.examples,
+		arguments.schedules_per_gdb,
+		[int(checkpoint_id) for checkpoint_id in arguments.fork_checkpoint_ids.split(",") if checkpoint_id]
+	)
+	enumerator = None
+	if arguments.strategy == STRATEGY_RANDOM:
+		schedules = random_schedules(trace.get_checkpoints(), arguments.schedules, arguments.seed)
+	else:
+		if len(trace.get_shared_variable_accesses()) == 0:
+			sys.exit("The trace does not record its shared variable accesses, use --strategy random")
+		enumerator = ScheduleEnumerator(trace.get_checkpoints(), trace.get_shared_variable_accesses())
+		schedules = itertools.islice(enumerator.schedules(), arguments.schedules)
+	results = explorer.explore(schedules, print_progress)
+	print_results(results)
+	if enumerator is not None:
+		print_reduction(enumerator)
+	if arguments.json is not None:
+		write_results(results, arguments.json)
+
+if __name__ == "__main__":
+	main()
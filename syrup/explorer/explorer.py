@@ -0,0 +1,315 @@
+#!/bin/python3
+import collections
+import concurrent.futures
+import itertools
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+from trace_writer.trace_writer import TraceWriter
+
+THREAD_ID_TAG = "thread"
+CHECKPOINT_ACTION_TAG = "action"
+CHECKPOINT_ACTION_CREATOR_THREAD_TAG = "creator_thread"
+CHECKPOINT_ACTION_CREATED_THREAD_TAG = "created_thread"
+SNAPSHOT_TAG = "snapshot"
+MAIN_THREAD_ID = 1
+REPLAY_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "read-json.py")
+CHECKPOINT_FILE_ENVIRONMENT_VARIABLE = "SYRUP_CHECKPOINT_FILE"
+QUIT_AFTER_REPLAY_ENVIRONMENT_VARIABLE = "SYRUP_QUIT_AFTER_REPLAY"
+SCHEDULE_LIST_ENVIRONMENT_VARIABLE = "SYRUP_SCHEDULE_LIST"
+FORK_CHECKPOINT_IDS_ENVIRONMENT_VARIABLE = "SYRUP_FORK_CHECKPOINT_IDS"
+LOG_LEVEL_ENVIRONMENT_VARIABLE = "SYRUP_LOG_LEVEL"
+DEFAULT_OUTCOME_PATTERN = r"Counter value is (-?\d+)"
+DEFAULT_TIMEOUT = 60
+DIVERGENCE_EXIT_CODE = 101
+STATUS_EXITED = "exited"
+STATUS_TIMED_OUT = "timed out"
+STATUS_FAILED = "failed"
+STATUS_DIVERGED = "diverged"
+
+_REPLAY_START_PATTERN = re.compile(r"^syrup: (?:\[[\d.]+\] )?Replaying schedule (.+)$", re.MULTILINE)
+_REPLAY_FINISH_PATTERN = re.compile(r"Replay finished with exit code (\d+)")
+_SCHEDULE_ATTEMPTS_PER_SCHEDULE = 10
+
+Outcome = collections.namedtuple("Outcome", ["status", "exit_code", "value"])
+
+# Replay can only switch to a thread once it has been created, so the first
+# checkpoint of each created thread has to come after the thread creation
+# checkpoint that created it. Threads are numbered in the order they are
+# created, and the nth thread creation checkpoint in the trace is taken to have
+# created the nth thread, as it is for the traces of write-json.py once their
+# thread creations have been matched.
+#
+# Returns the position of the creator checkpoint that must come before each
+# position holding the first checkpoint of a created thread.
+def thread_creation_dependencies(checkpoints):
+	creator_positions = list(thread_creator_ranks(checkpoints))
+	first_positions = {}
+	for position, checkpoint in enumerate(checkpoints):
+		if checkpoint.get(CHECKPOINT_ACTION_TAG) == CHECKPOINT_ACTION_CREATED_THREAD_TAG:
+			first_positions[checkpoint[THREAD_ID_TAG]] = position
+	created_threads = sorted(first_positions)
+	if len(created_threads) == 0 and any(
+			checkpoint[THREAD_ID_TAG] != MAIN_THREAD_ID for checkpoint in checkpoints):
+		raise ValueError("The trace does not mark its thread creations, match them before exploring")
+	if len(creator_positions) < len(created_threads):
+		raise ValueError(f"{len(created_threads)} threads were created by only "
+			f"{len(creator_positions)} thread creation checkpoints")
+	dependencies = {}
+	for creator_position, created_thread in zip(creator_positions, created_threads):
+		created_position = first_positions[created_thread]
+		if creator_position > created_position:
+			raise ValueError(f"Thread {created_thread} hits a checkpoint before it is created")
+		dependencies[created_position] = creator_position
+	return dependencies
+
+# The rank of each thread creation checkpoint among the thread creation
+# checkpoints of the trace, by its position.
+def thread_creator_ranks(checkpoints):
+	creator_positions = (
+		position for position, checkpoint in enumerate(checkpoints)
+		if checkpoint.get(CHECKPOINT_ACTION_TAG) == CHECKPOINT_ACTION_CREATOR_THREAD_TAG
+	)
+	return {position: rank for rank, position in enumerate(creator_positions)}
+
+# Replay numbers threads in the order they are created, so whichever thread was
+# created by the nth thread creation checkpoint of a schedule is numbered as
+# the nth created thread. Schedules that swap the thread creation checkpoints
+# of different threads swap the numbers of the threads they create, so the
+# checkpoints of those threads are renumbered to match. Returns the checkpoints
+# of a schedule of positions, copying only those whose thread is renumbered.
+def renumbered_schedule(checkpoints, creator_ranks, schedule):
+	renumbered_threads = {}
+	scheduled_creators = (position for position in schedule if position in creator_ranks)
+	for rank, position in enumerate(scheduled_creators):
+		if rank != creator_ranks[position]:
+			renumbered_threads[MAIN_THREAD_ID + 1 + creator_ranks[position]] = MAIN_THREAD_ID + 1 + rank
+	renumbered_checkpoints = []
+	for position in schedule:
+		checkpoint = checkpoints[position]
+		thread = renumbered_threads.get(checkpoint[THREAD_ID_TAG])
+		if thread is not None:
+			checkpoint = {**checkpoint, THREAD_ID_TAG: thread}
+		renumbered_checkpoints.append(checkpoint)
+	return renumbered_checkpoints
+
+# Positions of the checkpoints of each thread, in the order the thread hits
+# them.
+def positions_by_thread(checkpoints):
+	thread_positions = collections.OrderedDict()
+	for position, checkpoint in enumerate(checkpoints):
+		thread_positions.setdefault(checkpoint[THREAD_ID_TAG], []).append(position)
+	return thread_positions
+
+# Yields the recorded order followed by random orders of the same checkpoints,
+# each keeping the order of the checkpoints of every thread and creating
+# threads before they run. No order is yielded twice, and fewer orders than
+# asked for are yielded if the trace allows fewer.
+def random_schedules(checkpoints, schedule_count, seed=0):
+	dependencies = thread_creation_dependencies(checkpoints)
+	creator_ranks = thread_creator_ranks(checkpoints)
+	thread_positions = positions_by_thread(checkpoints)
+	generator = random.Random(seed)
+	seen_schedules = set()
+	attempts = 0
+	schedule = list(range(len(checkpoints)))
+	while len(seen_schedules) < schedule_count and attempts < schedule_count * _SCHEDULE_ATTEMPTS_PER_SCHEDULE:
+		attempts += 1
+		schedule_key = tuple(schedule)
+		if schedule_key not in seen_schedules:
+			seen_schedules.add(schedule_key)
+			yield renumbered_schedule(checkpoints, creator_ranks, schedule)
+		schedule = _random_schedule(thread_positions, dependencies, generator)
+
+def _random_schedule(thread_positions, dependencies, generator):
+	next_indices = {thread: 0 for thread in thread_positions}
+	schedule = []
+	enabled_threads = []
+	for thread, positions in thread_positions.items():
+		if dependencies.get(positions[0]) is None:
+			enabled_threads.append(thread)
+	waiting_threads = {}
+	for thread, positions in thread_positions.items():
+		creator_position = dependencies.get(positions[0])
+		if creator_position is not None:
+			waiting_threads.setdefault(creator_position, []).append(thread)
+	while len(enabled_threads) > 0:
+		thread_index = generator.randrange(len(enabled_threads))
+		thread = enabled_threads[thread_index]
+		position = thread_positions[thread][next_indices[thread]]
+		schedule.append(position)
+		next_indices[thread] += 1
+		if next_indices[thread] == len(thread_positions[thread]):
+			enabled_threads[thread_index] = enabled_threads[-1]
+			enabled_threads.pop()
+		enabled_threads.extend(waiting_threads.pop(position, ()))
+	return schedule
+
+# Runs replays of a batch of schedules in their own GDB, one after another, and
+# works out the outcome of each from what GDB and the inferior print. Replays
+# after the first restart from the deepest GDB checkpoint taken at a prefix of
+# their schedule, with checkpoints taken at fork_checkpoint_ids, rather than
+# running the inferior again from the beginning.
+class ReplayWorker:
+	def __init__(self, program, header, working_directory, gdb_command="gdb",
+			timeout=DEFAULT_TIMEOUT, outcome_pattern=DEFAULT_OUTCOME_PATTERN, fork_checkpoint_ids=()):
+		self._program = program
+		self._header = header
+		self._working_directory = working_directory
+		self._gdb_command = gdb_command
+		self._timeout = timeout
+		self._outcome_pattern = re.compile(outcome_pattern)
+		self._fork_checkpoint_ids = fork_checkpoint_ids
+
+	# Returns the file name and outcome of each schedule.
+	def __call__(self, batch_number, schedules):
+		schedule_file_names = [
+			self._write_schedule(f"schedule-{batch_number}-{schedule_number}.jsonl", schedule)
+			for schedule_number, schedule in enumerate(schedules)
+		]
+		environment = dict(os.environ)
+		environment[QUIT_AFTER_REPLAY_ENVIRONMENT_VARIABLE] = "1"
+		# The outcomes are told apart by what replay logs
+		environment[LOG_LEVEL_ENVIRONMENT_VARIABLE] = "INFO"
+		if len(schedule_file_names) == 1:
+			environment[CHECKPOINT_FILE_ENVIRONMENT_VARIABLE] = schedule_file_names[0]
+		else:
+			schedule_list_file_name = os.path.join(self._working_directory, f"schedules-{batch_number}.txt")
+			with open(schedule_list_file_name, "w+") as schedule_list_file:
+				schedule_list_file.write("".join(f"{file_name}\n" for file_name in schedule_file_names))
+			environment[SCHEDULE_LIST_ENVIRONMENT_VARIABLE] = schedule_list_file_name
+			environment[FORK_CHECKPOINT_IDS_ENVIRONMENT_VARIABLE] = ",".join(map(str, self._fork_checkpoint_ids))
+		output_file_name = os.path.join(self._working_directory, f"output-{batch_number}.txt")
+		with open(output_file_name, "w+") as output_file:
+			# stdin is kept open so that GDB keeps running its event loop until
+			# the replay quits it, rather than quitting at the end of its input.
+			process = subprocess.Popen(
+				[self._gdb_command, "-nx", "-q", "-x", REPLAY_SCRIPT, self._program],
+				stdin=subprocess.PIPE,
+				stdout=output_file,
+				stderr=subprocess.STDOUT,
+				env=environment
+			)
+			try:
+				process.wait(self._timeout * len(schedule_file_names))
+				is_timed_out = False
+			except subprocess.TimeoutExpired:
+				process.kill()
+				process.wait()
+				is_timed_out = True
+			process.stdin.close()
+			output_file.seek(0)
+			output = output_file.read()
+		os.remove(output_file_name)
+		replay_outputs = self._replay_outputs(output)
+		return [
+			(file_name, self._outcome(replay_outputs.get(file_name), is_timed_out))
+			for file_name in schedule_file_names
+		]
+
+	# Snapshots only hold for the recorded order, so replay is not asked to
+	# check them.
+	def _write_schedule(self, schedule_file_name, schedule):
+		schedule_file_name = os.path.join(self._working_directory, schedule_file_name)
+		trace_writer = TraceWriter(schedule_file_name, self._header)
+		for checkpoint in schedule:
+			trace_writer.write_checkpoint({
+				tag: value for tag, value in checkpoint.items() if tag != SNAPSHOT_TAG
+			})
+		trace_writer.close()
+		return schedule_file_name
+
+	# The output of each replay runs from where it starts to where the next
+	# one starts.
+	def _replay_outputs(self, output):
+		replay_starts = list(_REPLAY_START_PATTERN.finditer(output))
+		return {
+			replay_start.group(1): output[replay_start.end():
+				len(output) if next_replay_start is None else next_replay_start.start()]
+			for replay_start, next_replay_start in zip(replay_starts, replay_starts[1:] + [None])
+		}
+
+	def _outcome(self, output, is_timed_out):
+		return replay_outcome(output, is_timed_out, self._outcome_pattern)
+
+# Works out the outcome of a replay from what GDB and the inferior printed
+# during it, which is None if the replay never started.
+def replay_outcome(output, is_timed_out, outcome_pattern):
+	replay_finish = None if output is None else _REPLAY_FINISH_PATTERN.search(output)
+	if replay_finish is None:
+		return Outcome(STATUS_TIMED_OUT if is_timed_out else STATUS_FAILED, None, None)
+	exit_code = int(replay_finish.group(1))
+	if exit_code == DIVERGENCE_EXIT_CODE:
+		return Outcome(STATUS_DIVERGED, None, None)
+	value = outcome_pattern.search(output)
+	return Outcome(STATUS_EXITED, exit_code, None if value is None else value.group(1))
+
+class ExplorationResults:
+	def __init__(self):
+		self.outcome_counts = collections.Counter()
+		self.example_schedules = {}
+		self.schedule_count = 0
+
+	def add(self, outcome, schedule_file_name, example_directory):
+		self.schedule_count += 1
+		self.outcome_counts[outcome] += 1
+		if outcome not in self.example_schedules and example_directory is not None:
+			example_file_name = os.path.join(
+				example_directory, f"outcome-{len(self.example_schedules)}.jsonl"
+			)
+			shutil.copyfile(schedule_file_name, example_file_name)
+			self.example_schedules[outcome] = example_file_name
+
+# Replays schedules across a pool of GDB processes, one for each core by
+# default. Only a couple of batches of schedules per worker are handed out at a
+# time, so schedules can be generated lazily and exploring many of them does
+# not hold them all in memory. Consecutive schedules are replayed in the same
+# GDB in batches of schedules_per_replay, which pays off when they share long
+# prefixes that can be restarted from GDB checkpoints. The schedule of the
+# first replay to reach each outcome is kept in example_directory, if given, so
+# that it can be replayed again.
+class Explorer:
+	def __init__(self, program, header, worker_count=None, gdb_command="gdb",
+			timeout=DEFAULT_TIMEOUT, outcome_pattern=DEFAULT_OUTCOME_PATTERN, example_directory=None,
+			schedules_per_replay=1, fork_checkpoint_ids=()):
+		self._program = program
+		self._header = header
+		self._worker_count = worker_count or os.cpu_count() or 1
+		self._gdb_command = gdb_command
+		self._timeout = timeout
+		self._outcome_pattern = outcome_pattern
+		self._example_directory = example_directory
+		self._schedules_per_replay = schedules_per_replay
+		self._fork_checkpoint_ids = fork_checkpoint_ids
+
+	def explore(self, schedules, progress_callback=None):
+		results = ExplorationResults()
+		with tempfile.TemporaryDirectory() as working_directory:
+			worker = ReplayWorker(self._program, self._header, working_directory,
+				self._gdb_command, self._timeout, self._outcome_pattern, self._fork_checkpoint_ids)
+			with concurrent.futures.ThreadPoolExecutor(self._worker_count) as executor:
+				pending = set()
+				schedules = iter(schedules)
+				for batch_number in itertools.count():
+					batch = list(itertools.islice(schedules, self._schedules_per_replay))
+					if len(batch) == 0:
+						break
+					if len(pending) >= 2 * self._worker_count:
+						pending = self._collect(pending, results, progress_callback)
+					pending.add(executor.submit(worker, batch_number, batch))
+				while len(pending) > 0:
+					pending = self._collect(pending, results, progress_callback)
+		return results
+
+	def _collect(self, pending, results, progress_callback):
+		done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+		for future in done:
+			for schedule_file_name, outcome in future.result():
+				results.add(outcome, schedule_file_name, self._example_directory)
+				os.remove(schedule_file_name)
+			if progress_callback is not None:
+				progress_callback(results)
+		return pending
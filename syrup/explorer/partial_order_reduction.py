@@ -0,0 +1,301 @@
+#!/bin/python3
+import math
+from explorer.explorer import thread_creation_dependencies, thread_creator_ranks, renumbered_schedule, \
+		positions_by_thread, THREAD_ID_TAG
+
+CHECKPOINT_LOCATION_TAG = "location"
+SHARED_VARIABLE_TAG = "variable"
+ACCESS_TAG = "access"
+ACCESS_READ = "read"
+
+# Enumerates orders of the checkpoints of a recorded trace with dynamic
+# partial-order reduction, so that only one order is yielded for each class of
+# orders that differ only in how independent checkpoints are interleaved.
+#
+# Two checkpoints are dependent when they are hit by the same thread, when one
+# creates the thread of the other, or when both access the same shared variable
+# and they are not both plain reads, using the classification of access sites
+# recorded in the header of the trace. An access of any other or no kind is
+# taken to write the variable. Checkpoints at other locations, such as
+# the start routines and thread creation sites, only depend on their own
+# thread. Each thread is assumed to hit the same checkpoints whatever the
+# order, as it does in the counter example.
+#
+# The search is the DPOR algorithm of Flanagan and Godefroid with sleep sets,
+# run over the checkpoints of the trace rather than the program, so no GDB is
+# needed to decide which orders to replay. As the threads are fixed, the total
+# number of orders is known, and with it the number of equivalent orders that
+# were skipped.
+class ScheduleEnumerator:
+	def __init__(self, checkpoints, shared_variable_accesses):
+		self._checkpoints = checkpoints
+		self._thread_positions = positions_by_thread(checkpoints)
+		self._threads = list(self._thread_positions)
+		self._creator_positions = thread_creation_dependencies(checkpoints)
+		self._creator_ranks = thread_creator_ranks(checkpoints)
+		self._accesses = [
+			shared_variable_accesses.get(checkpoint[CHECKPOINT_LOCATION_TAG]) for checkpoint in checkpoints
+		]
+		self.emitted_count = 0
+		self.sleep_set_blocked_count = 0
+		self.is_exhausted = False
+
+	# The number of orders that keep the order of every thread and create each
+	# thread before it runs. The checkpoints form a forest, where the parent of
+	# each checkpoint is the one before it in its thread, or the checkpoint that
+	# created its thread, so this is n! divided by the size of every subtree.
+	def total_schedule_count(self):
+		subtree_sizes = [1] * len(self._checkpoints)
+		for thread, positions in reversed(self._thread_positions.items()):
+			for index in range(len(positions) - 1, -1, -1):
+				parent = positions[index - 1] if index > 0 else self._creator_positions.get(positions[0])
+				if parent is not None:
+					subtree_sizes[parent] += subtree_sizes[positions[index]]
+		count = math.factorial(len(self._checkpoints))
+		for subtree_size in subtree_sizes:
+			count //= subtree_size
+		return count
+
+	# Orders that were not yielded because an equivalent one was, which is only
+	# known once every order has been enumerated.
+	def skipped_count(self):
+		if not self.is_exhausted:
+			return None
+		return self.total_schedule_count() - self.emitted_count
+
+	def schedules(self):
+		for schedule in self._positions_of_schedules():
+			yield renumbered_schedule(self._checkpoints, self._creator_ranks, schedule)
+
+	def _positions_of_schedules(self):
+		search = _Search(self)
+		for schedule in search.complete_schedules():
+			self.emitted_count += 1
+			yield schedule
+		self.sleep_set_blocked_count = search.sleep_set_blocked_count
+		self.is_exhausted = True
+
+	def _is_dependent(self, position, other_position):
+		if self._checkpoints[position][THREAD_ID_TAG] == self._checkpoints[other_position][THREAD_ID_TAG]:
+			return True
+		if self._creator_positions.get(position) == other_position or \
+				self._creator_positions.get(other_position) == position:
+			return True
+		access = self._accesses[position]
+		other_access = self._accesses[other_position]
+		if access is None or other_access is None:
+			return False
+		return access[SHARED_VARIABLE_TAG] == other_access[SHARED_VARIABLE_TAG] and \
+			not (_is_plain_read(access) and _is_plain_read(other_access))
+
+def _is_plain_read(access):
+	return access.get(ACCESS_TAG) == ACCESS_READ
+
+# A frame of the search: the threads that still have to be tried from a state,
+# the threads that have been, and the threads put to sleep because running
+# them would only lead to orders equivalent to ones already explored.
+class _Frame:
+	def __init__(self, sleeping_threads):
+		self.backtrack_threads = set()
+		self.done_threads = set()
+		self.sleeping_threads = sleeping_threads
+
+# The search runs with an explicit stack, as traces are much longer than the
+# Python recursion limit.
+class _Search:
+	def __init__(self, enumerator):
+		self._enumerator = enumerator
+		self._thread_positions = enumerator._thread_positions
+		self._threads = enumerator._threads
+		self._creator_positions = enumerator._creator_positions
+		self._executed = []
+		self._next_indices = {thread: 0 for thread in self._threads}
+		# The vector clock of each executed checkpoint, mapping each thread to
+		# the index of its last checkpoint that happens before it.
+		self._clocks = []
+		self._clock_by_position = {}
+		self._indices_by_variable = {}
+		self.sleep_set_blocked_count = 0
+
+	def complete_schedules(self):
+		frames = [_Frame(set())]
+		if not self._start_frame(frames[0]):
+			return
+		while len(frames) > 0:
+			frame = frames[-1]
+			candidates = frame.backtrack_threads - frame.done_threads - frame.sleeping_threads
+			if len(candidates) == 0:
+				frames.pop()
+				if len(frames) > 0:
+					self._undo()
+				continue
+			thread = min(candidates)
+			position = self._next_position(thread)
+			sleeping_threads = set(
+				sleeping_thread for sleeping_thread in frame.sleeping_threads | frame.done_threads
+				if not self._enumerator._is_dependent(self._next_position(sleeping_thread), position)
+			)
+			frame.done_threads.add(thread)
+			self._execute(thread)
+			self._add_backtrack_points(frames, thread, position)
+			next_frame = _Frame(sleeping_threads)
+			if len(self._executed) == len(self._enumerator._checkpoints):
+				yield list(self._executed)
+				self._undo()
+			elif self._start_frame(next_frame):
+				frames.append(next_frame)
+			else:
+				self.sleep_set_blocked_count += 1
+				self._undo()
+
+	# Starts exploring a state from any one thread that is enabled and awake.
+	def _start_frame(self, frame):
+		for thread in self._threads:
+			if self._is_enabled(thread) and thread not in frame.sleeping_threads:
+				frame.backtrack_threads.add(thread)
+				return True
+		return False
+
+	# For the next checkpoint of each thread, finds every executed checkpoint
+	# it races with, and makes sure the alternative of running it first is
+	# explored from the state before each of them. Only the last race is not
+	# enough, as reads of a variable do not depend on each other: a write that
+	# races with two reads has to be tried before either of them. Only the
+	# threads whose next checkpoint depends on the checkpoint just executed can
+	# have a new race.
+	#
+	# Running the checkpoint first may need other threads to run before it, those
+	# whose checkpoints since the race happen before it, so they are tried from
+	# that state as well as its own thread, which may be asleep there.
+	def _add_backtrack_points(self, frames, executed_thread, executed_position):
+		for thread in self._threads:
+			position = self._next_position(thread)
+			if position is None:
+				continue
+			if thread != executed_thread and not self._enumerator._is_dependent(position, executed_position):
+				continue
+			clock = self._clock_of_next(thread)
+			for race_index in self._racing_indices(thread, position):
+				enabled_threads = [
+					preceding_thread for preceding_thread in self._preceding_threads(thread, clock, race_index)
+					if self._was_enabled_at(preceding_thread, race_index)
+				]
+				if len(enabled_threads) == 0:
+					enabled_threads = [
+						enabled_thread for enabled_thread in self._threads
+						if self._was_enabled_at(enabled_thread, race_index)
+					]
+				frames[race_index].backtrack_threads.update(enabled_threads)
+
+	# The thread itself, and the threads of the checkpoints after index that
+	# happen before its next checkpoint, whose clock is given.
+	def _preceding_threads(self, thread, clock, index):
+		preceding_threads = {thread}
+		for later_index in range(index + 1, len(self._executed)):
+			later_thread = self._enumerator._checkpoints[self._executed[later_index]][THREAD_ID_TAG]
+			if clock.get(later_thread, -1) >= self._clocks[later_index][later_thread]:
+				preceding_threads.add(later_thread)
+		return preceding_threads
+
+	# The executed checkpoints of other threads that conflict with the
+	# checkpoint and do not happen before it. Only checkpoints accessing the
+	# same shared variable can race, as the other dependencies are within a
+	# thread or between a thread and its creator, which can never run the other
+	# way around.
+	def _racing_indices(self, thread, position):
+		access = self._enumerator._accesses[position]
+		if access is None:
+			return
+		thread_clock = self._thread_clock(thread)
+		for index in self._indices_by_variable.get(access[SHARED_VARIABLE_TAG], ()):
+			executed_position = self._executed[index]
+			executed_thread = self._enumerator._checkpoints[executed_position][THREAD_ID_TAG]
+			if executed_thread == thread:
+				continue
+			if not self._enumerator._is_dependent(executed_position, position):
+				continue
+			if thread_clock.get(executed_thread, -1) >= self._clocks[index][executed_thread]:
+				continue
+			yield index
+
+	# Whether the thread was enabled in the state before the checkpoint at
+	# index, when it had run all of its checkpoints up to the ones it has run
+	# since.
+	def _was_enabled_at(self, thread, index):
+		later_count = sum(
+			1 for later_index in range(index, len(self._executed))
+			if self._enumerator._checkpoints[self._executed[later_index]][THREAD_ID_TAG] == thread
+		)
+		next_index = self._next_indices[thread] - later_count
+		if next_index == len(self._thread_positions[thread]):
+			return False
+		if next_index > 0:
+			return True
+		creator_position = self._creator_positions.get(self._thread_positions[thread][0])
+		if creator_position is None:
+			return True
+		creator_clock = self._clock_by_position.get(creator_position)
+		return creator_clock is not None and creator_clock[1] < index
+
+	def _is_enabled(self, thread):
+		position = self._next_position(thread)
+		if position is None:
+			return False
+		creator_position = self._creator_positions.get(position)
+		return creator_position is None or self._next_indices[thread] > 0 or \
+			creator_position in self._clock_by_position
+
+	def _next_position(self, thread):
+		positions = self._thread_positions[thread]
+		next_index = self._next_indices[thread]
+		return positions[next_index] if next_index < len(positions) else None
+
+	def _thread_clock(self, thread):
+		next_index = self._next_indices[thread]
+		if next_index > 0:
+			return self._clock_by_position[self._thread_positions[thread][next_index - 1]][0]
+		creator_position = self._creator_positions.get(self._thread_positions[thread][0])
+		if creator_position is not None and creator_position in self._clock_by_position:
+			return self._clock_by_position[creator_position][0]
+		return {}
+
+	# The clock of a checkpoint joins the clocks of its thread, of the
+	# checkpoint that created its thread, and of the accesses it conflicts with.
+	# Writes to a variable are ordered, so a read only has to join the last
+	# write, and a write the last write and the reads since.
+	def _clock_of_next(self, thread):
+		position = self._next_position(thread)
+		clock = dict(self._thread_clock(thread))
+		access = self._enumerator._accesses[position]
+		if access is not None:
+			for index in reversed(self._indices_by_variable.get(access[SHARED_VARIABLE_TAG], ())):
+				executed_access = self._enumerator._accesses[self._executed[index]]
+				is_write = not _is_plain_read(executed_access)
+				if is_write or not _is_plain_read(access):
+					for clock_thread, clock_index in self._clocks[index].items():
+						if clock.get(clock_thread, -1) < clock_index:
+							clock[clock_thread] = clock_index
+				if is_write:
+					break
+		clock[thread] = self._next_indices[thread]
+		return clock
+
+	def _execute(self, thread):
+		position = self._next_position(thread)
+		clock = self._clock_of_next(thread)
+		access = self._enumerator._accesses[position]
+		if access is not None:
+			self._indices_by_variable.setdefault(access[SHARED_VARIABLE_TAG], []).append(len(self._executed))
+		self._clock_by_position[position] = (clock, len(self._executed))
+		self._clocks.append(clock)
+		self._executed.append(position)
+		self._next_indices[thread] += 1
+
+	def _undo(self):
+		position = self._executed.pop()
+		self._clocks.pop()
+		del self._clock_by_position[position]
+		access = self._enumerator._accesses[position]
+		if access is not None:
+			self._indices_by_variable[access[SHARED_VARIABLE_TAG]].pop()
+		self._next_indices[self._enumerator._checkpoints[position][THREAD_ID_TAG]] -= 1
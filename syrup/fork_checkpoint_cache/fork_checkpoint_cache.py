@@ -0,0 +1,120 @@
+#!/bin/python3
+import collections
+import gdb
+import itertools
+import re
+from gdb_wrapper import gdb_wrapper
+from logger.logger import log, debug, warning
+
+DEFAULT_CAPACITY = 8
+# GDB numbers the process it started 0 once there are checkpoints of it.
+STARTED_PROCESS_CHECKPOINT_NUMBER = 0
+
+_CHECKPOINT_NUMBER_PATTERN = re.compile(r"checkpoint (\d+):")
+
+# GDB checkpoints fork the inferior, leaving a copy of it stopped where the
+# checkpoint was taken that a later replay can restart from. They are kept by
+# the ids of the checkpoints that were hit before them, so that a schedule can
+# restart from the deepest one taken at a prefix of it. Only capacity of them
+# are kept, other than the one taken at the beginning, and the one used least
+# recently is deleted first.
+#
+# A forked copy only has the thread that forked it, so checkpoints can only be
+# taken while the inferior has a single thread. Restarting from a checkpoint
+# uses up its copy, so the checkpoint is taken again straight away to keep one.
+class ForkCheckpointCache:
+	def __init__(self, capacity=DEFAULT_CAPACITY):
+		self._capacity = capacity
+		self._checkpoint_numbers = collections.OrderedDict()
+		self._beginning_checkpoint_number = None
+		self._running_checkpoint_number = None
+		self._skipped_ids = set()
+
+	def take_at_beginning(self):
+		self._beginning_checkpoint_number = self._take()
+		self._running_checkpoint_number = STARTED_PROCESS_CHECKPOINT_NUMBER
+
+	# Returns whether a checkpoint was taken.
+	def take(self, prefix):
+		if not inferior_is_single_threaded():
+			debug("Not taking a checkpoint after %d checkpoints as the inferior has several threads", len(prefix))
+			return False
+		prefix = tuple(prefix)
+		if prefix in self._checkpoint_numbers:
+			self._checkpoint_numbers.move_to_end(prefix)
+			return False
+		self._checkpoint_numbers[prefix] = self._take()
+		while len(self._checkpoint_numbers) > self._capacity:
+			_, checkpoint_number = self._checkpoint_numbers.popitem(last=False)
+			self._delete(checkpoint_number)
+		return True
+
+	# Checkpoints asked for at ids hit once the inferior has several threads
+	# cannot be taken. Each id is only warned about once, however many
+	# schedules hit it.
+	def skip(self, checkpoint_id):
+		if checkpoint_id in self._skipped_ids:
+			return
+		self._skipped_ids.add(checkpoint_id)
+		warning("Not taking a GDB checkpoint at checkpoint %s as the inferior has several threads by then",
+			checkpoint_id)
+
+	# Deletes every checkpoint other than the one running, such as before
+	# replaying something else in the same GDB.
+	def delete_all(self):
+		checkpoint_numbers = list(self._checkpoint_numbers.values())
+		if self._beginning_checkpoint_number is not None:
+			checkpoint_numbers.append(self._beginning_checkpoint_number)
+		for checkpoint_number in checkpoint_numbers:
+			if checkpoint_number != self._running_checkpoint_number:
+				self._delete(checkpoint_number)
+		self._checkpoint_numbers.clear()
+		self._beginning_checkpoint_number = None
+
+	# Restarts from the deepest checkpoint taken at a prefix of the ids, and
+	# returns the length of the prefix. Only as many ids are read as there are
+	# in the longest prefix.
+	def restart_from_deepest_prefix(self, ids):
+		ids = tuple(itertools.islice(ids, max(map(len, self._checkpoint_numbers), default=0)))
+		deepest_prefix = ()
+		for prefix in self._checkpoint_numbers:
+			if len(prefix) > len(deepest_prefix) and ids[:len(prefix)] == prefix:
+				deepest_prefix = prefix
+		if len(deepest_prefix) == 0:
+			self._beginning_checkpoint_number = self._restart(self._beginning_checkpoint_number)
+		else:
+			self._checkpoint_numbers.move_to_end(deepest_prefix)
+			self._checkpoint_numbers[deepest_prefix] = self._restart(self._checkpoint_numbers[deepest_prefix])
+		log(f"Restarted after {len(deepest_prefix)} checkpoints")
+		return len(deepest_prefix)
+
+	# The copy that was running before is deleted once it is no longer needed,
+	# unless it has already exited. Returns the number of the checkpoint taken
+	# again in place of the one that was restarted from.
+	def _restart(self, checkpoint_number):
+		gdb_wrapper.immediate_execute(f"restart {checkpoint_number}")
+		previous_checkpoint_number = self._running_checkpoint_number
+		self._running_checkpoint_number = checkpoint_number
+		if previous_checkpoint_number is not None:
+			self._delete(previous_checkpoint_number)
+		return self._take()
+
+	# GDB only reports the number of the new checkpoint when the command comes
+	# from the terminal.
+	def _take(self):
+		output = gdb.execute("checkpoint", from_tty=True, to_string=True)
+		match = _CHECKPOINT_NUMBER_PATTERN.search(output)
+		if match is None:
+			raise gdb.error(f"Could not read the number of the checkpoint taken from {output!r}")
+		checkpoint_number = int(match.group(1))
+		debug("Took checkpoint %d", checkpoint_number)
+		return checkpoint_number
+
+	def _delete(self, checkpoint_number):
+		try:
+			gdb.execute(f"delete checkpoint {checkpoint_number}", to_string=True)
+		except gdb.error as exception:
+			debug("Could not delete checkpoint %d: %s", checkpoint_number, exception)
+
+def inferior_is_single_threaded():
+	return len(gdb.selected_inferior().threads()) == 1
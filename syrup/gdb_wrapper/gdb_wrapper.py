@@ -1,24 +1,34 @@
 #!/bin/python3
 import gdb
-import inspect
-from logger.logger import log
+import contextlib
+import functools
+import sys
+from logger.logger import debug, error, is_enabled_for, DEBUG
+from metrics import metrics
+
+STACK_DEPTH_REPORTING_THRESHOLD = 10
 
 # Breakpoints
 class Breakpoint:
-	def __init__(self, breakpoint_location, thread, is_temporary, breakpoint_type, wp_class):
+	def __init__(self, breakpoint_location, thread, is_temporary, breakpoint_type,
+			wp_class, breakpoint_class):
 		self._breakpoint_location = breakpoint_location
 		self._thread = thread
 		self._is_temporary = is_temporary
 		self._breakpoint_type = breakpoint_type
 		self._wp_class = wp_class
+		self._breakpoint_class = breakpoint_class
 
 	def __call__(self):
-		log(f"Creating a new breakpoint for thread {self._thread} at {self._breakpoint_location}")
+		debug("Creating a new breakpoint for thread %s at %s", self._thread, self._breakpoint_location)
 		print_stack_depth()
 		if self._breakpoint_type is None and self._wp_class is None:
-			breakpoint = gdb.Breakpoint(self._breakpoint_location, temporary=self._is_temporary)
+			breakpoint = self._breakpoint_class(
+				self._breakpoint_location,
+				temporary=self._is_temporary
+			)
 		else:
-			breakpoint = gdb.Breakpoint(
+			breakpoint = self._breakpoint_class(
 				self._breakpoint_location,
 				self._breakpoint_type,
 				self._wp_class,
@@ -26,25 +36,111 @@ class Breakpoint:
 			)
 		if self._thread is not None:
 			breakpoint.thread = self._thread
+		return breakpoint
 
 	def __str__(self):
 		return f"Breakpoint for thread {self._thread} at {self._breakpoint_location}"
 
+# The breakpoint class may be any callable that creates a gdb.Breakpoint, such
+# as a subclass that overrides stop() to decide whether a hit needs to stop.
 def immediate_breakpoint_at(
 		location,
 		thread=None,
 		is_temporary=False,
 		breakpoint_type=None,
-		wp_class=None):
-	Breakpoint(location, thread, is_temporary, breakpoint_type, wp_class)()
+		wp_class=None,
+		breakpoint_class=gdb.Breakpoint):
+	return Breakpoint(location, thread, is_temporary, breakpoint_type, wp_class,
+			breakpoint_class)()
 
 def enqueue_breakpoint_at(
 		location,
 		thread=None,
 		is_temporary=False,
 		breakpoint_type=None,
-		wp_class=None):
-	post_event(Breakpoint(location, thread, is_temporary, breakpoint_type, wp_class))
+		wp_class=None,
+		breakpoint_class=gdb.Breakpoint):
+	post_event(Breakpoint(location, thread, is_temporary, breakpoint_type, wp_class,
+			breakpoint_class))
+
+# Breakpoint registry
+# Keeps a single breakpoint at each location however many threads need it,
+# rather than a thread-specific breakpoint for every thread at every location,
+# along with the threads that are interested in hits there. The breakpoint's
+# stop() has to check that the thread hitting it is one of them.
+#
+# Once no thread is interested in a location its breakpoint is deleted, so GDB
+# stops inserting and checking it. Breakpoints must not be deleted from inside
+# stop(), which is where interest is usually lost, so deleting them is posted to
+# the event queue, and skipped if a thread has become interested again by then.
+class BreakpointRegistry:
+	def __init__(self, breakpoint_class=gdb.Breakpoint):
+		self._breakpoint_class = breakpoint_class
+		self._breakpoints = {}
+		self._interested_threads = {}
+		self.created_count = 0
+		self.deleted_count = 0
+
+	def add_interest(self, location, thread):
+		self._interested_threads.setdefault(location, set()).add(thread)
+		if location not in self._breakpoints:
+			self._breakpoints[location] = immediate_breakpoint_at(
+				location,
+				breakpoint_class=self._breakpoint_class
+			)
+			self.created_count += 1
+
+	def remove_interest(self, location, thread):
+		interested_threads = self._interested_threads.get(location)
+		if interested_threads is None or thread not in interested_threads:
+			return
+		interested_threads.remove(thread)
+		if len(interested_threads) == 0:
+			del self._interested_threads[location]
+			post_event(BreakpointRetirement(self, location))
+
+	def is_interested(self, location, thread):
+		return thread in self._interested_threads.get(location, ())
+
+	def interested_threads(self, location):
+		return self._interested_threads.get(location, set())
+
+	def live_breakpoint_count(self):
+		return len(self._breakpoints)
+
+	def live_breakpoint_counts(self):
+		return {location: len(threads) for location, threads in self._interested_threads.items()}
+
+	def retire(self, location):
+		if location in self._interested_threads:
+			return
+		breakpoint = self._breakpoints.pop(location, None)
+		if breakpoint is None:
+			return
+		debug("Deleting the breakpoint at %s as no thread needs it", location)
+		if breakpoint.is_valid():
+			breakpoint.delete()
+		self.deleted_count += 1
+
+	def delete_all(self):
+		self._interested_threads.clear()
+		for location in list(self._breakpoints):
+			self.retire(location)
+
+	def __str__(self):
+		return f"{self.live_breakpoint_count()} live breakpoints, " \
+			f"{self.created_count} created and {self.deleted_count} deleted"
+
+class BreakpointRetirement:
+	def __init__(self, breakpoint_registry, location):
+		self._breakpoint_registry = breakpoint_registry
+		self._location = location
+
+	def __call__(self):
+		self._breakpoint_registry.retire(self._location)
+
+	def __str__(self):
+		return f"Retirement of the breakpoint at {self._location}"
 
 # Instructions
 class Instruction:
@@ -52,7 +148,7 @@ class Instruction:
 		self._instruction = instruction
 
 	def __call__(self):
-		log(f"{self._instruction}")
+		debug("%s", self._instruction)
 		print_stack_depth()
 		gdb.execute(self._instruction)
 
@@ -72,9 +168,11 @@ class Connection:
 		self._event_listener = event_listener
 
 	def __call__(self):
-		log(f"Connecting {self._event_listener} to {self._event_registry}")
+		debug("Connecting %s to %s", self._event_listener, self._event_registry)
 		print_stack_depth()
-		self._event_registry.connect(self._event_listener)
+		connected_listener = _timed_listener(self._event_registry, self._event_listener)
+		_connected_listeners[self._event_registry, self._event_listener] = connected_listener
+		self._event_registry.connect(connected_listener)
 
 	def __str__(self):
 		return f"Connection of {self._event_listener} to {self._event_registry}"
@@ -92,9 +190,11 @@ class Disconnect:
 		self._event_listener = event_listener
 
 	def __call__(self):
-		log(f"Disconnecting {self._event_listener} from {self._event_registry}")
+		debug("Disconnecting %s from %s", self._event_listener, self._event_registry)
 		print_stack_depth()
-		self._event_registry.disconnect(self._event_listener)
+		self._event_registry.disconnect(
+			_connected_listeners.pop((self._event_registry, self._event_listener), self._event_listener)
+		)
 
 	def __str__(self):
 		return f"Disconnection of {self._event_listener} from {self._event_registry}"
@@ -105,13 +205,187 @@ def immediate_disconnect(event_registry, event_listener):
 def enqueue_disconnect(event_registry, event_listener):
 	post_event(Disconnect(event_registry, event_listener))
 
+# The listeners connected so far, as connected, which may be a timed wrapper
+# around them that disconnecting them has to find again.
+_connected_listeners = {}
+
+def disconnect_all():
+	for (event_registry, _), connected_listener in list(_connected_listeners.items()):
+		event_registry.disconnect(connected_listener)
+	_connected_listeners.clear()
+
+# Metrics
+# Listeners are timed by connecting a wrapper around them when metrics are
+# enabled.
+_EVENT_REGISTRY_NAMES = ["stop", "new_thread", "thread_exited", "exited", "cont"]
+
+def _timed_listener(event_registry, event_listener):
+	if not metrics.IS_ENABLED:
+		return event_listener
+	return metrics.timed_listener(_event_registry_name(event_registry), event_listener)
+
+def _event_registry_name(event_registry):
+	for name in _EVENT_REGISTRY_NAMES:
+		if getattr(gdb.events, name, None) is event_registry:
+			return name
+	return "event"
+
+# Stops are counted by a listener kept with the others, so that disconnect_all()
+# and reset() disconnect it too, and the script that runs next connects it
+# again. It is connected as it is rather than in a timer, as it times how long
+# GDB ran for up to the stop.
+def connect_stop_counter():
+	if not metrics.IS_ENABLED or (gdb.events.stop, metrics.stop_reported) in _connected_listeners:
+		return
+	_connected_listeners[gdb.events.stop, metrics.stop_reported] = metrics.stop_reported
+	gdb.events.stop.connect(metrics.stop_reported)
+
+# Cancellation
+_cancellation_count = 0
+
+# Actions that have been posted but have not run yet are dropped once pending
+# actions are cancelled, such as the rest of a batch whose inferior exited while
+# an earlier action in it was running.
+def cancel_pending_actions():
+	global _cancellation_count
+	_cancellation_count += 1
+
+class CancellableAction:
+	def __init__(self, action):
+		self._action = action
+		self._cancellation_count = _cancellation_count
+
+	def is_cancelled(self):
+		return self._cancellation_count != _cancellation_count
+
+	def __call__(self):
+		started_at = metrics.start_timer()
+		if self.is_cancelled():
+			debug("Dropping cancelled %s", self._action)
+			metrics.action_ran(self._action, started_at)
+			return
+		try:
+			self._action()
+		finally:
+			metrics.action_ran(self._action, started_at)
+
+	def __str__(self):
+		return f"{self._action}"
+
+# Quitting
+# GDB is quit once a recording or a replay is over, unless a quit handler has
+# been set, such as by a session that runs many of them in the same GDB, which
+# is then called with the exit code instead.
+_quit_handler = None
+
+def set_quit_handler(quit_handler):
+	global _quit_handler
+	_quit_handler = quit_handler
+
+def enqueue_quit(exit_code=None):
+	if _quit_handler is not None:
+		post_event(functools.partial(_quit_handler, exit_code))
+	elif exit_code is None:
+		enqueue_execute("quit")
+	else:
+		enqueue_execute(f"quit {exit_code}")
+
+# Leaves GDB ready for another recording or replay, with nothing left of the
+# last one: no pending actions, listeners or breakpoints.
+def reset():
+	cancel_pending_actions()
+	disconnect_all()
+	immediate_execute("delete")
+
+# Batches
+class ActionBatch:
+	def __init__(self):
+		self._actions = []
+		self._cancellation_count = _cancellation_count
+		self._is_rest_dropped = False
+
+	def add(self, action):
+		self._actions.append(action)
+
+	def is_empty(self):
+		return len(self._actions) == 0
+
+	# Each action runs as if it had been posted on its own, so an action that
+	# fails does not prevent the actions after it from running.
+	def __call__(self):
+		_running_batches.append(self)
+		try:
+			self._run()
+		finally:
+			_running_batches.pop()
+
+	def drop_rest(self):
+		self._is_rest_dropped = True
+
+	def _run(self):
+		for action in self._actions:
+			if self._cancellation_count != _cancellation_count:
+				debug("Dropping the rest of a cancelled %s", self)
+				return
+			if self._is_rest_dropped:
+				debug("Dropping the rest of a %s that was overtaken by a stop", self)
+				return
+			started_at = metrics.start_timer()
+			try:
+				action()
+			except gdb.error as exception:
+				error("%s failed: %s", action, exception)
+			metrics.batched_action_ran(action, started_at)
+
+	def __str__(self):
+		return f"Batch of {len(self._actions)} actions"
+
+_open_batches = []
+_running_batches = []
+
+# An action that resumes the inferior only returns once it has stopped again,
+# after the stop listeners have run. Those listeners decide what is to be done
+# from the new stop, so the rest of a batch that is running, decided before it,
+# is out of date and is dropped, without cancelling anything posted apart.
+def drop_rest_of_running_batches():
+	for batch in _running_batches:
+		batch.drop_rest()
+
+# Actions posted inside this context are collected and posted to the event
+# queue as a single event when the context exits, running in the same order.
+@contextlib.contextmanager
+def batched_actions():
+	batch = ActionBatch()
+	_open_batches.append(batch)
+	try:
+		yield batch
+	finally:
+		_open_batches.pop()
+		if not batch.is_empty():
+			post_event(batch)
+
 # Convenience functions
 def post_event(action):
-	log(f"Posting {action} to the event queue")
+	if len(_open_batches) > 0:
+		debug("Adding %s to the current batch", action)
+		_open_batches[-1].add(action)
+		return
+	debug("Posting %s to the event queue", action)
 	print_stack_depth()
-	result = gdb.post_event(action)
+	metrics.action_posted(action)
+	gdb.post_event(CancellableAction(action))
 
 def print_stack_depth():
-	stack_depth = len(inspect.stack())
-	if stack_depth > 10:
-		log(f"stack depth: {len(inspect.stack())}")
+	if not is_enabled_for(DEBUG):
+		return
+	stack_depth = _stack_depth()
+	if stack_depth > STACK_DEPTH_REPORTING_THRESHOLD:
+		debug("stack depth: %d", stack_depth)
+
+def _stack_depth():
+	stack_depth = 0
+	frame = sys._getframe()
+	while frame is not None:
+		stack_depth += 1
+		frame = frame.f_back
+	return stack_depth
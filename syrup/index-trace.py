@@ -0,0 +1,42 @@
+#!/bin/python3
+
+# Builds the index kept next to a recorded trace, which replay uses to start
+# from the middle of the trace, and prints how the checkpoints of each thread
+# are spread over it to help choose a window to replay.
+#
+# Usage: python3 syrup/index-trace.py checkpoints.jsonl
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+import argparse
+from trace_index.trace_index import TraceIndex, index_file_name_for, DEFAULT_OFFSET_STRIDE
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Index a recorded trace for replaying windows of it")
+	parser.add_argument("trace", help="trace recorded by write-json.py")
+	parser.add_argument("--offset-stride", type=int, default=DEFAULT_OFFSET_STRIDE,
+		help="checkpoints between the offsets kept in the index")
+	parser.add_argument("--threads", action="store_true", help="print the checkpoints of each thread")
+	return parser.parse_args()
+
+def print_threads(index):
+	for thread in index.threads():
+		positions = index.thread_positions(thread)
+		print(f"\tthread {thread}: {len(positions)} checkpoints at {len(index.positions[thread])} locations, "
+			f"positions {positions[0]} to {positions[-1]}")
+
+def main():
+	arguments = parse_arguments()
+	index = TraceIndex.build(arguments.trace, arguments.offset_stride)
+	index_file_name = index_file_name_for(arguments.trace)
+	index.save(index_file_name)
+	offset_count = 0 if index.offsets is None else len(index.offsets)
+	print(f"Indexed {index.checkpoint_count} checkpoints of {len(index.threads())} threads "
+		f"with {offset_count} offsets in {index_file_name}")
+	if arguments.threads:
+		print_threads(index)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,108 @@
+#!/bin/python3
+import gdb
+import os
+import re
+from logger.logger import debug, warning
+
+_SYMBOLIC_LOCATION_PATTERN = re.compile(r"^\*(?P<module>.+?)\+(?P<offset>0x[0-9a-f]+)$")
+_ABSOLUTE_LOCATION_PATTERN = re.compile(r"^\*?(0x[0-9a-f]+)$")
+_HEXADECIMAL_PATTERN = re.compile(r"^0x[0-9a-f]+$")
+
+# Locations are stored as an offset into the module that contains them, such as
+# "*libc.so.6+0x9ca5c", so that traces still replay when the program or its
+# libraries are loaded at different addresses. Modules are named by the base
+# name of their file. Locations that are not inside any module, and locations
+# from traces recorded before this, are left as absolute addresses.
+#
+# Each location is only resolved once per run of the inferior, so a resolver
+# should be created for each run.
+class LocationResolver:
+	def __init__(self):
+		self._modules = None
+		self._symbolic_locations = {}
+		self._live_locations = {}
+
+	def symbolic_location(self, address):
+		if address not in self._symbolic_locations:
+			self._symbolic_locations[address] = self._symbolize(address)
+		return self._symbolic_locations[address]
+
+	def live_location(self, location):
+		if location not in self._live_locations:
+			self._live_locations[location] = self._resolve(location)
+			debug("Resolved %s to %s", location, self._live_locations[location])
+		return self._live_locations[location]
+
+	def _symbolize(self, address):
+		module = self._module_containing(address)
+		if module is None:
+			return f"*{hex(address)}"
+		name, base, _ = module
+		return f"*{name}+{hex(address - base)}"
+
+	def _resolve(self, location):
+		match = _SYMBOLIC_LOCATION_PATTERN.match(location)
+		if match is None:
+			absolute_match = _ABSOLUTE_LOCATION_PATTERN.match(location)
+			return location if absolute_match is None else f"*{absolute_match.group(1)}"
+		module = self._module_named(match.group("module"))
+		if module is None:
+			raise gdb.GdbError(f"Module {match.group('module')} of {location} is not loaded")
+		_, base, _ = module
+		return f"*{hex(base + int(match.group('offset'), 16))}"
+
+	# Libraries may be loaded after the mappings were last read, so they are
+	# read again before giving up on finding a module.
+	def _module_containing(self, address):
+		for refresh in (False, True):
+			for module in self._loaded_modules(refresh):
+				_, start, end = module
+				if start <= address < end:
+					return module
+		warning("No module contains %s, storing it as an absolute address", hex(address))
+		return None
+
+	def _module_named(self, name):
+		for refresh in (False, True):
+			for module in self._loaded_modules(refresh):
+				if module[0] == name:
+					return module
+		return None
+
+	def _loaded_modules(self, refresh):
+		if self._modules is None or refresh:
+			self._modules = loaded_modules()
+		return self._modules
+
+# Splits a location into the module it is in and its offset into the module,
+# or None and its address for an absolute location.
+def split_location(location):
+	match = _SYMBOLIC_LOCATION_PATTERN.match(location)
+	if match is not None:
+		return match.group("module"), int(match.group("offset"), 16)
+	absolute_match = _ABSOLUTE_LOCATION_PATTERN.match(location)
+	if absolute_match is not None:
+		return None, int(absolute_match.group(1), 16)
+	return None, None
+
+# Returns the name, base address and end address of each file that is mapped
+# into the inferior. The base address is where the start of the file is mapped.
+def loaded_modules():
+	mappings = gdb.execute("info proc mappings", to_string=True)
+	bases = {}
+	ends = {}
+	for line in mappings.splitlines():
+		fields = line.split()
+		if len(fields) < 5 or not all(map(_HEXADECIMAL_PATTERN.match, fields[:4])):
+			continue
+		file_name = fields[-1]
+		if not file_name.startswith("/"):
+			continue
+		start, end, _, offset = map(lambda field: int(field, 16), fields[:4])
+		if offset == 0 and (file_name not in bases or start < bases[file_name]):
+			bases[file_name] = start
+		ends[file_name] = max(end, ends.get(file_name, end))
+	return [
+		(os.path.basename(file_name), base, ends[file_name])
+		for file_name, base in bases.items()
+	]
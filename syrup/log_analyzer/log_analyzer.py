@@ -0,0 +1,345 @@
+#!/bin/python3
+import ast
+import collections
+import re
+
+PHASE_SETUP = "setup"
+PHASE_FIRST_PASS = "first pass"
+PHASE_SECOND_PASS = "second pass"
+PHASE_SINGLE_PASS = "single pass"
+PHASE_REPLAY = "replay"
+DEFAULT_MISMATCH_LIMIT = 10
+
+# The syrup lines that start each phase of a recording or a replay.
+_PHASE_MARKERS = [
+	("First pass of program", PHASE_FIRST_PASS),
+	("Single pass of program", PHASE_SINGLE_PASS),
+	("run_sut_second_pass", PHASE_SECOND_PASS),
+	("set scheduler-locking on", PHASE_REPLAY)
+]
+_SYRUP_PREFIX = "syrup: "
+_PROMPT = "(gdb) "
+_TERMINAL_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+_TIMESTAMP = re.compile(r"\[(\d+\.\d+)\] ")
+_STOP = re.compile(
+	r'(?:Thread (?P<thread>\d+) "[^"]*" hit )?'
+	r"(?P<kind>Temporary breakpoint|Breakpoint|Catchpoint|"
+	r"(?(thread)Hardware (?:read |access \(read/write\) )?watchpoint|(?!)))"
+	r" (?P<number>\d+)(?: \((?:call to|returned from) [^)]*\))?[,:]"
+)
+_BREAKPOINT_CREATION = re.compile(r"(?:Temporary breakpoint|Breakpoint) (\d+) at (0x[0-9a-f]+)")
+_RECORDED_CHECKPOINT = re.compile(
+	r"(?:Appending|Writing) hit checkpoint \d+ at (\S+) by thread (\d+)"
+)
+_REPLAYED_CHECKPOINT = re.compile(r"Marked (\{.*\}) as hit")
+_SYMBOLIC_LOCATION = re.compile(r"^\*?(?P<module>.+?)\+(?P<offset>0x[0-9a-f]+)$")
+_ACTION_PLACEHOLDERS = [
+	(re.compile(r"<[^<>]* object at 0x[0-9a-f]+>"), "<object>"),
+	(re.compile(r"\{[^{}]*\}"), "{...}"),
+	(re.compile(r"\*?[\w.+-]+\+0x[0-9a-f]+"), "<location>"),
+	(re.compile(r"\*?0x[0-9a-f]+"), "<address>"),
+	(re.compile(r"\b\d+\b"), "<n>")
+]
+
+# Counts of values falling into buckets whose bounds double, so that a
+# histogram of any number of latencies takes the same space.
+class Histogram:
+	def __init__(self, smallest_bound=1e-6, bucket_count=32):
+		self._bounds = [smallest_bound * 2 ** bucket for bucket in range(bucket_count)]
+		self._counts = [0] * (bucket_count + 1)
+		self.count = 0
+		self.total = 0.0
+		self.smallest = None
+		self.largest = None
+
+	def add(self, value):
+		bucket = 0
+		while bucket < len(self._bounds) and value >= self._bounds[bucket]:
+			bucket += 1
+		self._counts[bucket] += 1
+		self.count += 1
+		self.total += value
+		self.smallest = value if self.smallest is None else min(self.smallest, value)
+		self.largest = value if self.largest is None else max(self.largest, value)
+
+	def mean(self):
+		return self.total / self.count if self.count > 0 else 0.0
+
+	# The upper bound of the bucket holding the given fraction of values.
+	def quantile(self, fraction):
+		threshold = fraction * self.count
+		seen = 0
+		for bucket, count in enumerate(self._counts):
+			seen += count
+			if count > 0 and seen >= threshold:
+				return self._bounds[bucket] if bucket < len(self._bounds) else self.largest
+		return 0.0
+
+	# Pairs of the upper bound of each bucket and its count, skipping the empty
+	# buckets at either end.
+	def buckets(self):
+		filled = [bucket for bucket, count in enumerate(self._counts) if count > 0]
+		if len(filled) == 0:
+			return []
+		return [
+			(self._bounds[bucket] if bucket < len(self._bounds) else float("inf"), self._counts[bucket])
+			for bucket in range(filled[0], filled[-1] + 1)
+		]
+
+class PhaseStatistics:
+	def __init__(self, name):
+		self.name = name
+		self.line_count = 0
+		self.stops_by_kind = collections.Counter()
+		self.stops_by_location = collections.Counter()
+		self.checkpoint_count = 0
+		self.thread_switch_count = 0
+		self.new_thread_count = 0
+		self.exited_thread_count = 0
+		self.actions = collections.Counter()
+		self.actions_per_stop = collections.Counter()
+		self.actions_per_checkpoint = collections.Counter()
+
+	def stop_count(self):
+		return sum(self.stops_by_kind.values())
+
+# Reads a log of a GDB session running syrup one line at a time, keeping only
+# counts, so logs of any length are analysed in the same amount of memory.
+# Hits are told apart from the syrup lines that handle them, and when syrup was
+# logging with timestamps the time spent handling each stop, the time the
+# inferior ran for before the next one and the time between checkpoints are
+# kept as histograms.
+#
+# The checkpoints recorded or replayed are passed on to checkpoint_callback as
+# (thread, location) pairs in the order they appear in the log. They are found
+# from lines syrup only logs at debug level, so a log written at a higher level
+# has stops but no checkpoints.
+class LogAnalyzer:
+	def __init__(self, checkpoint_callback=None):
+		self._checkpoint_callback = checkpoint_callback
+		self._breakpoint_locations = {}
+		self.phases = collections.OrderedDict()
+		self._phase = self._enter_phase(PHASE_SETUP)
+		self.stop_handling_latency = Histogram()
+		self.resume_latency = Histogram()
+		self.checkpoint_interval = Histogram()
+		self._actions_since_stop = None
+		self._actions_since_checkpoint = None
+		self._first_action_time = None
+		self._last_action_time = None
+		self._last_checkpoint_time = None
+		self._is_waiting_for_first_action = False
+
+	def analyse_file(self, log_file_name):
+		with open(log_file_name, errors="replace") as log_file:
+			for line in log_file:
+				self.analyse_line(line)
+		self.finish()
+		return self
+
+	def analyse_line(self, line):
+		line = _TERMINAL_ESCAPE.sub("", line.rstrip("\n"))
+		while line.startswith(_PROMPT):
+			line = line[len(_PROMPT):]
+		self._phase.line_count += 1
+		if line.startswith(_SYRUP_PREFIX):
+			self._analyse_syrup_line(line[len(_SYRUP_PREFIX):])
+		elif line.startswith("[Switching to Thread"):
+			self._phase.thread_switch_count += 1
+		elif line.startswith("[New Thread"):
+			self._phase.new_thread_count += 1
+		elif line.startswith("[Thread ") and line.endswith(" exited]"):
+			self._phase.exited_thread_count += 1
+		else:
+			self._analyse_gdb_line(line)
+
+	def checkpoint_count(self):
+		return sum(phase.checkpoint_count for phase in self.phases.values())
+
+	def stop_count(self):
+		return sum(phase.stop_count() for phase in self.phases.values())
+
+	# Counts the actions taken after the last stop of the log.
+	def finish(self):
+		self._end_stop()
+		if self._actions_since_checkpoint is not None:
+			self._phase.actions_per_checkpoint[self._actions_since_checkpoint] += 1
+			self._actions_since_checkpoint = None
+
+	def _analyse_gdb_line(self, line):
+		creation = _BREAKPOINT_CREATION.match(line)
+		if creation is not None:
+			self._breakpoint_locations[int(creation.group(1))] = creation.group(2)
+			return
+		stop = _STOP.match(line)
+		if stop is None:
+			return
+		self._end_stop()
+		kind = stop.group("kind")
+		self._phase.stops_by_kind[kind] += 1
+		if kind != "Catchpoint":
+			self._phase.stops_by_location[
+				self._breakpoint_locations.get(int(stop.group("number")), f"{kind} {stop.group('number')}")
+			] += 1
+		self._actions_since_stop = 0
+		self._is_waiting_for_first_action = True
+
+	def _analyse_syrup_line(self, text):
+		timestamp = None
+		timestamp_match = _TIMESTAMP.match(text)
+		if timestamp_match is not None:
+			timestamp = float(timestamp_match.group(1))
+			text = text[timestamp_match.end():]
+		for marker, phase in _PHASE_MARKERS:
+			if text.startswith(marker):
+				self.finish()
+				self._phase = self._enter_phase(phase)
+		self._phase.actions[action_template(text)] += 1
+		if self._actions_since_stop is not None:
+			self._actions_since_stop += 1
+		if self._actions_since_checkpoint is not None:
+			self._actions_since_checkpoint += 1
+		if timestamp is not None:
+			self._time_action(timestamp)
+		self._analyse_checkpoint(text, timestamp)
+
+	def _time_action(self, timestamp):
+		if self._is_waiting_for_first_action:
+			if self._last_action_time is not None:
+				self.resume_latency.add(timestamp - self._last_action_time)
+			self._first_action_time = timestamp
+			self._is_waiting_for_first_action = False
+		self._last_action_time = timestamp
+
+	def _analyse_checkpoint(self, text, timestamp):
+		recorded = _RECORDED_CHECKPOINT.match(text)
+		if recorded is not None:
+			checkpoint = (int(recorded.group(2)), recorded.group(1))
+		else:
+			replayed = _REPLAYED_CHECKPOINT.match(text)
+			if replayed is None:
+				return
+			replayed_checkpoint = ast.literal_eval(replayed.group(1))
+			checkpoint = (replayed_checkpoint["thread"], replayed_checkpoint["location"])
+		if self._actions_since_checkpoint is not None:
+			self._phase.actions_per_checkpoint[self._actions_since_checkpoint - 1] += 1
+		self._actions_since_checkpoint = 1
+		self._phase.checkpoint_count += 1
+		if timestamp is not None:
+			if self._last_checkpoint_time is not None:
+				self.checkpoint_interval.add(timestamp - self._last_checkpoint_time)
+			self._last_checkpoint_time = timestamp
+		if self._checkpoint_callback is not None:
+			self._checkpoint_callback(*checkpoint)
+
+	def _end_stop(self):
+		if self._actions_since_stop is None:
+			return
+		self._phase.actions_per_stop[self._actions_since_stop] += 1
+		if not self._is_waiting_for_first_action and self._first_action_time is not None:
+			self.stop_handling_latency.add(self._last_action_time - self._first_action_time)
+		self._actions_since_stop = None
+		self._first_action_time = None
+
+	def _enter_phase(self, name):
+		if name not in self.phases:
+			self.phases[name] = PhaseStatistics(name)
+		return self.phases[name]
+
+# Replaces the parts of a syrup line that change from one checkpoint to the
+# next, so that lines taking the same action are counted together.
+def action_template(text):
+	for pattern, placeholder in _ACTION_PLACEHOLDERS:
+		text = pattern.sub(placeholder, text)
+	return text
+
+# Checkpoints from the simulated files, which hold the pretty printed list of
+# checkpoints with one checkpoint on each line followed by the final value of
+# the counter, are read a line at a time. Anything else is read as a trace.
+def iter_expected_checkpoints(expected_file_name):
+	with open(expected_file_name, errors="replace") as expected_file:
+		is_simulated = expected_file.read(2) == "[{"
+	if not is_simulated:
+		from replay_reader.checkpoint_parser import checkpoint_parser
+		for checkpoint in checkpoint_parser(expected_file_name).iter_checkpoints():
+			yield checkpoint["thread"], checkpoint["location"]
+		return
+	with open(expected_file_name) as expected_file:
+		for line in expected_file:
+			line = line.strip().lstrip("[").rstrip(",").rstrip("]")
+			if line.startswith("{"):
+				checkpoint = ast.literal_eval(line)
+				yield checkpoint["thread"], checkpoint["location"]
+
+class Mismatch:
+	def __init__(self, position, actual, expected):
+		self.position = position
+		self.actual = actual
+		self.expected = expected
+
+	def __str__(self):
+		return f"checkpoint {self.position}: actual {_describe(self.actual)}, " \
+			f"expected {_describe(self.expected)}"
+
+# Compares the checkpoints of the log with the expected checkpoints position by
+# position, taking the next expected checkpoint as each one is found in the log
+# and keeping only the first few mismatches. Locations stored as an offset into
+# a module are compared as absolute addresses when the base of the module is
+# given, so that recordings can be compared with the older simulated files.
+class OrderDiff:
+	def __init__(self, expected_checkpoints, mismatch_limit=DEFAULT_MISMATCH_LIMIT, module_bases=None):
+		self._expected_checkpoints = iter(expected_checkpoints)
+		self._module_bases = module_bases or {}
+		self._mismatch_limit = mismatch_limit
+		self.actual_count = 0
+		self.expected_count = 0
+		self.mismatch_count = 0
+		self.mismatches = []
+
+	def __call__(self, thread, location):
+		self.actual_count += 1
+		self._compare((thread, location), next(self._expected_checkpoints, None))
+
+	# Counts the expected checkpoints that were never reached in the log.
+	def finish(self):
+		for expected in self._expected_checkpoints:
+			self._compare(None, expected)
+		return self
+
+	def first_divergence(self):
+		return self.mismatches[0] if len(self.mismatches) > 0 else None
+
+	def _compare(self, actual, expected):
+		position = max(self.actual_count, self.expected_count + 1) - 1
+		if expected is not None:
+			self.expected_count += 1
+		if self._normalised(actual) == self._normalised(expected):
+			return
+		self.mismatch_count += 1
+		if len(self.mismatches) < self._mismatch_limit:
+			self.mismatches.append(Mismatch(position, actual, expected))
+
+	def _normalised(self, checkpoint):
+		if checkpoint is None:
+			return None
+		thread, location = checkpoint
+		return thread, normalised_location(location, self._module_bases)
+
+# Recorded locations are written with or without the leading "*" depending on
+# the version of syrup that wrote them, and as an offset into a module or as an
+# absolute address. Offsets into the modules whose bases are given are turned
+# into absolute addresses.
+def normalised_location(location, module_bases):
+	symbolic_location = _SYMBOLIC_LOCATION.match(location)
+	if symbolic_location is not None and symbolic_location.group("module") in module_bases:
+		return hex(
+			module_bases[symbolic_location.group("module")]
+			+ int(symbolic_location.group("offset"), 16)
+		)
+	return location.lstrip("*")
+
+def _describe(checkpoint):
+	if checkpoint is None:
+		return "nothing"
+	thread, location = checkpoint
+	return f"thread {thread} at {location}"
@@ -1,4 +1,119 @@
 #!/bin/python3
+import atexit
+import collections
+import os
+import sys
+import time
 
-def log(text):
-	print(f"syrup: {text}")
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LOG_LEVEL_ENVIRONMENT_VARIABLE = "SYRUP_LOG_LEVEL"
+LOG_TIMESTAMPS_ENVIRONMENT_VARIABLE = "SYRUP_LOG_TIMESTAMPS"
+LOG_PREFIX = "syrup: "
+DEFAULT_BATCH_SIZE = 1024
+
+_LEVEL_NAMES = {
+	"DEBUG": DEBUG,
+	"INFO": INFO,
+	"WARNING": WARNING,
+	"ERROR": ERROR
+}
+
+# Sinks
+class PrintSink:
+	def write(self, line):
+		print(line)
+
+	def flush(self):
+		sys.stdout.flush()
+
+# Keeps only the most recent lines in memory, and prints them when flushed.
+class RingBufferSink:
+	def __init__(self, capacity):
+		self._lines = collections.deque(maxlen=capacity)
+
+	def write(self, line):
+		self._lines.append(line)
+
+	def flush(self):
+		while len(self._lines) > 0:
+			print(self._lines.popleft())
+		sys.stdout.flush()
+
+# Writes lines to a file in batches rather than one at a time.
+class BatchedFileSink:
+	def __init__(self, log_file_name, batch_size=DEFAULT_BATCH_SIZE):
+		self._log_file = open(log_file_name, "w+")
+		self._batch_size = batch_size
+		self._lines = []
+
+	def write(self, line):
+		self._lines.append(line)
+		if len(self._lines) >= self._batch_size:
+			self.flush()
+
+	def flush(self):
+		if len(self._lines) > 0:
+			self._log_file.write("\n".join(self._lines) + "\n")
+			self._lines = []
+		self._log_file.flush()
+
+_level = _LEVEL_NAMES.get(os.environ.get(LOG_LEVEL_ENVIRONMENT_VARIABLE, "").upper(), INFO)
+_sink = PrintSink()
+_timestamps = os.environ.get(LOG_TIMESTAMPS_ENVIRONMENT_VARIABLE, "") not in ("", "0")
+
+# Configuration
+def set_level(level):
+	global _level
+	_level = level
+
+def is_enabled_for(level):
+	return level >= _level
+
+# Timestamps are seconds from a monotonic clock, written between the prefix and
+# the text, so that the time between lines can be measured from the log.
+def use_timestamps(enabled=True):
+	global _timestamps
+	_timestamps = enabled
+
+def use_sink(sink):
+	global _sink
+	flush()
+	_sink = sink
+
+def use_ring_buffer(capacity):
+	use_sink(RingBufferSink(capacity))
+
+def use_batched_file(log_file_name, batch_size=DEFAULT_BATCH_SIZE):
+	use_sink(BatchedFileSink(log_file_name, batch_size))
+
+def flush():
+	_sink.flush()
+
+# Logging. Any arguments are only formatted into the text, printf style, when
+# the message is going to be written, so disabled messages are cheap.
+def log(text, *arguments, level=INFO):
+	if level < _level:
+		return
+	if len(arguments) > 0:
+		text = text % arguments
+	if _timestamps:
+		_sink.write(f"{LOG_PREFIX}[{time.monotonic():.6f}] {text}")
+	else:
+		_sink.write(f"{LOG_PREFIX}{text}")
+	if level >= ERROR:
+		flush()
+
+def debug(text, *arguments):
+	if DEBUG >= _level:
+		log(text, *arguments, level=DEBUG)
+
+def warning(text, *arguments):
+	log(text, *arguments, level=WARNING)
+
+def error(text, *arguments):
+	log(text, *arguments, level=ERROR)
+
+atexit.register(flush)
@@ -0,0 +1,245 @@
+#!/bin/python3
+import atexit
+import functools
+import json
+import os
+import random
+import time
+
+METRICS_ENVIRONMENT_VARIABLE = "SYRUP_METRICS"
+METRICS_FILE_ENVIRONMENT_VARIABLE = "SYRUP_METRICS_FILE"
+# Latencies kept per timer to work out percentiles from. Timers that see more
+# keep a uniform sample of them.
+SAMPLE_CAPACITY = 100000
+NANOSECONDS_PER_SECOND = 1e9
+STOPS_COUNTER = "gdb.stops"
+CHECKPOINTS_COUNTER = "checkpoints"
+POSTED_EVENTS_COUNTER = "gdb.post_event"
+BETWEEN_STOPS_TIMER = "gdb.between_stops"
+BREAKPOINT_TIMER_PREFIX = "breakpoint."
+
+# Counts and times things when metrics are enabled, and does as little as a
+# flag check when they are not. Listeners are only wrapped in a timer when they
+# are enabled, so that they cost nothing otherwise.
+IS_ENABLED = os.environ.get(METRICS_ENVIRONMENT_VARIABLE, "") not in ("", "0")
+METRICS_FILE = os.environ.get(METRICS_FILE_ENVIRONMENT_VARIABLE, "")
+
+# Timers
+# Durations are kept in nanoseconds from a monotonic clock.
+class Timer:
+	def __init__(self):
+		self.count = 0
+		self.total = 0
+		self.maximum = 0
+		self._samples = []
+
+	def add(self, duration):
+		self.count += 1
+		self.total += duration
+		if duration > self.maximum:
+			self.maximum = duration
+		if len(self._samples) < SAMPLE_CAPACITY:
+			self._samples.append(duration)
+		else:
+			position = random.randrange(self.count)
+			if position < SAMPLE_CAPACITY:
+				self._samples[position] = duration
+
+	def percentile(self, fraction):
+		if len(self._samples) == 0:
+			return 0
+		samples = sorted(self._samples)
+		return samples[min(int(fraction * len(samples)), len(samples) - 1)]
+
+	def as_dictionary(self):
+		return {
+			"count": self.count,
+			"total_seconds": round(self.total / NANOSECONDS_PER_SECOND, 6),
+			"mean_microseconds": round(self.total / max(self.count, 1) / 1e3, 3),
+			"p50_microseconds": round(self.percentile(0.5) / 1e3, 3),
+			"p99_microseconds": round(self.percentile(0.99) / 1e3, 3),
+			"max_microseconds": round(self.maximum / 1e3, 3)
+		}
+
+# The number of posted actions that have not run yet, sampled each time one is
+# posted.
+class QueueDepth:
+	def __init__(self):
+		self.depth = 0
+		self.maximum = 0
+		self._total = 0
+		self._sample_count = 0
+
+	def posted(self):
+		self.depth += 1
+		self.maximum = max(self.maximum, self.depth)
+		self._total += self.depth
+		self._sample_count += 1
+
+	def ran(self):
+		self.depth = max(self.depth - 1, 0)
+
+	def as_dictionary(self):
+		return {
+			"mean": round(self._total / max(self._sample_count, 1), 3),
+			"max": self.maximum,
+			"left_at_exit": self.depth
+		}
+
+_started_at = time.perf_counter_ns()
+_counters = {}
+_timers = {}
+_queue_depth = QueueDepth()
+# When Python last finished handling something for GDB, so that the time GDB
+# spends on its own up to the next stop can be told apart.
+_last_handled_at = None
+_summary_file_name = None
+
+# Configuration
+# Listeners connected before metrics are enabled are not timed, as they are
+# only wrapped in a timer as they are connected. Stops are only counted once
+# gdb_wrapper.connect_stop_counter() is called after metrics are enabled.
+def enable(metrics_file_name=None):
+	global IS_ENABLED, METRICS_FILE
+	IS_ENABLED = True
+	if metrics_file_name is not None:
+		METRICS_FILE = metrics_file_name
+
+def reset():
+	global _started_at, _queue_depth, _last_handled_at
+	_started_at = time.perf_counter_ns()
+	_counters.clear()
+	_timers.clear()
+	_queue_depth = QueueDepth()
+	_last_handled_at = None
+
+# Counting and timing
+def count(name, amount=1):
+	if IS_ENABLED:
+		_counters[name] = _counters.get(name, 0) + amount
+
+# Returns None when metrics are disabled, which stop_timer ignores, so that
+# timing a hot path costs a flag check.
+def start_timer():
+	if IS_ENABLED:
+		return time.perf_counter_ns()
+	return None
+
+def stop_timer(name, started_at):
+	global _last_handled_at
+	if started_at is None:
+		return
+	now = time.perf_counter_ns()
+	timer(name).add(now - started_at)
+	_last_handled_at = now
+
+def timer(name):
+	existing_timer = _timers.get(name)
+	if existing_timer is None:
+		existing_timer = _timers[name] = Timer()
+	return existing_timer
+
+def action_posted(action):
+	if IS_ENABLED:
+		_counters[POSTED_EVENTS_COUNTER] = _counters.get(POSTED_EVENTS_COUNTER, 0) + 1
+		_queue_depth.posted()
+
+def action_ran(action, started_at):
+	if started_at is None:
+		return
+	_queue_depth.ran()
+	stop_timer(f"action.{action_name(action)}", started_at)
+
+# Actions in a batch run inside the batch's own event, so their time is also
+# part of the batch's.
+def batched_action_ran(action, started_at):
+	if started_at is None:
+		return
+	stop_timer(f"batched_action.{action_name(action)}", started_at)
+
+# Stops are counted as they are reported, along with the time since Python
+# last handled anything, such as a listener, an action or a breakpoint's stop(),
+# which is the time GDB and the inferior ran for on their own before the stop.
+def stop_reported(_):
+	if not IS_ENABLED:
+		return
+	_counters[STOPS_COUNTER] = _counters.get(STOPS_COUNTER, 0) + 1
+	if _last_handled_at is not None:
+		timer(BETWEEN_STOPS_TIMER).add(time.perf_counter_ns() - _last_handled_at)
+
+# Instructions are told apart by their command, and other actions by what
+# they call.
+def action_name(action):
+	if isinstance(action, functools.partial):
+		return action_name(action.func)
+	instruction = getattr(action, "_instruction", None)
+	if isinstance(instruction, str):
+		return f"{type(action).__name__}({instruction.split(' ', 1)[0]})"
+	if hasattr(action, "__qualname__"):
+		return action.__qualname__
+	return type(action).__name__
+
+# Listeners
+class TimedListener:
+	def __init__(self, name, listener):
+		self._name = f"listener.{name}.{action_name(listener)}"
+		self._listener = listener
+
+	def __call__(self, event):
+		started_at = time.perf_counter_ns()
+		try:
+			self._listener(event)
+		finally:
+			stop_timer(self._name, started_at)
+
+	def __str__(self):
+		return f"{self._listener}"
+
+def timed_listener(name, listener):
+	if not IS_ENABLED:
+		return listener
+	return TimedListener(name, listener)
+
+# Summary
+def summary():
+	seconds = (time.perf_counter_ns() - _started_at) / NANOSECONDS_PER_SECOND
+	stops = _counters.get(STOPS_COUNTER, 0)
+	checkpoints = _counters.get(CHECKPOINTS_COUNTER, 0)
+	return {
+		"seconds": round(seconds, 6),
+		"stops": stops,
+		"stops_per_second": round(stops / seconds, 3) if seconds > 0 else 0,
+		"checkpoints": checkpoints,
+		"checkpoints_per_second": round(checkpoints / seconds, 3) if seconds > 0 else 0,
+		"post_events_per_checkpoint":
+			round(_counters.get(POSTED_EVENTS_COUNTER, 0) / checkpoints, 3) if checkpoints > 0 else None,
+		"queue_depth": _queue_depth.as_dictionary(),
+		"counters": dict(sorted(_counters.items())),
+		"timers": {name: _timers[name].as_dictionary() for name in sorted(_timers)}
+	}
+
+def write_summary(metrics_file_name):
+	with open(metrics_file_name, "w+") as metrics_file:
+		json.dump(summary(), metrics_file, indent=2)
+
+# The summary is written next to the trace, such as checkpoints.record-metrics.json
+# for checkpoints.jsonl, unless SYRUP_METRICS_FILE names a file for it.
+def metrics_file_name_for(trace_file_name, kind):
+	if METRICS_FILE != "":
+		return METRICS_FILE
+	return f"{os.path.splitext(trace_file_name)[0]}.{kind}-metrics.json"
+
+def write_summary_at_exit(trace_file_name, kind):
+	global _summary_file_name
+	if IS_ENABLED:
+		_summary_file_name = metrics_file_name_for(trace_file_name, kind)
+
+# Writes the summary that would be written at exit straight away, such as when
+# a recording or replay finishes in a GDB that carries on running others.
+def write_pending_summary():
+	global _summary_file_name
+	if _summary_file_name is not None:
+		write_summary(_summary_file_name)
+		_summary_file_name = None
+
+atexit.register(write_pending_summary)
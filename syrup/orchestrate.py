@@ -0,0 +1,87 @@
+#!/bin/python3
+
+# Runs a queue of record and replay jobs across many GDBs at once, talking to
+# each over GDB/MI, and reports the outcome of each job as it finishes. Jobs are
+# read from a JSON Lines file, one job per line, such as:
+#
+#	{"kind": "record", "program": "a.out", "trace": "a.jsonl", "target": "target.json"}
+#	{"kind": "replay", "program": "a.out", "trace": "a.jsonl", "arguments": ["4"]}
+#
+# with "environment" holding any other SYRUP_ settings for the job.
+#
+# Usage: python3 syrup/orchestrate.py jobs.jsonl --concurrency 200 --json results.json
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+import argparse
+import collections
+import json
+from orchestrator.gdb_mi import RECORD_EXEC_ASYNC
+from orchestrator.orchestrator import Orchestrator, Job, DEFAULT_CONCURRENCY
+from explorer.explorer import DEFAULT_OUTCOME_PATTERN, DEFAULT_TIMEOUT
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Run record and replay jobs across many GDBs over GDB/MI")
+	parser.add_argument("jobs", help="JSON Lines file of jobs")
+	parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="GDBs to run at once")
+	parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds allowed for each job")
+	parser.add_argument("--gdb", default="gdb", help="GDB executable to run")
+	parser.add_argument("--outcome-pattern", default=DEFAULT_OUTCOME_PATTERN,
+		help="regular expression whose first group is the value reported for each job")
+	parser.add_argument("--stops", action="store_true", help="print the stop records of each GDB as they come")
+	parser.add_argument("--json", help="also write the results to this file")
+	return parser.parse_args()
+
+# Jobs are read lazily, so that the queue can be fed from a long file.
+def read_jobs(jobs_file_name):
+	with open(jobs_file_name) as jobs_file:
+		for line in jobs_file:
+			if line.strip():
+				yield Job(**json.loads(line))
+
+def print_stop(job, record):
+	if record.kind == RECORD_EXEC_ASYNC:
+		print(f"{job.kind} {job.trace}: *{record.record_class} {json.dumps(record.results)}", flush=True)
+
+def print_result(result):
+	outcome = result.outcome
+	print(f"{result.job.kind} {result.job.trace}: {outcome.status}, exit code {outcome.exit_code}, "
+		f"value {outcome.value}, {result.stop_count} stops in {result.seconds:.2f}s", flush=True)
+
+def print_summary(results):
+	outcome_counts = collections.Counter((result.job.kind, result.outcome.status) for result in results)
+	print(f"{len(results)} jobs run")
+	for (kind, status), count in sorted(outcome_counts.items()):
+		print(f"\t{count:>8} {kind} {status}")
+
+def write_results(results, json_file_name):
+	with open(json_file_name, "w+") as json_file:
+		json.dump([
+			{
+				"job": result.job._asdict(),
+				**result.outcome._asdict(),
+				"stops": result.stop_count,
+				"seconds": round(result.seconds, 4)
+			}
+			for result in results
+		], json_file, indent=2)
+
+def main():
+	arguments = parse_arguments()
+	orchestrator = Orchestrator(
+		arguments.concurrency,
+		arguments.gdb,
+		arguments.timeout,
+		arguments.outcome_pattern,
+		record_callback=print_stop if arguments.stops else None,
+		result_callback=print_result
+	)
+	results = orchestrator.run_all(read_jobs(arguments.jobs))
+	print_summary(results)
+	if arguments.json is not None:
+		write_results(results, arguments.json)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,149 @@
+#!/bin/python3
+import collections
+import re
+
+RECORD_RESULT = "^"
+RECORD_EXEC_ASYNC = "*"
+RECORD_STATUS_ASYNC = "+"
+RECORD_NOTIFY_ASYNC = "="
+RECORD_CONSOLE_STREAM = "~"
+RECORD_TARGET_STREAM = "@"
+RECORD_LOG_STREAM = "&"
+# Anything else on GDB's output is printed by the inferior, which shares it.
+RECORD_INFERIOR_OUTPUT = ""
+RESULT_DONE = "done"
+RESULT_RUNNING = "running"
+RESULT_ERROR = "error"
+RESULT_EXIT = "exit"
+ASYNC_STOPPED = "stopped"
+PROMPT = "(gdb)"
+
+_ASYNC_KINDS = (RECORD_RESULT, RECORD_EXEC_ASYNC, RECORD_STATUS_ASYNC, RECORD_NOTIFY_ASYNC)
+_STREAM_KINDS = (RECORD_CONSOLE_STREAM, RECORD_TARGET_STREAM, RECORD_LOG_STREAM)
+_RECORD_PATTERN = re.compile(r"^(\d*)([\^*+=])([a-zA-Z-]+)(?:,(.*))?$")
+_VARIABLE_PATTERN = re.compile(r"[a-zA-Z_][a-zA-Z0-9_-]*")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "\"": "\"", "\\": "\\", "a": "\a", "b": "\b",
+	"f": "\f", "v": "\v", "e": "\x1b"}
+
+# A line of GDB/MI output. Result and async records have a record class, such
+# as "done" or "stopped", and the results that follow it. Stream records and
+# the output of the inferior only have their text.
+MiRecord = collections.namedtuple("MiRecord", ["kind", "token", "record_class", "results", "text"])
+
+class MiParseError(ValueError):
+	pass
+
+# Returns None for the prompt and for blank lines.
+def parse_record(line):
+	line = line.rstrip("\r\n")
+	if line.strip() == "" or line.strip() == PROMPT:
+		return None
+	if line[0] in _STREAM_KINDS:
+		try:
+			text, end = _parse_c_string(line, 1)
+		except MiParseError:
+			return MiRecord(RECORD_INFERIOR_OUTPUT, None, None, None, line)
+		if end == len(line):
+			return MiRecord(line[0], None, None, None, text)
+	match = _RECORD_PATTERN.match(line)
+	if match is not None and match.group(2) in _ASYNC_KINDS:
+		token, kind, record_class, results = match.groups()
+		try:
+			parsed_results = {} if results is None else parse_results(results)
+		except MiParseError:
+			return MiRecord(RECORD_INFERIOR_OUTPUT, None, None, None, line)
+		return MiRecord(kind, int(token) if token else None, record_class, parsed_results, None)
+	return MiRecord(RECORD_INFERIOR_OUTPUT, None, None, None, line)
+
+# Parses a comma separated list of results, such as the part of a record after
+# its class. A variable given more than once maps to the list of its values.
+def parse_results(text):
+	results, end = _parse_results(text, 0, None)
+	if end != len(text):
+		raise MiParseError(f"Unexpected {text[end:]!r} after the results")
+	return results
+
+def quote_c_string(text):
+	escaped = text.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n").replace("\t", "\\t")
+	return f"\"{escaped}\""
+
+def _parse_results(text, position, closing):
+	results = {}
+	while position < len(text) and text[position] != closing:
+		name, value, position = _parse_result(text, position)
+		_add_result(results, name, value)
+		if position < len(text) and text[position] == ",":
+			position += 1
+	return results, position
+
+# Marks the values of a variable given more than once, as a value may be a list.
+class _RepeatedValues(list):
+	pass
+
+def _add_result(results, name, value):
+	if name not in results:
+		results[name] = value
+	elif isinstance(results[name], _RepeatedValues):
+		results[name].append(value)
+	else:
+		results[name] = _RepeatedValues([results[name], value])
+
+def _parse_result(text, position):
+	match = _VARIABLE_PATTERN.match(text, position)
+	if match is None or match.end() >= len(text) or text[match.end()] != "=":
+		raise MiParseError(f"Expected a result at {text[position:]!r}")
+	value, position = _parse_value(text, match.end() + 1)
+	return match.group(0), value, position
+
+def _parse_value(text, position):
+	if position >= len(text):
+		raise MiParseError("Expected a value at the end of the line")
+	character = text[position]
+	if character == "\"":
+		return _parse_c_string(text, position)
+	if character == "{":
+		results, position = _parse_results(text, position + 1, "}")
+		return results, _expect(text, position, "}")
+	if character == "[":
+		return _parse_list(text, position + 1)
+	raise MiParseError(f"Expected a value at {text[position:]!r}")
+
+# Lists hold either values or results. The names of results in a list, such as
+# the frame of each frame in a backtrace, are dropped.
+def _parse_list(text, position):
+	values = []
+	while position < len(text) and text[position] != "]":
+		if _VARIABLE_PATTERN.match(text, position) is not None:
+			_, value, position = _parse_result(text, position)
+		else:
+			value, position = _parse_value(text, position)
+		values.append(value)
+		if position < len(text) and text[position] == ",":
+			position += 1
+	return values, _expect(text, position, "]")
+
+def _parse_c_string(text, position):
+	position = _expect(text, position, "\"")
+	characters = []
+	while position < len(text):
+		character = text[position]
+		if character == "\"":
+			return "".join(characters), position + 1
+		if character == "\\" and position + 1 < len(text):
+			escaped = text[position + 1]
+			if escaped in "01234567":
+				octal = re.match(r"[0-7]{1,3}", text[position + 1:]).group(0)
+				characters.append(chr(int(octal, 8)))
+				position += 1 + len(octal)
+				continue
+			characters.append(_ESCAPES.get(escaped, escaped))
+			position += 2
+			continue
+		characters.append(character)
+		position += 1
+	raise MiParseError("Unterminated string")
+
+def _expect(text, position, character):
+	if position >= len(text) or text[position] != character:
+		raise MiParseError(f"Expected {character!r} at {text[position:]!r}")
+	return position + 1
@@ -0,0 +1,231 @@
+#!/bin/python3
+import asyncio
+import collections
+import itertools
+import os
+import re
+import time
+from orchestrator.gdb_mi import parse_record, quote_c_string, RECORD_RESULT, RECORD_EXEC_ASYNC, \
+		RECORD_CONSOLE_STREAM, RECORD_TARGET_STREAM, RECORD_INFERIOR_OUTPUT, RESULT_ERROR, ASYNC_STOPPED
+from explorer.explorer import replay_outcome, Outcome, DEFAULT_OUTCOME_PATTERN, DEFAULT_TIMEOUT, \
+		STATUS_EXITED, STATUS_FAILED, STATUS_TIMED_OUT
+
+SYRUP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORD_SCRIPT = os.path.join(SYRUP_DIRECTORY, "write-json.py")
+REPLAY_SCRIPT = os.path.join(SYRUP_DIRECTORY, "read-json.py")
+OUTPUT_FILE_ENVIRONMENT_VARIABLE = "SYRUP_OUTPUT_FILE"
+TARGET_SPEC_ENVIRONMENT_VARIABLE = "SYRUP_TARGET_SPEC"
+CHECKPOINT_FILE_ENVIRONMENT_VARIABLE = "SYRUP_CHECKPOINT_FILE"
+QUIT_AFTER_REPLAY_ENVIRONMENT_VARIABLE = "SYRUP_QUIT_AFTER_REPLAY"
+LOG_LEVEL_ENVIRONMENT_VARIABLE = "SYRUP_LOG_LEVEL"
+JOB_RECORD = "record"
+JOB_REPLAY = "replay"
+DEFAULT_CONCURRENCY = 64
+# Lines of GDB/MI output can be long, such as the records of big breakpoints.
+OUTPUT_LINE_LIMIT = 1 << 24
+QUIT_GRACE_SECONDS = 5
+
+# A recording or a replay of a trace. Recordings write the trace, optionally
+# narrowed down by a target spec file, and replays read it. The environment
+# holds any other SYRUP_ settings for the script, such as a replay window.
+Job = collections.namedtuple(
+	"Job",
+	["kind", "program", "trace", "arguments", "target", "environment"],
+	defaults=[(), None, None]
+)
+JobResult = collections.namedtuple("JobResult", ["job", "outcome", "stop_count", "seconds"])
+
+class GdbMiError(Exception):
+	pass
+
+# A GDB running one of the scripts on a program, talked to over GDB/MI. The
+# scripts drive recording and replay from inside GDB as they always have, so
+# the session mostly listens: records are read as GDB writes them, stops are
+# passed to the record callback as they come, and the text GDB and the
+# inferior print is kept for working out what happened. Commands can still be
+# sent, and the result record with the same token is returned.
+class GdbMiSession:
+	def __init__(self, gdb_command, script, program, arguments=(), environment=None, record_callback=None):
+		self._command_line = [
+			gdb_command, "--interpreter=mi", "-nx", "-q", "-x", script, "--args", program, *arguments
+		]
+		self._environment = environment
+		self._record_callback = record_callback
+		self._process = None
+		self._reader = None
+		self._tokens = itertools.count(1)
+		self._pending_commands = {}
+		self._output = []
+		self.stop_count = 0
+
+	async def start(self):
+		self._process = await asyncio.create_subprocess_exec(
+			*self._command_line,
+			stdin=asyncio.subprocess.PIPE,
+			stdout=asyncio.subprocess.PIPE,
+			stderr=asyncio.subprocess.STDOUT,
+			env=self._environment,
+			limit=OUTPUT_LINE_LIMIT
+		)
+		self._reader = asyncio.ensure_future(self._read_records())
+
+	async def command(self, command):
+		token = next(self._tokens)
+		result = asyncio.get_running_loop().create_future()
+		self._pending_commands[token] = result
+		self._process.stdin.write(f"{token}{command}\n".encode())
+		await self._process.stdin.drain()
+		record = await result
+		if record.record_class == RESULT_ERROR:
+			raise GdbMiError(record.results.get("msg", command))
+		return record
+
+	async def console_command(self, command):
+		return await self.command(f"-interpreter-exec console {quote_c_string(command)}")
+
+	# Returns the exit code of GDB once it has quit and its output has been read.
+	async def wait(self):
+		return_code = await self._process.wait()
+		await self._reader
+		return return_code
+
+	# GDB is asked to quit first, so that it kills the inferior, and is only
+	# killed itself if it does not.
+	async def stop(self):
+		if self._process.returncode is not None:
+			return
+		try:
+			self._process.stdin.write(b"-gdb-exit\n")
+			await self._process.stdin.drain()
+			await asyncio.wait_for(self._process.wait(), QUIT_GRACE_SECONDS)
+		except (asyncio.TimeoutError, ConnectionError):
+			self._process.kill()
+			await self._process.wait()
+		await self._reader
+
+	def output(self):
+		return "".join(self._output)
+
+	async def _read_records(self):
+		while True:
+			line = await self._process.stdout.readline()
+			if not line:
+				break
+			record = parse_record(line.decode(errors="replace"))
+			if record is not None:
+				self._handle_record(record)
+		for result in self._pending_commands.values():
+			if not result.done():
+				result.set_exception(GdbMiError("GDB exited before answering"))
+		self._pending_commands.clear()
+
+	def _handle_record(self, record):
+		if record.kind in (RECORD_CONSOLE_STREAM, RECORD_TARGET_STREAM):
+			self._output.append(record.text)
+		elif record.kind == RECORD_INFERIOR_OUTPUT:
+			self._output.append(record.text + "\n")
+		elif record.kind == RECORD_RESULT and record.token in self._pending_commands:
+			self._pending_commands.pop(record.token).set_result(record)
+		elif record.kind == RECORD_EXEC_ASYNC and record.record_class == ASYNC_STOPPED:
+			self.stop_count += 1
+		if self._record_callback is not None:
+			self._record_callback(record)
+
+# Runs record and replay jobs from a queue, with up to concurrency GDBs running
+# at once. Everything happens on one event loop, as the GDBs do the work and
+# each session only waits on its output, so hundreds of sessions need no more
+# than hundreds of processes. Jobs are taken from the iterable as room frees up
+# in the queue, so they can be made lazily.
+#
+# The record callback is called with each job and every record of its GDB as it
+# is read, which streams the stop records, and the result callback with the
+# result of each job as it finishes.
+class Orchestrator:
+	def __init__(self, concurrency=DEFAULT_CONCURRENCY, gdb_command="gdb", timeout=DEFAULT_TIMEOUT,
+			outcome_pattern=DEFAULT_OUTCOME_PATTERN, record_callback=None, result_callback=None):
+		self._concurrency = concurrency
+		self._gdb_command = gdb_command
+		self._timeout = timeout
+		self._outcome_pattern = re.compile(outcome_pattern)
+		self._record_callback = record_callback
+		self._result_callback = result_callback
+
+	def run_all(self, jobs):
+		return asyncio.run(self.run(jobs))
+
+	async def run(self, jobs):
+		queue = asyncio.Queue(2 * self._concurrency)
+		results = []
+		workers = [asyncio.ensure_future(self._work(queue, results)) for _ in range(self._concurrency)]
+		try:
+			for job in jobs:
+				await queue.put(job)
+			for _ in workers:
+				await queue.put(None)
+			await asyncio.gather(*workers)
+		finally:
+			for worker in workers:
+				worker.cancel()
+		return results
+
+	async def run_job(self, job):
+		script, environment = script_and_environment(job)
+		record_callback = None if self._record_callback is None else \
+			lambda record: self._record_callback(job, record)
+		session = GdbMiSession(self._gdb_command, script, job.program, job.arguments, environment, record_callback)
+		start = time.perf_counter()
+		try:
+			await session.start()
+		except OSError as exception:
+			return JobResult(job, Outcome(STATUS_FAILED, None, str(exception)), 0, time.perf_counter() - start)
+		is_timed_out = False
+		try:
+			return_code = await asyncio.wait_for(session.wait(), self._timeout)
+		except asyncio.TimeoutError:
+			is_timed_out = True
+			return_code = None
+		finally:
+			await session.stop()
+		seconds = time.perf_counter() - start
+		return JobResult(job, self._outcome(job, session.output(), return_code, is_timed_out),
+			session.stop_count, seconds)
+
+	async def _work(self, queue, results):
+		while True:
+			job = await queue.get()
+			if job is None:
+				return
+			result = await self.run_job(job)
+			results.append(result)
+			if self._result_callback is not None:
+				self._result_callback(result)
+
+	# Recordings quit GDB once the trace has been written, so they are taken
+	# to have worked if GDB exits cleanly.
+	def _outcome(self, job, output, return_code, is_timed_out):
+		if job.kind == JOB_REPLAY:
+			return replay_outcome(output, is_timed_out, self._outcome_pattern)
+		if is_timed_out:
+			return Outcome(STATUS_TIMED_OUT, None, None)
+		if return_code != 0 or not os.path.isfile(job.trace):
+			return Outcome(STATUS_FAILED, return_code, None)
+		value = self._outcome_pattern.search(output)
+		return Outcome(STATUS_EXITED, return_code, None if value is None else value.group(1))
+
+# Returns the script that runs the job and the environment to run it in, which
+# is the current environment with the job's settings on top.
+def script_and_environment(job):
+	environment = dict(os.environ)
+	environment.update(job.environment or {})
+	if job.kind == JOB_RECORD:
+		environment[OUTPUT_FILE_ENVIRONMENT_VARIABLE] = os.path.abspath(job.trace)
+		if job.target is not None:
+			environment[TARGET_SPEC_ENVIRONMENT_VARIABLE] = os.path.abspath(job.target)
+		return RECORD_SCRIPT, environment
+	if job.kind == JOB_REPLAY:
+		environment[CHECKPOINT_FILE_ENVIRONMENT_VARIABLE] = os.path.abspath(job.trace)
+		environment[QUIT_AFTER_REPLAY_ENVIRONMENT_VARIABLE] = "1"
+		# The outcome of a replay is told apart by what it logs
+		environment[LOG_LEVEL_ENVIRONMENT_VARIABLE] = "INFO"
+		return REPLAY_SCRIPT, environment
+	raise ValueError(f"Unknown job kind {job.kind}")
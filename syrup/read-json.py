@@ -1,169 +1,694 @@
 #!/bin/python3
 
 # GDB requires that we source our python script from within GDB to run it. This
-# means that the current directory is not included in the path, which means it
-# is not possible to import local modules. Therefore, we need to add the current
-# directory to the path to allow it to be run from within GDB. This has the
-# consequence that GDB must be launched from the directory outside the syrup
-# directory.
+# means that the directory of the script is not included in the path, which
+# means it is not possible to import local modules. Therefore, we add the
+# directory of the script to the path, found from the file being sourced, so
+# that GDB can be launched from any directory.
+import os
 import sys
-CURRENT_DIRECTORY = "syrup"
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(CURRENT_DIRECTORY)
 
 import gdb
 import json
 import collections
+import functools
 from gdb_wrapper import gdb_wrapper
 from collections import Counter
-from pprint import pprint
 from replay_reader.checkpoint_parser import checkpoint_parser
-from logger.logger import log
+from logger.logger import log, debug, error
+from location_resolver.location_resolver import LocationResolver
+from snapshot.snapshot import Snapshotter, SNAPSHOT_TAG, MEMORY_TAG
+from trace_index.trace_index import TraceIndex
+from fork_checkpoint_cache.fork_checkpoint_cache import ForkCheckpointCache, \
+		inferior_is_single_threaded, DEFAULT_CAPACITY
+from thread_registry.thread_registry import ThreadRegistry, reports_thread_exits
+from metrics import metrics
 
 CHECKPOINT_LOCATION_TAG = "location"
 CHECKPOINT_THREAD_TAG = "thread"
 CHECKPOINT_ACTION_TAG = "action"
 CHECKPOINT_IS_HIT_TAG = "is_hit"
+CHECKPOINT_ID_TAG = "id"
 ACTION_CREATE_THREAD_TAG = "create_thread"
-CHECKPOINT_FILE_LOCATION = "./checkpoints.json"
+CHECKPOINT_ACTION_CREATOR_THREAD_TAG = "creator_thread"
+CHECKPOINT_FILE_ENVIRONMENT_VARIABLE = "SYRUP_CHECKPOINT_FILE"
+QUIT_AFTER_REPLAY_ENVIRONMENT_VARIABLE = "SYRUP_QUIT_AFTER_REPLAY"
+REPLAY_WINDOW_ENVIRONMENT_VARIABLE = "SYRUP_REPLAY_WINDOW"
+REPLAY_THREADS_ENVIRONMENT_VARIABLE = "SYRUP_REPLAY_THREADS"
+SCHEDULE_LIST_ENVIRONMENT_VARIABLE = "SYRUP_SCHEDULE_LIST"
+FORK_CHECKPOINT_IDS_ENVIRONMENT_VARIABLE = "SYRUP_FORK_CHECKPOINT_IDS"
+FORK_CHECKPOINT_LIMIT_ENVIRONMENT_VARIABLE = "SYRUP_FORK_CHECKPOINT_LIMIT"
+CHECKPOINT_FILE_LOCATION = os.environ.get(CHECKPOINT_FILE_ENVIRONMENT_VARIABLE, "./checkpoints.jsonl")
+# Lets a driver running many replays, each in its own GDB, tell when a replay
+# is over from the exit code of GDB.
+QUIT_AFTER_REPLAY = os.environ.get(QUIT_AFTER_REPLAY_ENVIRONMENT_VARIABLE, "") not in ("", "0")
+# Replays only the checkpoints at positions START:STOP of the trace, either of
+# which may be left out, and only those of a comma separated list of threads.
+# Both default to the whole trace.
+REPLAY_WINDOW = os.environ.get(REPLAY_WINDOW_ENVIRONMENT_VARIABLE, "")
+REPLAY_THREADS = os.environ.get(REPLAY_THREADS_ENVIRONMENT_VARIABLE, "")
+# Replays each of the schedules listed one per line in this file in turn, in a
+# single GDB, rather than only the one in CHECKPOINT_FILE_LOCATION.
+SCHEDULE_LIST = os.environ.get(SCHEDULE_LIST_ENVIRONMENT_VARIABLE, "")
+# When replaying a list of schedules, GDB checkpoints are taken when the
+# checkpoints with these comma separated ids are hit, and later schedules that
+# start the same way restart from them rather than from the beginning. Only the
+# ids hit while the inferior has a single thread can be used, and a warning is
+# logged once for each of the others.
+FORK_CHECKPOINT_IDS = set(
+	int(checkpoint_id) for checkpoint_id in
+	os.environ.get(FORK_CHECKPOINT_IDS_ENVIRONMENT_VARIABLE, "").split(",") if checkpoint_id
+)
+FORK_CHECKPOINT_LIMIT = int(os.environ.get(FORK_CHECKPOINT_LIMIT_ENVIRONMENT_VARIABLE, DEFAULT_CAPACITY))
+# Checks the shared variables against the snapshots recorded with checkpoints,
+# for traces recorded with snapshots of them.
+VERIFY_SNAPSHOTS = True
+DIVERGENCE_EXIT_CODE = 101
 MAIN_THREAD = 1
+# Stands for live threads that were never matched to a recorded thread, which
+# have no checkpoints, so none of their hits are checked.
+UNKNOWN_THREAD = None
+REPLAY_BREAKPOINT_TIMER = metrics.BREAKPOINT_TIMER_PREFIX + "ReplayBreakpoint.stop"
 
+# A hit that does not match the schedule being replayed, or checkpoints that
+# were never hit. Locations are given relative to their modules where possible.
+class Divergence:
+	def __init__(self, expected_checkpoint, expected_location, thread, location, memory_mismatches=None):
+		self.expected_checkpoint = expected_checkpoint
+		self.expected_location = expected_location
+		self.thread = thread
+		self.location = location
+		self.memory_mismatches = memory_mismatches or {}
+
+	def __str__(self):
+		if self.expected_checkpoint is None:
+			return f"Diverged after the last checkpoint of thread {self.thread}: it hit {self.location}"
+		expected = f"expected thread {self.expected_checkpoint[CHECKPOINT_THREAD_TAG]} at {self.expected_location}"
+		if self.location is None:
+			return f"Diverged at checkpoint {self.expected_checkpoint[CHECKPOINT_ID_TAG]}: {expected}, " \
+				f"but the inferior exited"
+		report = f"Diverged at checkpoint {self.expected_checkpoint[CHECKPOINT_ID_TAG]}: {expected}, " \
+			f"but thread {self.thread} hit {self.location}"
+		for name, (recorded_value, value) in self.memory_mismatches.items():
+			report += f", {name} is {value} but was recorded as {recorded_value}"
+		return report
+
+# The checkpoints from position start up to, but not including, position stop,
+# of the given threads or of every thread. Threads run freely outside the
+# window. Before it, their hits of checkpoint breakpoints are counted rather
+# than controlled, using the index of the trace to know how many hits each
+# thread makes at each location before the window. After it, every breakpoint
+# is deleted. Threads outside the subset are not controlled, so they only run
+# outside the window, and the subset has to include the threads that create
+# those in it.
+class ReplayWindow:
+	def __init__(self, index, start=0, stop=None, threads=None):
+		self.stop = index.checkpoint_count if stop is None else min(stop, index.checkpoint_count)
+		self.start = min(start, self.stop)
+		self.threads = threads
+		self._index = index
+
+	def checkpoints(self, trace):
+		for checkpoint in trace.iter_checkpoints(self.start, self.stop, self._index):
+			if self.threads is None or checkpoint[CHECKPOINT_THREAD_TAG] in self.threads:
+				yield checkpoint
+
+	def hits_before(self, thread, location):
+		return self._index.hits_before(thread, location, self.start)
+
+	# How many checkpoints each thread has at each location in the window, by
+	# thread and location, found from the index rather than the trace.
+	def checkpoint_counts(self):
+		checkpoint_counts = collections.Counter()
+		for thread in self._index.threads():
+			if self.threads is not None and thread not in self.threads:
+				continue
+			for location in self._index.thread_locations(thread):
+				checkpoint_count = self._index.hits_before(thread, location, self.stop) - \
+					self._index.hits_before(thread, location, self.start)
+				if checkpoint_count > 0:
+					checkpoint_counts[thread, location] = checkpoint_count
+		return checkpoint_counts
+
+	def reaches_end_of_trace(self):
+		return self.stop == self._index.checkpoint_count
+
+	def __str__(self):
+		threads = "every thread" if self.threads is None else \
+			"threads " + ", ".join(map(str, sorted(self.threads)))
+		return f"checkpoints {self.start} to {self.stop} of {threads}"
+
+# Threads are known by the numbers they were recorded with. The threads of an
+# inferior restarted from a GDB checkpoint are numbered on from the threads
+# before it, so live threads are matched to recorded ones in the order they are
+# created instead.
+#
+# Each location has a single breakpoint, shared by the threads that still have
+# checkpoints there, which is deleted once they have all been hit.
+#
+# Checkpoints are read from the schedule as replay reaches them, rather than all
+# before it starts, and only those from the first one not yet hit on are kept.
+# How many checkpoints each thread has at each location is all that is needed
+# up front, to set the breakpoints of a thread and to know when it has finished.
 class CheckpointManager:
-	def __init__(self, checkpoints):
-		self.checkpoints = checkpoints
-		for checkpoint in self.checkpoints:
-			checkpoint.update({CHECKPOINT_IS_HIT_TAG: False})
+	def __init__(self, checkpoints, checkpoint_counts, snapshotter=None, window=None, fork_checkpoints=None):
+		self.divergence = None
+		self.is_scheduler_locked = schedule_is_controlled_from_start(window)
+		self._snapshotter = snapshotter
+		self._window = window
+		self._fork_checkpoints = fork_checkpoints
+		self._fork_checkpoint_prefix = None
+		live_main_thread = gdb.selected_thread().global_num
+		self._live_threads = {MAIN_THREAD: live_main_thread}
+		self._recorded_threads = {live_main_thread: MAIN_THREAD}
+		self._next_created_thread = MAIN_THREAD + 1
+		self._hits_left_before_window = {}
+		self._awaited_thread = None
+		self._checkpoints = iter(checkpoints)
+		self._upcoming_checkpoints = collections.deque()
+		self._hit_checkpoint_ids = []
+		self._remaining_checkpoints_by_thread = collections.defaultdict(collections.deque)
+		self._locations_by_thread = collections.defaultdict(set)
+		self._checkpoints_left_at = collections.Counter()
+		self._checkpoints_left_by_thread = collections.Counter()
+		self._checkpoint_count_left = 0
+		self.breakpoints = gdb_wrapper.BreakpointRegistry(
+			functools.partial(ReplayBreakpoint, checkpoint_manager=self)
+		)
+		# Locations are resolved to live addresses once, up front, rather than
+		# each time the breakpoints of a thread are set.
+		location_resolver = LocationResolver()
+		self._location_resolver = location_resolver
+		for (thread, location), checkpoint_count in checkpoint_counts.items():
+			live_location = location_resolver.live_location(location)
+			self._locations_by_thread[thread].add(live_location)
+			self._checkpoints_left_at[thread, live_location] += checkpoint_count
+			self._checkpoints_left_by_thread[thread] += checkpoint_count
+			self._checkpoint_count_left += checkpoint_count
+			if window is not None and (thread, live_location) not in self._hits_left_before_window:
+				self._hits_left_before_window[thread, live_location] = window.hits_before(thread, location)
 		self.set_breakpoints_for_thread(MAIN_THREAD)
-		self._alive_threads = set([MAIN_THREAD])
+		self.thread_registry = ThreadRegistry()
 
 	# Public methods
-	def update_alive_threads(self):
-		self._alive_threads = self._currently_alive_threads()
+	# Returns the recorded numbers of the threads, in the order they were
+	# created, which is only the created thread unless GDB missed reporting some.
+	def add_created_thread(self, created_thread):
+		threads = []
+		for live_thread in self.thread_registry.add_created_thread(created_thread):
+			thread = self._next_created_thread
+			self._next_created_thread += 1
+			self._live_threads[thread] = live_thread.global_num
+			self._recorded_threads[live_thread.global_num] = thread
+			threads.append(thread)
+		return threads
 
-	def newly_created_thread(self):
-		newly_created_threads = self._currently_alive_threads().difference(self._alive_threads)
-		assert len(newly_created_threads) == 1, "More than one thread created since last check"
-		return next(iter(newly_created_threads))
+	# Used when restarting from a GDB checkpoint taken after these checkpoints.
+	# The threads created before it have exited, as GDB checkpoints are only
+	# taken with a single thread, but their recorded numbers are still taken, so
+	# the threads created from there on are numbered after them.
+	def mark_first_checkpoints_as_hit(self, checkpoint_count):
+		created_thread_count = 0
+		for _ in range(checkpoint_count):
+			checkpoint = self._next_checkpoint()
+			thread = checkpoint[CHECKPOINT_THREAD_TAG]
+			if checkpoint[CHECKPOINT_ACTION_TAG] == CHECKPOINT_ACTION_CREATOR_THREAD_TAG:
+				created_thread_count += 1
+			self._next_created_thread = max(
+				self._next_created_thread,
+				thread + 1,
+				MAIN_THREAD + created_thread_count + 1
+			)
+			self.mark_next_checkpoint_as_hit_for_thread(thread)
 
 	def mark_next_checkpoint_as_hit_for_thread(self, thread):
 		next_checkpoint = self._next_checkpoint_for_thread(thread)
 		next_checkpoint[CHECKPOINT_IS_HIT_TAG] = True
-		log(f"Marked {next_checkpoint} as hit")
+		self._remaining_checkpoints_by_thread[thread].popleft()
+		location = self._location_resolver.live_location(next_checkpoint[CHECKPOINT_LOCATION_TAG])
+		self._checkpoints_left_at[thread, location] -= 1
+		self._checkpoints_left_by_thread[thread] -= 1
+		self._checkpoint_count_left -= 1
+		self._release_location_if_unneeded(thread, location)
+		self._advance_past_hit_checkpoints()
+		debug("Marked %s as hit", next_checkpoint)
 
 	def set_breakpoints_for_thread(self, thread):
 		for location in self._breakpoints_for_thread(thread):
-			gdb_wrapper.immediate_breakpoint_at(location, thread)
+			if self._thread_needs_location(thread, location):
+				self.breakpoints.add_interest(location, self._live_threads[thread])
+
+	# Called from inside GDB's breakpoint check, where the hit is checked against
+	# the schedule and marked straight away. A full stop is only needed when
+	# replay has to intervene, either to let the current thread finish, to
+	# switch to another thread or to abort when the hit is not the one expected.
+	# The first hit in a window also needs one, to start controlling the threads,
+	# as does taking a GDB checkpoint.
+	def hit_needs_full_stop(self, location):
+		current_thread = self.current_thread()
+		if not self._thread_breaks_at(current_thread, location):
+			return False
+		if self._hit_is_outside_window(current_thread, location):
+			return False
+		self.divergence = self._divergence_at_hit(current_thread, location)
+		if self.divergence is not None:
+			return True
+		checkpoint = self._next_checkpoint_for_thread(current_thread)
+		self.mark_next_checkpoint_as_hit_for_thread(current_thread)
+		metrics.count(metrics.CHECKPOINTS_COUNTER)
+		if not self.is_scheduler_locked or self._needs_fork_checkpoint(checkpoint):
+			return True
+		if self.current_thread_should_finish() or not self._has_checkpoints_left():
+			return True
+		return self._next_checkpoint()[CHECKPOINT_THREAD_TAG] != current_thread
 
+	# Once every checkpoint has been hit the inferior is left to run to the end,
+	# and before a window is reached threads are left to run as they would. A
+	# thread that has not been created yet cannot be switched to, so the switch
+	# waits for its new_thread event while the selected thread runs on.
 	def switch_to_thread_for_next_checkpoint(self):
+		self._awaited_thread = None
+		if not self.is_scheduler_locked:
+			return
+		if not self._has_checkpoints_left():
+			debug("Every checkpoint has been hit")
+			return
 		next_thread = self._next_checkpoint()[CHECKPOINT_THREAD_TAG]
-		log(f"Next thread: {next_thread}")
-		gdb_wrapper.enqueue_execute(f"thread {next_thread}")
+		live_thread = self._live_threads.get(next_thread)
+		if live_thread is None:
+			debug("Waiting for thread %d to be created before switching to it", next_thread)
+			self._awaited_thread = next_thread
+			return
+		debug("Next thread: %d", next_thread)
+		gdb_wrapper.enqueue_execute(f"thread {live_thread}")
+
+	def is_awaiting_any_of(self, threads):
+		return self._awaited_thread in threads
+
+	# Taken before the inferior is resumed, as taking one runs the inferior.
+	def enqueue_fork_checkpoint(self):
+		if self._fork_checkpoint_prefix is None:
+			return
+		prefix = self._fork_checkpoint_prefix
+		self._fork_checkpoint_prefix = None
+		gdb_wrapper.post_event(functools.partial(self._fork_checkpoints.take, prefix))
+
+	def enter_window(self):
+		log(f"Entered the window of {self._window}")
+		gdb_wrapper.enqueue_execute("set scheduler-locking on")
+		self.is_scheduler_locked = True
+
+	def has_left_window(self):
+		return self._window is not None and not self._has_checkpoints_left()
+
+	def leave_window(self):
+		log(f"Left the window of {self._window}")
+		gdb_wrapper.post_event(self.breakpoints.delete_all)
+		gdb_wrapper.enqueue_execute("set scheduler-locking off")
+		self.is_scheduler_locked = False
 
 	def current_thread_should_finish(self):
-		log("Called current_thread_should_finish")
-		remaining_thread_checkpoints = len(self._checkpoints_left_for_thread(self.current_thread()))
-		log(f"{remaining_thread_checkpoints} checkpoints left for current thread")
+		debug("Called current_thread_should_finish")
+		remaining_thread_checkpoints = self._checkpoint_count_left_for_thread(self.current_thread())
+		debug("%d checkpoints left for current thread", remaining_thread_checkpoints)
 		return remaining_thread_checkpoints == 0
 
 	def current_thread(self):
-		current_thread = gdb.selected_thread().global_num
-		log(f"Current thread: {current_thread}")
+		live_thread = gdb.selected_thread().global_num
+		current_thread = self._recorded_threads.get(live_thread, UNKNOWN_THREAD)
+		if current_thread is UNKNOWN_THREAD:
+			debug("Live thread %d was not matched to a recorded thread", live_thread)
+		else:
+			debug("Current thread: %d", current_thread)
 		return current_thread
 
+	# Checkpoints left when the inferior exits were skipped over by their thread.
+	def divergence_at_exit(self):
+		if not self._has_checkpoints_left():
+			return None
+		expected_checkpoint = self._next_checkpoint()
+		expected_location = self._location_resolver.live_location(expected_checkpoint[CHECKPOINT_LOCATION_TAG])
+		return Divergence(expected_checkpoint, self._symbolic_location(expected_location), None, None)
+
 	# Private methods
-	def _checkpoints_left_for_thread(self, thread):
-		log(f"Called _checkpoints_for_thread {thread}")
-		remaining_checkpoints = list(filter(
-			lambda checkpoint: checkpoint[CHECKPOINT_THREAD_TAG] == thread and
-			not checkpoint[CHECKPOINT_IS_HIT_TAG], self.checkpoints
-		))
-		return remaining_checkpoints
+	# Hits before the window are only counted. Hits after the window, by threads
+	# that have hit their last checkpoint in it, are left alone unless the
+	# window reaches the end of the trace, where there should be none.
+	#
+	# The breakpoints are not given ignore counts to skip the hits before the
+	# window instead, as GDB calls the stop method of a breakpoint before it
+	# looks at its ignore count, so every hit would still get here. An ignore
+	# count is also kept for the breakpoint rather than for each thread sharing
+	# it.
+	def _hit_is_outside_window(self, thread, location):
+		if self._window is None:
+			return False
+		hits_left = self._hits_left_before_window.get((thread, location), 0)
+		if hits_left > 0:
+			self._hits_left_before_window[thread, location] = hits_left - 1
+			self._release_location_if_unneeded(thread, location)
+			return True
+		return self._checkpoint_count_left_for_thread(thread) == 0 and \
+			not self._window.reaches_end_of_trace()
+
+	# Checkpoints are only taken while there is a single thread, which also
+	# means that every checkpoint so far has been hit in order.
+	def _needs_fork_checkpoint(self, checkpoint):
+		if self._fork_checkpoints is None or checkpoint[CHECKPOINT_ID_TAG] not in FORK_CHECKPOINT_IDS:
+			return False
+		if not inferior_is_single_threaded():
+			self._fork_checkpoints.skip(checkpoint[CHECKPOINT_ID_TAG])
+			return False
+		self._fork_checkpoint_prefix = list(self._hit_checkpoint_ids)
+		return True
+
+	# Threads may run ahead of the global order while another thread finishes,
+	# but each hit has to be the next checkpoint of the thread that hit it.
+	def _divergence_at_hit(self, thread, location):
+		if self._checkpoint_count_left_for_thread(thread) == 0:
+			return Divergence(None, None, thread, self._symbolic_location(location))
+		expected_checkpoint = self._next_checkpoint_for_thread(thread)
+		expected_location = self._location_resolver.live_location(expected_checkpoint[CHECKPOINT_LOCATION_TAG])
+		memory_mismatches = {}
+		if expected_location == location:
+			memory_mismatches = self._memory_mismatches(expected_checkpoint)
+			if len(memory_mismatches) == 0:
+				return None
+		return Divergence(
+			expected_checkpoint,
+			self._symbolic_location(expected_location),
+			thread,
+			self._symbolic_location(location),
+			memory_mismatches
+		)
+
+	def _memory_mismatches(self, checkpoint):
+		recorded_values = checkpoint.get(SNAPSHOT_TAG, {}).get(MEMORY_TAG)
+		if self._snapshotter is None or recorded_values is None:
+			return {}
+		values = self._snapshotter.shared_variable_values()
+		return {
+			name: (recorded_value, values[name]) for name, recorded_value in recorded_values.items()
+			if name in values and values[name] != recorded_value
+		}
+
+	def _symbolic_location(self, location):
+		return self._location_resolver.symbolic_location(int(location.lstrip("*"), 16))
+
+	def _checkpoint_count_left_for_thread(self, thread):
+		debug("Called _checkpoint_count_left_for_thread %s", thread)
+		return self._checkpoints_left_by_thread[thread]
 
+	# Checkpoints are hit in the order they were recorded in, except that a
+	# thread may run ahead of the global order when it is finishing. Dropping
+	# every checkpoint that has already been hit from the front of those read
+	# keeps the first unhit checkpoint there, and each is dropped only once. The
+	# ids of those dropped are the prefix a GDB checkpoint would be taken at.
+	def _advance_past_hit_checkpoints(self):
+		while len(self._upcoming_checkpoints) > 0 and self._upcoming_checkpoints[0][CHECKPOINT_IS_HIT_TAG]:
+			checkpoint = self._upcoming_checkpoints.popleft()
+			if self._fork_checkpoints is not None:
+				self._hit_checkpoint_ids.append(checkpoint[CHECKPOINT_ID_TAG])
+
+	def _has_checkpoints_left(self):
+		return self._checkpoint_count_left > 0
 
 	def _next_checkpoint(self):
-		next_checkpoint = next(filter(
-			lambda checkpoint: not checkpoint[CHECKPOINT_IS_HIT_TAG], self.checkpoints
-		))
-		log("I want to hit this checkpoint next:")
-		pprint(next_checkpoint)
+		if len(self._upcoming_checkpoints) == 0:
+			self._read_next_checkpoint()
+		next_checkpoint = self._upcoming_checkpoints[0]
+		debug("I want to hit this checkpoint next: %s", next_checkpoint)
 		return next_checkpoint
 
+	# A thread running ahead of the global order has its checkpoints read ahead
+	# of the others, which are kept until their threads reach them.
 	def _next_checkpoint_for_thread(self, thread):
-		next_checkpoint = next(filter(
-			lambda checkpoint: not checkpoint[CHECKPOINT_IS_HIT_TAG] and \
-					checkpoint[CHECKPOINT_THREAD_TAG] == thread,
-			self.checkpoints
-		))
-		return next_checkpoint
+		remaining_checkpoints = self._remaining_checkpoints_by_thread[thread]
+		while len(remaining_checkpoints) == 0:
+			self._read_next_checkpoint()
+		return remaining_checkpoints[0]
 
-	def _currently_alive_threads(self):
-		return set(
-				map(lambda thread: thread.global_num, gdb.inferiors()[0].threads())
-		)
+	def _read_next_checkpoint(self):
+		checkpoint = next(self._checkpoints)
+		checkpoint[CHECKPOINT_IS_HIT_TAG] = False
+		self._upcoming_checkpoints.append(checkpoint)
+		self._remaining_checkpoints_by_thread[checkpoint[CHECKPOINT_THREAD_TAG]].append(checkpoint)
 
 	def _breakpoints_for_thread(self, thread):
-		return set(map(
-			lambda checkpoint: checkpoint[CHECKPOINT_LOCATION_TAG],
-			self._checkpoints_for_thread(thread)
-		))
+		return self._locations_by_thread.get(thread, set())
+
+	# Other threads also hit the breakpoint at a location, as it is shared, but
+	# only the hits of threads that were recorded there are checked, as before.
+	def _thread_breaks_at(self, thread, location):
+		return thread in self._live_threads and location in self._locations_by_thread.get(thread, ())
+
+	def _thread_needs_location(self, thread, location):
+		return self._checkpoints_left_at[thread, location] > 0 or \
+			self._hits_left_before_window.get((thread, location), 0) > 0
+
+	def _release_location_if_unneeded(self, thread, location):
+		if thread in self._live_threads and not self._thread_needs_location(thread, location):
+			self.breakpoints.remove_interest(location, self._live_threads[thread])
+
+class ReplayBreakpoint(gdb.Breakpoint):
+	def __init__(self, spec, *arguments, checkpoint_manager, **keyword_arguments):
+		super().__init__(spec, *arguments, **keyword_arguments)
+		self._checkpoint_manager = checkpoint_manager
 
-	def _checkpoints_for_thread(self, thread):
-		return list(filter(
-			lambda checkpoint: checkpoint[CHECKPOINT_THREAD_TAG] == thread,
-			self.checkpoints
-		))
+	def stop(self):
+		started_at = metrics.start_timer()
+		needs_full_stop = self._checkpoint_manager.hit_needs_full_stop(self.location)
+		metrics.stop_timer(REPLAY_BREAKPOINT_TIMER, started_at)
+		return needs_full_stop
 
+# Hits are marked by ReplayBreakpoint, so this only sees the hits after which
+# replay has to intervene.
 class BreakListener:
-	def __init__(self, checkpoint_manager):
+	def __init__(self, checkpoint_manager, session):
 		self._checkpoint_manager = checkpoint_manager
+		self._session = session
 
 	def __call__(self, event):
-		log("BreakListener hit!")
-		self._checkpoint_manager.mark_next_checkpoint_as_hit_for_thread(
-			self._checkpoint_manager.current_thread()
-		)
-		if self._checkpoint_manager.current_thread_should_finish():
-			log(f"Finishing current thread as all checkpoints have been hit")
+		debug("BreakListener hit!")
+		gdb_wrapper.drop_rest_of_running_batches()
+		if self._checkpoint_manager.divergence is not None:
+			abort_replay(self._checkpoint_manager.divergence, self._session)
+			return
+		with gdb_wrapper.batched_actions():
+			self._checkpoint_manager.enqueue_fork_checkpoint()
+			if not self._checkpoint_manager.is_scheduler_locked:
+				self._checkpoint_manager.enter_window()
+			if self._checkpoint_manager.has_left_window():
+				self._checkpoint_manager.leave_window()
+				gdb_wrapper.enqueue_execute("continue")
+				return
+			if self._checkpoint_manager.current_thread_should_finish():
+				debug("Finishing current thread as all checkpoints have been hit")
+				gdb_wrapper.enqueue_execute("continue")
+			self._checkpoint_manager.switch_to_thread_for_next_checkpoint()
 			gdb_wrapper.enqueue_execute("continue")
-		self._checkpoint_manager.switch_to_thread_for_next_checkpoint()
-		gdb_wrapper.enqueue_execute("continue")
 
 class ThreadCreationListener:
 	def __init__(self, checkpoint_manager):
 		self._checkpoint_manager = checkpoint_manager
 
 	def __call__(self, event):
-		log("ThreadCreationListener hit!")
-		creator_thread = event.inferior_thread.num
-		created_thread = self._checkpoint_manager.newly_created_thread()
-		log(f"creator_thread: {creator_thread}, created_thread: {created_thread}")
-		self._checkpoint_manager.update_alive_threads()
-		self._checkpoint_manager.set_breakpoints_for_thread(created_thread)
-		self._checkpoint_manager.switch_to_thread_for_next_checkpoint()
-
-def setup_gdb():
+		debug("ThreadCreationListener hit!")
+		created_threads = self._checkpoint_manager.add_created_thread(event.inferior_thread)
+		for created_thread in created_threads:
+			self._checkpoint_manager.set_breakpoints_for_thread(created_thread)
+		if self._checkpoint_manager.is_awaiting_any_of(created_threads):
+			self._checkpoint_manager.switch_to_thread_for_next_checkpoint()
+
+class InferiorExitListener:
+	def __init__(self, checkpoint_manager, session):
+		self._checkpoint_manager = checkpoint_manager
+		self._session = session
+
+	def __call__(self, event):
+		debug("Replay finished with %s", self._checkpoint_manager.breakpoints)
+		exit_code = getattr(event, "exit_code", 0)
+		if self._checkpoint_manager.divergence is not None:
+			exit_code = DIVERGENCE_EXIT_CODE
+		else:
+			divergence = self._checkpoint_manager.divergence_at_exit()
+			if divergence is not None:
+				error(str(divergence))
+				exit_code = DIVERGENCE_EXIT_CODE
+		self._session.finish_replay(exit_code, is_inferior_running=False)
+
+# Replay stops at the first divergence rather than running on, as nothing after
+# it follows the schedule.
+def abort_replay(divergence, session):
+	error(str(divergence))
+	session.finish_replay(DIVERGENCE_EXIT_CODE, is_inferior_running=True)
+
+# Replays schedules one after another in the same GDB. After the first, each
+# schedule restarts from the deepest GDB checkpoint taken at a prefix of it, or
+# from the beginning if checkpoints cannot be taken.
+class ReplaySession:
+	def __init__(self, schedule_file_names, window=None, fork_checkpoints=None):
+		self._schedule_file_names = collections.deque(schedule_file_names)
+		self._window = window
+		self._fork_checkpoints = fork_checkpoints
+		self._connections = []
+		self._is_first_replay = True
+		self._is_replaying = False
+
+	def replay_next_schedule(self):
+		schedule_file_name = self._schedule_file_names.popleft()
+		log(f"Replaying schedule {schedule_file_name}")
+		trace = checkpoint_parser(schedule_file_name)
+		hit_count = self._restart(
+			checkpoint[CHECKPOINT_ID_TAG] for checkpoint in self._schedule_checkpoints(trace)
+		)
+		checkpoint_manager = CheckpointManager(
+			self._schedule_checkpoints(trace),
+			count_checkpoints(trace) if self._window is None else self._window.checkpoint_counts(),
+			open_snapshotter(trace),
+			self._window,
+			self._fork_checkpoints
+		)
+		checkpoint_manager.mark_first_checkpoints_as_hit(hit_count)
+		self._connect_listeners(checkpoint_manager)
+		self._is_replaying = True
+		gdb_wrapper.enqueue_execute("continue")
+
+	# A replay can finish both by aborting and by the inferior exiting after.
+	def finish_replay(self, exit_code, is_inferior_running):
+		if not self._is_replaying:
+			return
+		self._is_replaying = False
+		log(f"Replay finished with exit code {exit_code}")
+		# Anything still to be done for this replay would act on the inferior
+		# of the next one, or on none at all.
+		gdb_wrapper.cancel_pending_actions()
+		if len(self._schedule_file_names) > 0:
+			gdb_wrapper.post_event(self.replay_next_schedule)
+		elif QUIT_AFTER_REPLAY:
+			if self._fork_checkpoints is not None:
+				gdb_wrapper.post_event(self._fork_checkpoints.delete_all)
+			gdb_wrapper.enqueue_quit(exit_code)
+		elif is_inferior_running:
+			gdb_wrapper.enqueue_execute("kill")
+
+	def _schedule_checkpoints(self, trace):
+		return trace.iter_checkpoints() if self._window is None else self._window.checkpoints(trace)
+
+	# Returns how many checkpoints of the schedule were hit before the point
+	# the inferior was restarted from.
+	def _restart(self, checkpoint_ids):
+		if self._is_first_replay:
+			self._is_first_replay = False
+			self._take_fork_checkpoint_at_beginning()
+			return 0
+		self._disconnect_listeners()
+		gdb_wrapper.immediate_execute("delete")
+		if self._fork_checkpoints is None:
+			pause_target_at_beginning(self._window)
+			return 0
+		hit_count = self._fork_checkpoints.restart_from_deepest_prefix(checkpoint_ids)
+		set_scheduler_locking(self._window)
+		return hit_count
+
+	def _take_fork_checkpoint_at_beginning(self):
+		if self._fork_checkpoints is None:
+			return
+		try:
+			self._fork_checkpoints.take_at_beginning()
+		except gdb.error as exception:
+			error(f"Replaying each schedule from the beginning, as checkpoints cannot be taken: {exception}")
+			self._fork_checkpoints = None
+
+	def _connect_listeners(self, checkpoint_manager):
+		self._connections = [
+			(gdb.events.stop, BreakListener(checkpoint_manager, self)),
+			(gdb.events.new_thread, ThreadCreationListener(checkpoint_manager)),
+			(gdb.events.exited, InferiorExitListener(checkpoint_manager, self))
+		]
+		if reports_thread_exits():
+			self._connections.append(
+				(gdb.events.thread_exited, checkpoint_manager.thread_registry.thread_exited)
+			)
+		for event_registry, event_listener in self._connections:
+			gdb_wrapper.immediate_connect(event_registry, event_listener)
+
+	def _disconnect_listeners(self):
+		for event_registry, event_listener in self._connections:
+			gdb_wrapper.immediate_disconnect(event_registry, event_listener)
+		self._connections = []
+
+def setup_gdb(window):
 	configure_gdb_to_run_as_a_script()
-	pause_target_at_beginning()
+	pause_target_at_beginning(window)
 
 def configure_gdb_to_run_as_a_script():
 	gdb_wrapper.immediate_execute("set confirm off")
 	gdb_wrapper.immediate_execute("set pagination off")
 
-def pause_target_at_beginning():
+def pause_target_at_beginning(window):
 	entry_breakpoint = gdb_wrapper.immediate_breakpoint_at("main", is_temporary=True)
 	gdb_wrapper.immediate_execute("run")
-	gdb_wrapper.immediate_execute("set scheduler-locking on")
+	set_scheduler_locking(window)
 
-def connect_listeners(checkpoint_manager):
-	gdb_wrapper.immediate_connect(gdb.events.stop, BreakListener(checkpoint_manager))
-	gdb_wrapper.immediate_connect(gdb.events.new_thread, ThreadCreationListener(checkpoint_manager))
+def set_scheduler_locking(window):
+	if schedule_is_controlled_from_start(window):
+		gdb_wrapper.immediate_execute("set scheduler-locking on")
+	else:
+		gdb_wrapper.immediate_execute("set scheduler-locking off")
 
-def main():
-	setup_gdb()
-	checkpoint_manager = CheckpointManager(
-		checkpoint_parser(CHECKPOINT_FILE_LOCATION).get_checkpoints()
+def schedule_is_controlled_from_start(window):
+	return window is None or window.start == 0
+
+def open_replay_window(trace_file_name):
+	if REPLAY_WINDOW == "" and REPLAY_THREADS == "":
+		return None
+	start, _, stop = REPLAY_WINDOW.partition(":")
+	window = ReplayWindow(
+		TraceIndex.load_or_build(trace_file_name),
+		int(start or 0),
+		int(stop) if stop else None,
+		set(map(int, REPLAY_THREADS.split(","))) if REPLAY_THREADS else None
+	)
+	log(f"Replaying {window}")
+	return window
+
+def read_schedule_list():
+	if SCHEDULE_LIST == "":
+		return [CHECKPOINT_FILE_LOCATION]
+	with open(SCHEDULE_LIST) as schedule_list_file:
+		return [line.strip() for line in schedule_list_file if line.strip()]
+
+# Reads through the schedule once before it is replayed, keeping only how many
+# checkpoints each thread has at each location.
+def count_checkpoints(trace):
+	return collections.Counter(
+		(checkpoint[CHECKPOINT_THREAD_TAG], checkpoint[CHECKPOINT_LOCATION_TAG])
+		for checkpoint in trace.iter_checkpoints()
 	)
-	connect_listeners(checkpoint_manager)
-	gdb_wrapper.enqueue_execute("continue")
+
+def open_snapshotter(trace):
+	shared_variables = trace.get_snapshot_shared_variables()
+	if not VERIFY_SNAPSHOTS or len(shared_variables) == 0:
+		return None
+	return Snapshotter([], shared_variables)
+
+def main():
+	schedule_file_names = read_schedule_list()
+	metrics.write_summary_at_exit(schedule_file_names[0], "replay")
+	gdb_wrapper.connect_stop_counter()
+	window = None
+	fork_checkpoints = None
+	if len(schedule_file_names) == 1:
+		window = open_replay_window(schedule_file_names[0])
+	else:
+		if REPLAY_WINDOW != "" or REPLAY_THREADS != "":
+			error("Only a single schedule can be replayed in a window, so the whole of each is replayed")
+		fork_checkpoints = ForkCheckpointCache(FORK_CHECKPOINT_LIMIT)
+	setup_gdb(window)
+	ReplaySession(schedule_file_names, window, fork_checkpoints).replay_next_schedule()
 
 if __name__ == "__main__":
 	main()
@@ -0,0 +1,80 @@
+#!/bin/python3
+
+# Records a trace of a program by running write-json.py in GDB on it. The sites
+# to record can be narrowed down with a target spec file, as read by
+# TargetSpec, and with the options below, which add to the lists in the file.
+#
+# Usage: python3 syrup/record.py --output checkpoints.jsonl --variable counter
+#	--ignore-library libc.so.6 examples/counter-2-threads/a.out arguments
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+import argparse
+import subprocess
+import tempfile
+from target_spec.target_spec import TargetSpec, parse_address_range
+
+RECORD_SCRIPT = os.path.join(CURRENT_DIRECTORY, "write-json.py")
+OUTPUT_FILE_ENVIRONMENT_VARIABLE = "SYRUP_OUTPUT_FILE"
+TARGET_SPEC_ENVIRONMENT_VARIABLE = "SYRUP_TARGET_SPEC"
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Record the order in which the threads of a program hit its checkpoints")
+	parser.add_argument("program", help="program to record")
+	parser.add_argument("arguments", nargs=argparse.REMAINDER, help="arguments to run the program with")
+	parser.add_argument("--output", default="checkpoints.jsonl", help="file to write the trace to")
+	parser.add_argument("--target", help="target spec file describing the sites to record")
+	parser.add_argument("--variable", action="append", default=[],
+		help="shared variable whose accesses are recorded, can be repeated")
+	parser.add_argument("--function", action="append", default=[],
+		help="function whose accesses and thread starts are recorded, can be repeated")
+	parser.add_argument("--address-range", action="append", default=[], type=address_range,
+		help="range of sites to record, such as a.out+0x1100-0x1200, can be repeated")
+	parser.add_argument("--ignore-library", action="append", default=[],
+		help="module, such as libc.so.6, none of whose sites are recorded, can be repeated")
+	parser.add_argument("--no-thread-creations", action="store_true",
+		help="do not record the clone sites that thread creations return to")
+	parser.add_argument("--gdb", default="gdb", help="GDB executable to run")
+	return parser.parse_args()
+
+def address_range(text):
+	try:
+		parse_address_range(text)
+	except ValueError as exception:
+		raise argparse.ArgumentTypeError(str(exception))
+	return text
+
+def target_spec_from_arguments(arguments):
+	target_spec = TargetSpec() if arguments.target is None else TargetSpec.load(arguments.target)
+	return TargetSpec(
+		target_spec.variables + arguments.variable,
+		target_spec.functions + arguments.function,
+		target_spec.address_ranges + arguments.address_range,
+		target_spec.ignore_libraries + arguments.ignore_library,
+		target_spec.thread_creations and not arguments.no_thread_creations
+	)
+
+def main():
+	arguments = parse_arguments()
+	target_spec = target_spec_from_arguments(arguments)
+	with tempfile.TemporaryDirectory() as working_directory:
+		target_spec_file_name = os.path.join(working_directory, "target.json")
+		target_spec.save(target_spec_file_name)
+		environment = dict(os.environ)
+		environment[OUTPUT_FILE_ENVIRONMENT_VARIABLE] = os.path.abspath(arguments.output)
+		environment[TARGET_SPEC_ENVIRONMENT_VARIABLE] = target_spec_file_name
+		# stdin is kept open so that GDB keeps running its event loop until
+		# the recording quits it, rather than quitting at the end of its input.
+		process = subprocess.Popen(
+			[arguments.gdb, "-nx", "-q", "-x", RECORD_SCRIPT, "--args", arguments.program, *arguments.arguments],
+			stdin=subprocess.PIPE,
+			env=environment
+		)
+		return_code = process.wait()
+		process.stdin.close()
+	sys.exit(return_code)
+
+if __name__ == "__main__":
+	main()
@@ -1,15 +1,84 @@
 import json
+from trace_writer.trace_writer import is_trace_header
+from trace_archive.trace_archive import TraceArchive, is_trace_archive
 
 class checkpoint_parser:
 	_CHECKPOINT_TAG = "checkpoints"
 	_THREAD_START_ROUTINE_TAG = "thread_start_routines"
+	_SHARED_VARIABLE_ACCESSES_TAG = "shared_variable_accesses"
+	_SNAPSHOT_SHARED_VARIABLES_TAG = "snapshot_shared_variables"
 
 	def __init__(self, checkpoint_file_name):
+		self._checkpoint_file_name = checkpoint_file_name
+		self._archive = None
+		if is_trace_archive(checkpoint_file_name):
+			self._archive = TraceArchive.load(checkpoint_file_name)
+			self._information = self._archive.header
+			self._is_streamed = False
+			return
 		with open(checkpoint_file_name) as checkpoint_file:
-			self._information = json.load(checkpoint_file)
+			self._information = self._read_header(checkpoint_file)
+			self._is_streamed = self._information is not None
+			if not self._is_streamed:
+				checkpoint_file.seek(0)
+				self._information = json.load(checkpoint_file)
 
 	def get_start_routines(self):
 		return self._information[self._THREAD_START_ROUTINE_TAG]
 
+	# Traces recorded before the access sites were discovered automatically do
+	# not describe them.
+	def get_shared_variable_accesses(self):
+		return self._information.get(self._SHARED_VARIABLE_ACCESSES_TAG, {})
+
+	# The sizes of the shared variables in the snapshots, if any were taken.
+	def get_snapshot_shared_variables(self):
+		return self._information.get(self._SNAPSHOT_SHARED_VARIABLES_TAG, {})
+
+	# Everything recorded other than the checkpoints themselves.
+	def get_header(self):
+		return {
+			tag: value for tag, value in self._information.items()
+			if tag != self._CHECKPOINT_TAG
+		}
+
 	def get_checkpoints(self):
-		return self._information[self._CHECKPOINT_TAG]
+		return list(self.iter_checkpoints())
+
+	# Streamed traces are parsed one checkpoint at a time as they are iterated
+	# over, rather than all at once when the parser is created. Only the
+	# checkpoints from position start up to, but not including, position stop
+	# are yielded. Given the index of a streamed trace, reading seeks close to
+	# start rather than parsing every checkpoint before it.
+	def iter_checkpoints(self, start=0, stop=None, index=None):
+		if self._archive is not None:
+			yield from self._archive.iter_checkpoints(start, stop)
+			return
+		if not self._is_streamed:
+			yield from self._information[self._CHECKPOINT_TAG][start:stop]
+			return
+		with open(self._checkpoint_file_name, "rb") as checkpoint_file:
+			checkpoint_file.readline()
+			position = 0
+			indexed_position = None if index is None else index.seek(start)
+			if indexed_position is not None:
+				position, offset = indexed_position
+				checkpoint_file.seek(offset)
+			for line in checkpoint_file:
+				if stop is not None and position >= stop:
+					return
+				# The last line of an interrupted recording may be incomplete
+				if not line.endswith(b"\n"):
+					return
+				if not line.strip():
+					continue
+				if position >= start:
+					yield json.loads(line)
+				position += 1
+
+	def _read_header(self, checkpoint_file):
+		try:
+			header = json.loads(checkpoint_file.readline())
+		except json.JSONDecodeError:
+			return None
+		return header if is_trace_header(header) else None
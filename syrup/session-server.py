@@ -0,0 +1,38 @@
+#!/bin/python3
+
+# Runs record and replay jobs sent to a Unix socket in this GDB, one after
+# another, keeping the programs and symbols it has loaded between them. GDB
+# does not add the directory of a script it sources to the path, so it is
+# added here to import the other modules. Started by session.py, or directly,
+# with stdin kept open so that GDB keeps running its event loop:
+#
+# Usage: SYRUP_SESSION_SOCKET=syrup-session.sock gdb -nx -q -x syrup/session-server.py
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+from gdb_wrapper import gdb_wrapper
+from session_server.session_server import SessionServer
+from session_server.protocol import SOCKET_ENVIRONMENT_VARIABLE, DEFAULT_SOCKET
+from explorer.explorer import DEFAULT_OUTCOME_PATTERN, DEFAULT_TIMEOUT
+
+SESSION_TIMEOUT_ENVIRONMENT_VARIABLE = "SYRUP_SESSION_TIMEOUT"
+SESSION_OUTCOME_PATTERN_ENVIRONMENT_VARIABLE = "SYRUP_SESSION_OUTCOME_PATTERN"
+SESSION_SOCKET = os.environ.get(SOCKET_ENVIRONMENT_VARIABLE, DEFAULT_SOCKET)
+# Seconds a job may run for before it is abandoned and the next one started.
+SESSION_TIMEOUT = float(os.environ.get(SESSION_TIMEOUT_ENVIRONMENT_VARIABLE, DEFAULT_TIMEOUT))
+# Regular expression whose first group, found in what the inferior of a job
+# prints, is the value of the job's outcome.
+SESSION_OUTCOME_PATTERN = os.environ.get(SESSION_OUTCOME_PATTERN_ENVIRONMENT_VARIABLE, DEFAULT_OUTCOME_PATTERN)
+
+def configure_gdb_to_run_as_a_script():
+	gdb_wrapper.immediate_execute("set pagination off")
+	gdb_wrapper.immediate_execute("set confirm off")
+
+def main():
+	configure_gdb_to_run_as_a_script()
+	SessionServer(SESSION_SOCKET, SESSION_TIMEOUT, SESSION_OUTCOME_PATTERN).start()
+
+if __name__ == "__main__":
+	main()
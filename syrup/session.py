@@ -0,0 +1,101 @@
+#!/bin/python3
+
+# Starts a long lived GDB that runs record and replay jobs without being
+# restarted for each of them, sends it jobs, and stops it. Jobs are read from a
+# JSON Lines file, as for orchestrate.py, and run one after another:
+#
+# Usage: python3 syrup/session.py start --socket syrup-session.sock &
+#	python3 syrup/session.py submit jobs.jsonl --socket syrup-session.sock
+#	python3 syrup/session.py stop --socket syrup-session.sock
+import os
+import sys
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CURRENT_DIRECTORY)
+
+import argparse
+import json
+import subprocess
+from orchestrator.orchestrator import Job
+from explorer.explorer import DEFAULT_OUTCOME_PATTERN, DEFAULT_TIMEOUT
+from session_server.session_client import SessionClient
+from session_server.protocol import SOCKET_ENVIRONMENT_VARIABLE, DEFAULT_SOCKET
+
+SESSION_SERVER_SCRIPT = os.path.join(CURRENT_DIRECTORY, "session-server.py")
+SESSION_TIMEOUT_ENVIRONMENT_VARIABLE = "SYRUP_SESSION_TIMEOUT"
+SESSION_OUTCOME_PATTERN_ENVIRONMENT_VARIABLE = "SYRUP_SESSION_OUTCOME_PATTERN"
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description="Run record and replay jobs in a long lived GDB")
+	parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket the session listens on")
+	commands = parser.add_subparsers(dest="command", required=True)
+	start = commands.add_parser("start", help="start a session and wait for it to be stopped")
+	start.add_argument("--gdb", default="gdb", help="GDB executable to run")
+	start.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds allowed for each job")
+	start.add_argument("--outcome-pattern", default=DEFAULT_OUTCOME_PATTERN,
+		help="regular expression whose first group is the value reported for each job")
+	submit = commands.add_parser("submit", help="run the jobs in a file in the session")
+	submit.add_argument("jobs", help="JSON Lines file of jobs")
+	submit.add_argument("--json", help="also write the results to this file")
+	commands.add_parser("stop", help="stop the session")
+	return parser.parse_args()
+
+def start(arguments):
+	environment = dict(os.environ)
+	environment[SOCKET_ENVIRONMENT_VARIABLE] = os.path.abspath(arguments.socket)
+	environment[SESSION_TIMEOUT_ENVIRONMENT_VARIABLE] = str(arguments.timeout)
+	environment[SESSION_OUTCOME_PATTERN_ENVIRONMENT_VARIABLE] = arguments.outcome_pattern
+	# stdin is kept open so that GDB keeps running its event loop until the
+	# session is stopped, rather than quitting at the end of its input.
+	process = subprocess.Popen(
+		[arguments.gdb, "-nx", "-q", "-x", SESSION_SERVER_SCRIPT],
+		stdin=subprocess.PIPE,
+		env=environment
+	)
+	return_code = process.wait()
+	process.stdin.close()
+	return return_code
+
+def read_jobs(jobs_file_name):
+	with open(jobs_file_name) as jobs_file:
+		for line in jobs_file:
+			if line.strip():
+				yield Job(**json.loads(line))
+
+def print_result(result):
+	outcome = result.outcome
+	print(f"{result.job.kind} {result.job.trace}: {outcome.status}, exit code {outcome.exit_code}, "
+		f"value {outcome.value}, "
+		f"{result.stop_count} stops in {result.seconds:.2f}s", flush=True)
+
+def submit(arguments):
+	results = []
+	with SessionClient(arguments.socket) as client:
+		for job in read_jobs(arguments.jobs):
+			result = client.run(job)
+			print_result(result)
+			results.append(result)
+	if arguments.json is not None:
+		with open(arguments.json, "w+") as json_file:
+			json.dump([
+				{
+					"job": result.job._asdict(),
+					**result.outcome._asdict(),
+					"stops": result.stop_count,
+					"seconds": round(result.seconds, 4)
+				}
+				for result in results
+			], json_file, indent=2)
+	return 0
+
+def stop(arguments):
+	with SessionClient(arguments.socket) as client:
+		client.shut_down()
+	return 0
+
+def main():
+	arguments = parse_arguments()
+	commands = {"start": start, "submit": submit, "stop": stop}
+	sys.exit(commands[arguments.command](arguments))
+
+if __name__ == "__main__":
+	main()
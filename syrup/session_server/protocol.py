@@ -0,0 +1,57 @@
+#!/bin/python3
+import json
+from orchestrator.orchestrator import Job, JobResult, JOB_RECORD, JOB_REPLAY
+from explorer.explorer import Outcome
+
+SOCKET_ENVIRONMENT_VARIABLE = "SYRUP_SESSION_SOCKET"
+DEFAULT_SOCKET = "./syrup-session.sock"
+REQUEST_KIND_TAG = "kind"
+REQUEST_SHUTDOWN = "shutdown"
+ERROR_TAG = "error"
+
+class SessionError(Exception):
+	pass
+
+# Requests and results are sent as JSON, one to a line. A request is either a
+# job, written as in the jobs files of orchestrate.py, or a request to shut the
+# session down. Each job is answered with its result, or with an error if it
+# could not be read.
+def encode_job(job):
+	return json.dumps(job._asdict()) + "\n"
+
+def encode_shutdown():
+	return json.dumps({REQUEST_KIND_TAG: REQUEST_SHUTDOWN}) + "\n"
+
+def is_shutdown(request):
+	return isinstance(request, dict) and request.get(REQUEST_KIND_TAG) == REQUEST_SHUTDOWN
+
+def decode_job(request):
+	try:
+		job = Job(**request)
+	except TypeError as exception:
+		raise SessionError(f"{request} is not a job: {exception}")
+	if job.kind not in (JOB_RECORD, JOB_REPLAY):
+		raise SessionError(f"Unknown job kind {job.kind}")
+	return job
+
+def encode_result(result):
+	return json.dumps({
+		"job": result.job._asdict(),
+		**result.outcome._asdict(),
+		"stops": result.stop_count,
+		"seconds": round(result.seconds, 4)
+	}) + "\n"
+
+def encode_error(message):
+	return json.dumps({ERROR_TAG: message}) + "\n"
+
+def decode_result(line):
+	result = json.loads(line)
+	if ERROR_TAG in result:
+		raise SessionError(result[ERROR_TAG])
+	return JobResult(
+		Job(**result["job"]),
+		Outcome(result["status"], result["exit_code"], result["value"]),
+		result["stops"],
+		result["seconds"]
+	)
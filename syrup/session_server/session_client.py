@@ -0,0 +1,34 @@
+#!/bin/python3
+import socket
+from session_server.protocol import encode_job, encode_shutdown, decode_result, SessionError, \
+		DEFAULT_SOCKET
+
+# Sends jobs to a session server one at a time, waiting for the result of each,
+# as the server runs them one after another in its GDB anyway.
+class SessionClient:
+	def __init__(self, socket_path=DEFAULT_SOCKET):
+		self._socket_path = socket_path
+		self._socket = None
+		self._stream = None
+
+	def __enter__(self):
+		self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._socket.connect(self._socket_path)
+		self._stream = self._socket.makefile("rw")
+		return self
+
+	def __exit__(self, *_):
+		self._stream.close()
+		self._socket.close()
+
+	def run(self, job):
+		self._stream.write(encode_job(job))
+		self._stream.flush()
+		line = self._stream.readline()
+		if not line:
+			raise SessionError("The session server closed the connection")
+		return decode_result(line)
+
+	def shut_down(self):
+		self._stream.write(encode_shutdown())
+		self._stream.flush()
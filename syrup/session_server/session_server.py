@@ -0,0 +1,230 @@
+#!/bin/python3
+import gdb
+import functools
+import importlib.util
+import json
+import os
+import queue
+import re
+import shlex
+import signal
+import socket
+import tempfile
+import threading
+import time
+from gdb_wrapper import gdb_wrapper
+from logger.logger import log, error
+from metrics import metrics
+from orchestrator.orchestrator import JobResult, script_and_environment, JOB_RECORD, JOB_REPLAY
+from explorer.explorer import Outcome, DEFAULT_OUTCOME_PATTERN, DEFAULT_TIMEOUT, DIVERGENCE_EXIT_CODE, STATUS_EXITED, \
+		STATUS_FAILED, STATUS_TIMED_OUT, STATUS_DIVERGED
+from session_server.protocol import decode_job, encode_result, encode_error, is_shutdown, \
+		SessionError, DEFAULT_SOCKET
+
+# Runs record and replay jobs one after another in a single GDB, which keeps
+# the symbols of the programs it has loaded rather than reading them again for
+# every job, and only loads a program again when a job is for another one.
+#
+# Jobs are read from the clients of a Unix socket, one client at a time, by a
+# thread of the server's own, and handed to GDB's thread through its event
+# queue, as the rest of GDB can only be used from there. Each job sources its
+# script afresh with the job's settings in the environment, and runs until the
+# script would quit GDB, which calls the quit handler instead. Between jobs,
+# pending actions are dropped, listeners disconnected, breakpoints deleted, the
+# inferior killed if it is still running, so the next job re-runs it from the
+# start, and the scheduler unlocked. Settings read when the shared modules are
+# first imported, such as the log level, stay those of the server.
+#
+# The inferior of each job writes its output to a file of its own, which is
+# echoed once the job finishes, and the value of the job's outcome is found in
+# it with outcome_pattern, as orchestrate.py finds it in the output of its GDB.
+#
+# A job that times out is usually waiting for its inferior, which keeps GDB
+# from running the events posted to it, so the socket thread kills the
+# inferior itself before posting the abandoning of the job.
+class SessionServer:
+	def __init__(self, socket_path=DEFAULT_SOCKET, timeout=DEFAULT_TIMEOUT,
+			outcome_pattern=DEFAULT_OUTCOME_PATTERN):
+		self._socket_path = socket_path
+		self._timeout = timeout
+		self._outcome_pattern = re.compile(outcome_pattern)
+		self._listening_socket = None
+		self._results = queue.Queue()
+		self._job_number = 0
+		self._running_job = None
+		self._running_job_number = None
+		self._started_at = None
+		self._saved_environment = None
+		self._stop_count = 0
+		self._inferior_pid = None
+		self._output_file_name = None
+
+	def start(self):
+		if os.path.exists(self._socket_path):
+			os.unlink(self._socket_path)
+		self._listening_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._listening_socket.bind(self._socket_path)
+		self._listening_socket.listen()
+		# Connected directly, so that resetting GDB between jobs leaves it
+		gdb.events.stop.connect(self._count_stop)
+		gdb_wrapper.set_quit_handler(self._finish_job)
+		threading.Thread(target=self._serve, daemon=True).start()
+		log(f"Serving record and replay jobs on {self._socket_path}")
+
+	# Socket thread
+	def _serve(self):
+		while True:
+			connection, _ = self._listening_socket.accept()
+			with connection, connection.makefile("rw") as stream:
+				for line in stream:
+					if not line.strip():
+						continue
+					try:
+						request = json.loads(line)
+						if is_shutdown(request):
+							gdb.post_event(self._shut_down)
+							return
+						stream.write(encode_result(self._run(decode_job(request))))
+					except (ValueError, SessionError) as exception:
+						stream.write(encode_error(str(exception)))
+					stream.flush()
+
+	# Jobs are numbered so that the result of a job that finishes after it
+	# timed out is not taken for the result of the next one.
+	def _run(self, job):
+		self._job_number += 1
+		job_number = self._job_number
+		started_at = time.perf_counter()
+		gdb.post_event(functools.partial(self._start_job, job, job_number))
+		while True:
+			timeout = self._timeout - (time.perf_counter() - started_at)
+			try:
+				result_job_number, result = self._results.get(timeout=max(timeout, 0))
+			except queue.Empty:
+				self._kill_inferior()
+				gdb.post_event(functools.partial(self._abandon_job, job_number))
+				return JobResult(job, Outcome(STATUS_TIMED_OUT, None, None), 0, time.perf_counter() - started_at)
+			if result_job_number == job_number:
+				return result
+
+	# The pid is the one GDB reported at the last stop of the job, as GDB
+	# cannot be asked from this thread.
+	def _kill_inferior(self):
+		inferior_pid = self._inferior_pid
+		if inferior_pid is None:
+			return
+		try:
+			os.kill(inferior_pid, signal.SIGKILL)
+		except ProcessLookupError:
+			pass
+
+	# GDB's thread
+	def _start_job(self, job, job_number):
+		self._reset()
+		log(f"Running the {job.kind} of {job.trace} with {job.program}")
+		script, environment = script_and_environment(job)
+		self._running_job = job
+		self._running_job_number = job_number
+		self._started_at = time.perf_counter()
+		self._stop_count = 0
+		self._inferior_pid = None
+		output_file, self._output_file_name = tempfile.mkstemp(prefix="syrup-session-", suffix=".out")
+		os.close(output_file)
+		self._saved_environment = dict(os.environ)
+		os.environ.clear()
+		os.environ.update(environment)
+		metrics.reset()
+		try:
+			self._load_program(job)
+			load_script(script).main()
+		except (gdb.error, OSError, ValueError) as exception:
+			error(f"The {job.kind} of {job.trace} failed: {exception}")
+			self._finish_job(None, STATUS_FAILED)
+
+	def _finish_job(self, exit_code, status=STATUS_EXITED):
+		if self._running_job is None:
+			return
+		job = self._running_job
+		self._running_job = None
+		metrics.write_pending_summary()
+		os.environ.clear()
+		os.environ.update(self._saved_environment)
+		output = self._read_inferior_output()
+		if status == STATUS_EXITED:
+			exit_code = 0 if exit_code is None else exit_code
+			status = job_status(job, exit_code)
+		value = None
+		if status == STATUS_EXITED:
+			value_match = self._outcome_pattern.search(output)
+			value = None if value_match is None else value_match.group(1)
+		result = JobResult(
+			job,
+			Outcome(status, exit_code, value),
+			self._stop_count,
+			time.perf_counter() - self._started_at
+		)
+		log(f"The {job.kind} of {job.trace} finished: {status}")
+		self._results.put((self._running_job_number, result))
+
+	def _read_inferior_output(self):
+		if self._output_file_name is None:
+			return ""
+		try:
+			with open(self._output_file_name, errors="replace") as output_file:
+				output = output_file.read()
+			os.remove(self._output_file_name)
+		except OSError:
+			output = ""
+		self._output_file_name = None
+		gdb.write(output)
+		return output
+
+	def _abandon_job(self, job_number):
+		if self._running_job is not None and self._running_job_number == job_number:
+			self._finish_job(None, STATUS_TIMED_OUT)
+			self._reset()
+
+	def _load_program(self, job):
+		program = os.path.realpath(job.program)
+		progspace_program = gdb.current_progspace().filename
+		if progspace_program is None or os.path.realpath(progspace_program) != program:
+			gdb_wrapper.immediate_execute(f"file {program}")
+		arguments = " ".join(shlex.quote(str(argument)) for argument in job.arguments)
+		gdb_wrapper.immediate_execute(f"set args {arguments} > {shlex.quote(self._output_file_name)}")
+
+	# Replays lock the scheduler, which a fresh GDB does not.
+	def _reset(self):
+		gdb_wrapper.reset()
+		if len(gdb.selected_inferior().threads()) > 0:
+			gdb_wrapper.immediate_execute("kill")
+		gdb_wrapper.immediate_execute("set scheduler-locking off")
+
+	def _count_stop(self, _):
+		self._stop_count += 1
+		self._inferior_pid = gdb.selected_inferior().pid or None
+
+	def _shut_down(self):
+		log("Shutting the session down")
+		self._reset()
+		self._listening_socket.close()
+		os.unlink(self._socket_path)
+		gdb_wrapper.set_quit_handler(None)
+		gdb_wrapper.immediate_execute("quit")
+
+# Recordings have worked if they wrote their trace, and replays end with the
+# exit code of the inferior unless they diverged.
+def job_status(job, exit_code):
+	if job.kind == JOB_RECORD and not os.path.isfile(job.trace):
+		return STATUS_FAILED
+	if job.kind == JOB_REPLAY and exit_code == DIVERGENCE_EXIT_CODE:
+		return STATUS_DIVERGED
+	return STATUS_EXITED
+
+# Scripts are loaded as new modules each time, so that they read the settings
+# in the environment again.
+def load_script(script):
+	module_name = os.path.splitext(os.path.basename(script))[0].replace("-", "_")
+	spec = importlib.util.spec_from_file_location(module_name, script)
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
@@ -0,0 +1,263 @@
+#!/bin/python3
+import gdb
+import collections
+import re
+from logger.logger import log, debug, warning
+
+SHARED_VARIABLE_TAG = "variable"
+ACCESS_TAG = "access"
+ACCESS_READ = "read"
+ACCESS_WRITE = "write"
+ACCESS_READ_WRITE = "read_write"
+THREAD_CREATION_FUNCTION = "pthread_create"
+START_ROUTINE_ARGUMENT_REGISTERS = ("%rdx", "%edx")
+SHARED_DATA_SECTIONS = (".data", ".bss")
+TEXT_SECTION = ".text"
+MAXIMUM_ARGUMENT_SEARCH_DISTANCE = 16
+
+_SECTION_PATTERN = re.compile(r"^\s*(0x[0-9a-f]+) - (0x[0-9a-f]+) is (\S+)$")
+_INSTRUCTION_PATTERN = re.compile(
+	r"^\s*(?:=>)?\s*(0x[0-9a-f]+)\s+<([^>+]+)(?:\+(\d+))?>:\s*(.*)$"
+)
+_REFERENCE_PATTERN = re.compile(r"#\s*(0x[0-9a-f]+)(?:\s+<([^>+]+)(?:\+\d+)?>)?")
+_ABSOLUTE_OPERAND_PATTERN = re.compile(r"^(?:%\w+:)?(0x[0-9a-f]+)$")
+_IMMEDIATE_OPERAND_PATTERN = re.compile(r"^\$(0x[0-9a-f]+)$")
+_CALL_TARGET_PATTERN = re.compile(r"^(0x[0-9a-f]+)\s+<([^>+]+)(?:\+\d+)?>$")
+_REGISTER_PATTERN = re.compile(r"^%\w+$")
+
+# Mnemonics whose destination operand is only written to. Any other
+# instruction with a memory destination also reads it first.
+_WRITE_ONLY_MNEMONICS = ("mov", "set", "stos", "pop", "cvt")
+# Mnemonics that only read their memory operand, and those that read and write
+# it wherever it appears, both without their size suffix. They are compared
+# exactly, as cmpxchg or bts would otherwise be taken for cmp or bt.
+_READ_ONLY_MNEMONICS = {"cmp", "cmps", "test", "bt", "push", "ucomiss", "ucomisd", "comiss", "comisd"}
+_READ_WRITE_MNEMONICS = {"cmpxchg", "cmpxchg8b", "cmpxchg16b", "xadd", "xchg", "bts", "btr", "btc"}
+_SIZE_SUFFIXES = "bwlq"
+_NON_ACCESSING_MNEMONICS = ("lea", "nop", "prefetch", "endbr")
+_PREFIXES = ("lock", "rep", "repz", "repnz", "repe", "repne", "data16", "cs", "ds", "notrack", "bnd")
+
+class Instruction:
+	def __init__(self, address, function, mnemonic, operands, reference):
+		self.address = address
+		self.function = function
+		self.mnemonic = mnemonic
+		self.operands = operands
+		self.reference = reference
+
+	def location(self):
+		return f"*{hex(self.address)}"
+
+# Finds the functions passed to pthread_create, by looking back from each call
+# for the instruction that loads its third argument. Position independent
+# executables load it relative to the instruction pointer, which GDB annotates
+# with the function, while other executables load its address as an immediate,
+# which is looked up among the functions disassembled.
+def discover_start_routines():
+	start_routines = []
+	instructions_by_function = _instructions_by_function(_main_text_instructions())
+	functions_by_address = {
+		function_instructions[0].address: function
+		for function, function_instructions in instructions_by_function.items()
+	}
+	for function_instructions in instructions_by_function.values():
+		for index, instruction in enumerate(function_instructions):
+			if not _is_call_to(instruction, THREAD_CREATION_FUNCTION):
+				continue
+			start_routine = _start_routine_argument(function_instructions[:index], functions_by_address)
+			if start_routine is None:
+				warning("Could not find the start routine passed at %s", instruction.location())
+			elif start_routine not in start_routines:
+				start_routines.append(start_routine)
+	log(f"Discovered thread start routines {start_routines}")
+	return start_routines
+
+# Finds the instructions that access global data from the start routines and
+# every function of the program that they call. The result maps the location of
+# each instruction to the variable it accesses and how it accesses it. Given a
+# list of functions, only the accesses inside them are kept, although the
+# functions they are reached through are still followed.
+def discover_shared_variable_accesses(start_routines, functions=None):
+	instructions = _main_text_instructions()
+	instructions_by_function = _instructions_by_function(instructions)
+	shared_data_ranges = _main_section_ranges(SHARED_DATA_SECTIONS)
+	shared_variable_accesses = {}
+	for function in _reachable_functions(start_routines, instructions_by_function):
+		if functions is not None and function not in functions:
+			continue
+		for instruction in instructions_by_function[function]:
+			access = _shared_variable_access(instruction, shared_data_ranges)
+			if access is not None:
+				debug("Shared variable access at %s: %s", instruction.location(), access)
+				shared_variable_accesses[instruction.location()] = access
+	log(f"Discovered {len(shared_variable_accesses)} shared variable accesses")
+	return shared_variable_accesses
+
+def _reachable_functions(start_routines, instructions_by_function):
+	reachable_functions = []
+	functions_to_visit = collections.deque(start_routines)
+	while len(functions_to_visit) > 0:
+		function = functions_to_visit.popleft()
+		if function in reachable_functions or function not in instructions_by_function:
+			continue
+		reachable_functions.append(function)
+		for instruction in instructions_by_function[function]:
+			callee = _call_target(instruction)
+			if callee is not None:
+				functions_to_visit.append(callee)
+	return reachable_functions
+
+def _shared_variable_access(instruction, shared_data_ranges):
+	if instruction.mnemonic.startswith(_NON_ACCESSING_MNEMONICS) or \
+			_call_target(instruction) is not None or instruction.mnemonic.startswith("j"):
+		return None
+	for operand_index, operand in enumerate(instruction.operands):
+		address, variable = _memory_operand_target(operand, instruction.reference)
+		if address is None or not _is_in_ranges(address, shared_data_ranges):
+			continue
+		is_destination = operand_index == len(instruction.operands) - 1
+		return {
+			SHARED_VARIABLE_TAG: variable or hex(address),
+			ACCESS_TAG: _access_kind(instruction, is_destination)
+		}
+	return None
+
+def _access_kind(instruction, is_destination):
+	mnemonic = _mnemonic_without_size_suffix(instruction.mnemonic)
+	if mnemonic in _READ_WRITE_MNEMONICS:
+		return ACCESS_READ_WRITE
+	if mnemonic in _READ_ONLY_MNEMONICS:
+		return ACCESS_READ
+	if not is_destination:
+		return ACCESS_READ
+	if instruction.mnemonic.startswith(_WRITE_ONLY_MNEMONICS) and len(instruction.operands) > 1:
+		return ACCESS_WRITE
+	if instruction.mnemonic.startswith("pop"):
+		return ACCESS_WRITE
+	return ACCESS_READ_WRITE
+
+def _mnemonic_without_size_suffix(mnemonic):
+	if mnemonic in _READ_ONLY_MNEMONICS or mnemonic in _READ_WRITE_MNEMONICS:
+		return mnemonic
+	if len(mnemonic) > 1 and mnemonic[-1] in _SIZE_SUFFIXES:
+		return mnemonic[:-1]
+	return mnemonic
+
+# GDB annotates position independent references with the address they resolve
+# to, while absolute references appear as a bare address operand.
+def _memory_operand_target(operand, reference):
+	if operand.startswith("$") or _REGISTER_PATTERN.match(operand):
+		return None, None
+	if "(%rip)" in operand and reference is not None:
+		return reference
+	match = _ABSOLUTE_OPERAND_PATTERN.match(operand)
+	if match is not None:
+		return int(match.group(1), 16), None
+	return None, None
+
+def _start_routine_argument(preceding_instructions, functions_by_address):
+	argument_registers = START_ROUTINE_ARGUMENT_REGISTERS
+	searched_instructions = preceding_instructions[-MAXIMUM_ARGUMENT_SEARCH_DISTANCE:]
+	for instruction in reversed(searched_instructions):
+		if _call_target(instruction) is not None or len(instruction.operands) != 2:
+			continue
+		source, destination = instruction.operands
+		if destination not in argument_registers:
+			continue
+		if instruction.reference is not None and instruction.reference[1] is not None:
+			return instruction.reference[1]
+		immediate = _IMMEDIATE_OPERAND_PATTERN.match(source)
+		if immediate is not None:
+			return functions_by_address.get(int(immediate.group(1), 16))
+		if _REGISTER_PATTERN.match(source):
+			argument_registers = _register_aliases(source)
+			continue
+		return None
+	return None
+
+def _register_aliases(register):
+	name = register.lstrip("%")
+	if name.startswith("r") and name[1:2].isdigit():
+		return (f"%{name.rstrip('d')}", f"%{name.rstrip('d')}d")
+	base = name[1:] if name[0] in "re" else name
+	return (f"%r{base}", f"%e{base}")
+
+def _is_call_to(instruction, function):
+	callee = _call_target(instruction)
+	return callee is not None and callee.split("@")[0] == function
+
+def _call_target(instruction):
+	if not instruction.mnemonic.startswith("call") or len(instruction.operands) != 1:
+		return None
+	match = _CALL_TARGET_PATTERN.match(instruction.operands[0])
+	return None if match is None else match.group(2)
+
+def _is_in_ranges(address, ranges):
+	return any(start <= address < end for start, end in ranges)
+
+# Disassembly
+def _main_text_instructions():
+	instructions = []
+	for start, end in _main_section_ranges((TEXT_SECTION,)):
+		disassembly = gdb.execute(f"disassemble {hex(start)},{hex(end)}", to_string=True)
+		instructions.extend(filter(None, map(_parse_instruction, disassembly.splitlines())))
+	return instructions
+
+def _instructions_by_function(instructions):
+	instructions_by_function = collections.OrderedDict()
+	for instruction in instructions:
+		instructions_by_function.setdefault(instruction.function, []).append(instruction)
+	return instructions_by_function
+
+def _parse_instruction(line):
+	match = _INSTRUCTION_PATTERN.match(line)
+	if match is None:
+		return None
+	text, _, comment = match.group(4).partition("#")
+	words = text.split(None, 1)
+	while len(words) > 0 and words[0] in _PREFIXES:
+		words = words[1].split(None, 1) if len(words) > 1 else []
+	if len(words) == 0:
+		return None
+	operands = _split_operands(words[1]) if len(words) > 1 else []
+	return Instruction(
+		int(match.group(1), 16),
+		match.group(2),
+		words[0],
+		operands,
+		_parse_reference("#" + comment) if comment else None
+	)
+
+def _parse_reference(comment):
+	match = _REFERENCE_PATTERN.search(comment)
+	if match is None:
+		return None
+	return int(match.group(1), 16), match.group(2)
+
+def _split_operands(text):
+	operands = []
+	depth = 0
+	current = ""
+	for character in text.strip():
+		if character == "(":
+			depth += 1
+		elif character == ")":
+			depth -= 1
+		if character == "," and depth == 0:
+			operands.append(current.strip())
+			current = ""
+		else:
+			current += character
+	if current.strip():
+		operands.append(current.strip())
+	return operands
+
+# The sections of the program itself are listed by "info files" without the
+# name of the object file they belong to.
+def _main_section_ranges(section_names):
+	ranges = []
+	for line in gdb.execute("info files", to_string=True).splitlines():
+		match = _SECTION_PATTERN.match(line)
+		if match is not None and match.group(3) in section_names:
+			ranges.append((int(match.group(1), 16), int(match.group(2), 16)))
+	return ranges
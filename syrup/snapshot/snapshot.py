@@ -0,0 +1,83 @@
+#!/bin/python3
+import gdb
+import re
+from logger.logger import log
+
+SNAPSHOT_TAG = "snapshot"
+REGISTERS_TAG = "registers"
+MEMORY_TAG = "memory"
+SNAPSHOT_SHARED_VARIABLES_TAG = "snapshot_shared_variables"
+DEFAULT_BYTE_ORDER = "little"
+
+_ENDIANNESS_PATTERN = re.compile(r"\b(big|little) endian")
+
+# Takes snapshots of registers and shared variables as checkpoints are hit.
+# Registers are read from the frame of the thread that hit the checkpoint and
+# shared variables straight from the memory of the inferior, so taking a
+# snapshot does not run any GDB commands. Snapshots are taken from inside
+# Breakpoint.stop(), which must not switch threads, so the registers of other
+# threads are not read.
+#
+# Shared variables are given as a mapping from their name to their size in
+# bytes. Their addresses, and whether they are signed, are looked up once when
+# the snapshotter is made, and they are read in the byte order of the target.
+class Snapshotter:
+	def __init__(self, registers, shared_variables, every_nth_checkpoint=1):
+		self._registers = registers
+		self._shared_variable_addresses = {
+			name: (_address_of(name), size, _is_signed(name)) for name, size in shared_variables.items()
+		}
+		self._byte_order = target_byte_order() if len(shared_variables) > 0 else DEFAULT_BYTE_ORDER
+		self._every_nth_checkpoint = every_nth_checkpoint
+		self._checkpoint_count = 0
+		log(f"Taking snapshots of registers {registers} and shared variables "
+			f"{list(shared_variables)} every {every_nth_checkpoint} checkpoints")
+
+	def is_enabled(self):
+		return len(self._registers) > 0 or len(self._shared_variable_addresses) > 0
+
+	# Returns the snapshot to record with the checkpoint that has just been hit,
+	# or None when this checkpoint is not sampled.
+	def snapshot(self):
+		checkpoint_count = self._checkpoint_count
+		self._checkpoint_count += 1
+		if checkpoint_count % self._every_nth_checkpoint != 0:
+			return None
+		snapshot = {}
+		if len(self._registers) > 0:
+			snapshot[REGISTERS_TAG] = self._register_values()
+		if len(self._shared_variable_addresses) > 0:
+			snapshot[MEMORY_TAG] = self.shared_variable_values()
+		return snapshot
+
+	def _register_values(self):
+		thread = gdb.selected_thread()
+		frame = gdb.selected_frame()
+		return {str(thread.num): {register: int(frame.read_register(register)) for register in self._registers}}
+
+	def shared_variable_values(self):
+		inferior = gdb.selected_inferior()
+		return {
+			name: int.from_bytes(bytes(inferior.read_memory(address, size)), self._byte_order, signed=is_signed)
+			for name, (address, size, is_signed) in self._shared_variable_addresses.items()
+		}
+
+def target_byte_order():
+	match = _ENDIANNESS_PATTERN.search(gdb.execute("show endian", to_string=True))
+	return DEFAULT_BYTE_ORDER if match is None else match.group(1)
+
+# Taking the address works for variables without debugging information too.
+def _address_of(name):
+	return int(gdb.parse_and_eval(f"(long) &{name}"))
+
+# Variables are taken to be signed, as counters usually are, unless their type
+# says otherwise. GDB knows no type for variables without debugging
+# information, and versions before 12 cannot tell whether a type is signed.
+def _is_signed(name):
+	symbol = gdb.lookup_global_symbol(name) or gdb.lookup_static_symbol(name)
+	if symbol is None or symbol.type is None:
+		return True
+	try:
+		return symbol.type.strip_typedefs().is_signed
+	except (AttributeError, ValueError):
+		return True
@@ -0,0 +1,108 @@
+#!/bin/python3
+import json
+import re
+
+VARIABLES_TAG = "variables"
+FUNCTIONS_TAG = "functions"
+ADDRESS_RANGES_TAG = "address_ranges"
+IGNORED_LIBRARIES_TAG = "ignore_libraries"
+THREAD_CREATIONS_TAG = "thread_creations"
+
+_ADDRESS_RANGE_PATTERN = re.compile(
+	r"^(?:(?P<module>.+?)\+)?(?P<start>0x[0-9a-fA-F]+)-(?P<end>0x[0-9a-fA-F]+)$"
+)
+
+# What to record checkpoints at, out of the sites that are discovered in the
+# program. Each list that is given narrows the sites down, and an empty list
+# leaves them all in:
+#
+#	variables: names of the shared variables whose accesses are recorded
+#	functions: functions whose accesses, and thread starts, are recorded
+#	address_ranges: ranges of the sites to record, such as
+#		"a.out+0x1100-0x1200" as offsets into a module or
+#		"0x555555555100-0x555555555200" as live addresses
+#	ignore_libraries: names of modules, such as "libc.so.6", none of whose
+#		sites are recorded
+#	thread_creations: whether the clone sites that threads return to after
+#		creating a thread are recorded, which they are by default as replay
+#		needs them to create each thread before switching to it. They are
+#		left out by ignoring their library, but not by the address ranges.
+class TargetSpec:
+	def __init__(self, variables=(), functions=(), address_ranges=(), ignore_libraries=(),
+			thread_creations=True):
+		self.variables = list(variables)
+		self.functions = list(functions)
+		self.address_ranges = list(address_ranges)
+		self.ignore_libraries = list(ignore_libraries)
+		self.thread_creations = thread_creations
+		self._parsed_address_ranges = list(map(parse_address_range, self.address_ranges))
+
+	@classmethod
+	def from_dictionary(cls, dictionary):
+		unknown_keys = set(dictionary).difference(
+			[VARIABLES_TAG, FUNCTIONS_TAG, ADDRESS_RANGES_TAG, IGNORED_LIBRARIES_TAG, THREAD_CREATIONS_TAG]
+		)
+		if len(unknown_keys) > 0:
+			raise ValueError(f"Unknown target spec entries {sorted(unknown_keys)}")
+		return cls(
+			dictionary.get(VARIABLES_TAG, ()),
+			dictionary.get(FUNCTIONS_TAG, ()),
+			dictionary.get(ADDRESS_RANGES_TAG, ()),
+			dictionary.get(IGNORED_LIBRARIES_TAG, ()),
+			dictionary.get(THREAD_CREATIONS_TAG, True)
+		)
+
+	@classmethod
+	def load(cls, target_spec_file_name):
+		with open(target_spec_file_name) as target_spec_file:
+			return cls.from_dictionary(json.load(target_spec_file))
+
+	def as_dictionary(self):
+		return {
+			VARIABLES_TAG: self.variables,
+			FUNCTIONS_TAG: self.functions,
+			ADDRESS_RANGES_TAG: self.address_ranges,
+			IGNORED_LIBRARIES_TAG: self.ignore_libraries,
+			THREAD_CREATIONS_TAG: self.thread_creations
+		}
+
+	def save(self, target_spec_file_name):
+		with open(target_spec_file_name, "w+") as target_spec_file:
+			json.dump(self.as_dictionary(), target_spec_file, indent=2)
+
+	def includes_variable(self, variable):
+		return len(self.variables) == 0 or variable in self.variables
+
+	def includes_function(self, function):
+		return len(self.functions) == 0 or function in self.functions
+
+	# Sites are given by the module they are in, or None if they are in none,
+	# and either their offset into it or, without a module, their address.
+	def includes_site(self, module, offset, address):
+		if module in self.ignore_libraries:
+			return False
+		if len(self._parsed_address_ranges) == 0:
+			return True
+		for range_module, start, end in self._parsed_address_ranges:
+			if range_module is None and address is not None and start <= address < end:
+				return True
+			if range_module is not None and range_module == module and start <= offset < end:
+				return True
+		return False
+
+	def includes_thread_creation_site(self, module):
+		return self.thread_creations and module not in self.ignore_libraries
+
+	def __str__(self):
+		return json.dumps(self.as_dictionary())
+
+# Returns the module, start and end of a range, where the module is None for a
+# range of live addresses.
+def parse_address_range(address_range):
+	match = _ADDRESS_RANGE_PATTERN.match(address_range)
+	if match is None:
+		raise ValueError(f"{address_range} is not an address range such as a.out+0x1100-0x1200")
+	start, end = int(match.group("start"), 16), int(match.group("end"), 16)
+	if end <= start:
+		raise ValueError(f"Address range {address_range} is empty")
+	return match.group("module"), start, end
@@ -0,0 +1,125 @@
+#!/bin/python3
+import collections
+import gdb
+from logger.logger import debug, warning
+
+# Threads are kept by both of their GDB numbers, as traces record the number of
+# a thread within its inferior while breakpoints and the thread command on
+# several inferiors need its global number. Numbers are kept rather than the
+# InferiorThread objects, since the objects cannot be read once threads exit.
+RegisteredThread = collections.namedtuple("RegisteredThread", ["num", "global_num"])
+ThreadCreation = collections.namedtuple("ThreadCreation", ["creator", "created"])
+
+# Keeps track of the threads of the inferior from the new_thread events GDB
+# fires as they are created, rather than listing every thread on each event.
+# GDB fires new_thread while the thread that made the clone syscall is
+# selected, so that thread is recorded as the creator. The creator is None for
+# the threads that were already there and for threads found late.
+#
+# GDB numbers threads in the order it sees them, so a thread that is numbered
+# past the next expected number means a new_thread event was missed, such as
+# while no listener was connected. The threads are only listed then, and the
+# missed threads are registered before the one in the event, in order.
+class ThreadRegistry:
+	def __init__(self):
+		self._threads = {}
+		self._creations = []
+		self._creator_by_created = {}
+		self._created_by_creator = collections.defaultdict(list)
+		self._exited_threads = set()
+		self._next_global_num = None
+		for thread in sorted(_inferior_threads(), key=lambda thread: thread.global_num):
+			self._register(thread)
+
+	# Returns the threads that were registered, in the order they were created,
+	# which is only the created thread unless new_thread events were missed.
+	def add_created_thread(self, created_thread):
+		if created_thread.global_num in self._threads:
+			return []
+		creator = self._creator(created_thread)
+		registered_threads = []
+		if self._next_global_num is not None and created_thread.global_num > self._next_global_num:
+			registered_threads.extend(self._register_missed_threads(created_thread.global_num))
+		registered_thread = self._register(created_thread)
+		self._record_creation(creator, registered_thread)
+		registered_threads.append(registered_thread)
+		return registered_threads
+
+	def new_thread(self, event):
+		return self.add_created_thread(event.inferior_thread)
+
+	def thread_exited(self, event):
+		self.mark_exited(event.inferior_thread.global_num)
+
+	def mark_exited(self, global_num):
+		if global_num in self._threads:
+			self._exited_threads.add(global_num)
+
+	def creations(self):
+		return self._creations
+
+	def creator_of(self, global_num):
+		return self._creator_by_created.get(global_num)
+
+	def created_by(self, global_num):
+		return self._created_by_creator.get(global_num, [])
+
+	def is_alive(self, global_num):
+		return global_num in self._threads and global_num not in self._exited_threads
+
+	# Without thread_exited events, exits are only noticed here, from the
+	# threads GDB no longer knows about.
+	def alive_threads(self):
+		if not reports_thread_exits():
+			live_global_nums = set(thread.global_num for thread in _inferior_threads())
+			for global_num in self._threads:
+				if global_num not in live_global_nums:
+					self._exited_threads.add(global_num)
+		return [
+			thread for global_num, thread in self._threads.items()
+			if global_num not in self._exited_threads
+		]
+
+	def _register(self, thread):
+		registered_thread = RegisteredThread(thread.num, thread.global_num)
+		self._threads[thread.global_num] = registered_thread
+		if self._next_global_num is None or thread.global_num >= self._next_global_num:
+			self._next_global_num = thread.global_num + 1
+		return registered_thread
+
+	def _register_missed_threads(self, global_num):
+		missed_threads = sorted(
+			(
+				thread for thread in _inferior_threads()
+				if thread.global_num < global_num and thread.global_num not in self._threads
+			),
+			key=lambda thread: thread.global_num
+		)
+		if len(missed_threads) > 0:
+			warning("Found threads %s created without a new_thread event",
+				[thread.global_num for thread in missed_threads])
+		registered_threads = []
+		for thread in missed_threads:
+			registered_thread = self._register(thread)
+			self._record_creation(None, registered_thread)
+			registered_threads.append(registered_thread)
+		return registered_threads
+
+	def _record_creation(self, creator, created):
+		debug("Thread %s created thread %d", "?" if creator is None else creator.num, created.num)
+		self._creations.append(ThreadCreation(creator, created))
+		if creator is not None:
+			self._creator_by_created[created.global_num] = creator
+			self._created_by_creator[creator.global_num].append(created)
+
+	def _creator(self, created_thread):
+		selected_thread = gdb.selected_thread()
+		if selected_thread is None or selected_thread.global_num == created_thread.global_num:
+			return None
+		return self._threads.get(selected_thread.global_num)
+
+def reports_thread_exits():
+	return hasattr(gdb.events, "thread_exited")
+
+def _inferior_threads():
+	return gdb.selected_inferior().threads()
@@ -0,0 +1,194 @@
+#!/bin/python3
+import array
+import json
+import lzma
+import struct
+import sys
+import zlib
+
+ARCHIVE_MAGIC = b"SYRUPTRC"
+ARCHIVE_VERSION = 1
+COMPRESSION_NONE = "none"
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_LZMA = "lzma"
+CHECKPOINT_ID_TAG = "id"
+THREAD_ID_TAG = "thread"
+CHECKPOINT_LOCATION_TAG = "location"
+CHECKPOINT_ACTION_TAG = "action"
+
+_COMPRESSIONS = [COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_LZMA]
+_PREAMBLE = struct.Struct("<8sBB")
+_LENGTH = struct.Struct("<I")
+_ARCHIVE_TAG = "archive"
+_LOCATIONS_TAG = "locations"
+_ACTIONS_TAG = "actions"
+_CHECKPOINT_COUNT_TAG = "checkpoint_count"
+_COLUMNS_TAG = "columns"
+_EXTRAS_TAG = "extras"
+_COLUMN_TAGS = (CHECKPOINT_ID_TAG, THREAD_ID_TAG, CHECKPOINT_LOCATION_TAG, CHECKPOINT_ACTION_TAG)
+_UNSIGNED_TYPECODES = "BHILQ"
+
+# Trace archives store the checkpoints of a trace as columns rather than as one
+# record per checkpoint. Locations and actions are replaced by their index into
+# a dictionary of the distinct values, as only a few distinct locations are hit
+# thousands of times. Thread ids, and the ids of checkpoints when they are not
+# simply their positions, are stored as arrays of the smallest integer type
+# that fits them. The file is laid out as:
+#
+#   magic, version, compression
+#   compressed: header length, JSON header, each column in turn
+#
+# The JSON header holds the header of the trace along with the dictionaries
+# and the layout of the columns. Columns are stored little endian. Anything
+# else recorded with a checkpoint, such as a snapshot, is rare enough to be
+# kept in the header by the position of its checkpoint.
+class TraceArchive:
+	def __init__(self, header, locations, actions, threads, location_indices,
+			action_indices, ids=None, extras=None):
+		self.header = header
+		self.locations = locations
+		self.actions = actions
+		self.threads = threads
+		self.location_indices = location_indices
+		self.action_indices = action_indices
+		self.ids = ids
+		self.extras = extras or {}
+
+	@classmethod
+	def from_checkpoints(cls, header, checkpoints):
+		location_dictionary = {}
+		action_dictionary = {}
+		threads = []
+		location_indices = []
+		action_indices = []
+		ids = []
+		extras = {}
+		for position, checkpoint in enumerate(checkpoints):
+			threads.append(checkpoint[THREAD_ID_TAG])
+			location_indices.append(location_dictionary.setdefault(
+				checkpoint[CHECKPOINT_LOCATION_TAG], len(location_dictionary)
+			))
+			action_indices.append(action_dictionary.setdefault(
+				checkpoint.get(CHECKPOINT_ACTION_TAG, ""), len(action_dictionary)
+			))
+			ids.append(checkpoint[CHECKPOINT_ID_TAG])
+			extra = {tag: value for tag, value in checkpoint.items() if tag not in _COLUMN_TAGS}
+			if len(extra) > 0:
+				extras[position] = extra
+		ids_are_positions = all(position == id for position, id in enumerate(ids))
+		return cls(
+			header,
+			list(location_dictionary),
+			list(action_dictionary),
+			_smallest_array(threads),
+			_smallest_array(location_indices),
+			_smallest_array(action_indices),
+			None if ids_are_positions else _smallest_array(ids),
+			extras
+		)
+
+	@classmethod
+	def load(cls, archive_file_name):
+		with open(archive_file_name, "rb") as archive_file:
+			magic, version, compression = _PREAMBLE.unpack(archive_file.read(_PREAMBLE.size))
+			if magic != ARCHIVE_MAGIC:
+				raise ValueError(f"{archive_file_name} is not a trace archive")
+			if version != ARCHIVE_VERSION:
+				raise ValueError(f"Unsupported trace archive version {version}")
+			payload = _decompress(_COMPRESSIONS[compression], archive_file.read())
+		header_length, = _LENGTH.unpack_from(payload)
+		offset = _LENGTH.size + header_length
+		header = json.loads(payload[_LENGTH.size:offset])
+		archive_information = header.pop(_ARCHIVE_TAG)
+		columns = {}
+		for name, typecode in archive_information[_COLUMNS_TAG]:
+			column = array.array(typecode)
+			column_size = column.itemsize * archive_information[_CHECKPOINT_COUNT_TAG]
+			column.frombytes(payload[offset:offset + column_size])
+			if sys.byteorder == "big":
+				column.byteswap()
+			columns[name] = column
+			offset += column_size
+		return cls(
+			header,
+			archive_information[_LOCATIONS_TAG],
+			archive_information[_ACTIONS_TAG],
+			columns[THREAD_ID_TAG],
+			columns[CHECKPOINT_LOCATION_TAG],
+			columns[CHECKPOINT_ACTION_TAG],
+			columns.get(CHECKPOINT_ID_TAG),
+			{
+				int(position): extra
+				for position, extra in archive_information.get(_EXTRAS_TAG, {}).items()
+			}
+		)
+
+	def save(self, archive_file_name, compression=COMPRESSION_ZLIB):
+		columns = [
+			(THREAD_ID_TAG, self.threads),
+			(CHECKPOINT_LOCATION_TAG, self.location_indices),
+			(CHECKPOINT_ACTION_TAG, self.action_indices)
+		]
+		if self.ids is not None:
+			columns.append((CHECKPOINT_ID_TAG, self.ids))
+		header = json.dumps({
+			**self.header,
+			_ARCHIVE_TAG: {
+				_LOCATIONS_TAG: self.locations,
+				_ACTIONS_TAG: self.actions,
+				_CHECKPOINT_COUNT_TAG: len(self),
+				_COLUMNS_TAG: [(name, column.typecode) for name, column in columns],
+				_EXTRAS_TAG: self.extras
+			}
+		}, separators=(",", ":")).encode()
+		payload = [_LENGTH.pack(len(header)), header]
+		payload.extend(map(_little_endian_bytes, (column for _, column in columns)))
+		with open(archive_file_name, "wb") as archive_file:
+			archive_file.write(_PREAMBLE.pack(
+				ARCHIVE_MAGIC, ARCHIVE_VERSION, _COMPRESSIONS.index(compression)
+			))
+			archive_file.write(_compress(compression, b"".join(payload)))
+
+	def __len__(self):
+		return len(self.threads)
+
+	def iter_checkpoints(self, start=0, stop=None):
+		for position in range(start, len(self) if stop is None else min(stop, len(self))):
+			yield {
+				CHECKPOINT_ID_TAG: position if self.ids is None else self.ids[position],
+				THREAD_ID_TAG: self.threads[position],
+				CHECKPOINT_LOCATION_TAG: self.locations[self.location_indices[position]],
+				CHECKPOINT_ACTION_TAG: self.actions[self.action_indices[position]],
+				**self.extras.get(position, {})
+			}
+
+def is_trace_archive(file_name):
+	with open(file_name, "rb") as trace_file:
+		return trace_file.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+
+def _smallest_array(values):
+	largest_value = max(values, default=0)
+	for typecode in _UNSIGNED_TYPECODES:
+		if largest_value < 1 << (8 * array.array(typecode).itemsize):
+			return array.array(typecode, values)
+	raise OverflowError(f"{largest_value} is too large to archive")
+
+def _little_endian_bytes(column):
+	if sys.byteorder == "big":
+		column = array.array(column.typecode, column)
+		column.byteswap()
+	return column.tobytes()
+
+def _compress(compression, data):
+	if compression == COMPRESSION_ZLIB:
+		return zlib.compress(data, 9)
+	if compression == COMPRESSION_LZMA:
+		return lzma.compress(data)
+	return data
+
+def _decompress(compression, data):
+	if compression == COMPRESSION_ZLIB:
+		return zlib.decompress(data)
+	if compression == COMPRESSION_LZMA:
+		return lzma.decompress(data)
+	return data
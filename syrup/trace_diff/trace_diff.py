@@ -0,0 +1,315 @@
+#!/bin/python3
+import collections
+from log_analyzer.log_analyzer import LogAnalyzer, iter_expected_checkpoints, normalised_location
+from replay_reader.checkpoint_parser import checkpoint_parser
+from trace_archive.trace_archive import is_trace_archive
+
+THREAD_TAG = "thread"
+LOCATION_TAG = "location"
+SHARED_VARIABLE_TAG = "variable"
+ACCESS_TAG = "access"
+ACCESS_READ = "read"
+TRACE_KIND_TRACE = "trace"
+TRACE_KIND_SIMULATED = "simulated"
+TRACE_KIND_LOG = "log"
+# Checkpoints compared at a time when looking for the first difference, as
+# comparing slices of lists runs in C.
+COMPARISON_BLOCK_SIZE = 4096
+DEFAULT_EXAMPLE_LIMIT = 10
+
+# Traces
+# The checkpoints of both traces are interned, so that each distinct thread
+# and location is a small integer and traces are compared as lists of them.
+class CheckpointTable:
+	def __init__(self):
+		self._ids = {}
+		self.checkpoints = []
+
+	def intern(self, checkpoint):
+		checkpoint_id = self._ids.get(checkpoint)
+		if checkpoint_id is None:
+			checkpoint_id = self._ids[checkpoint] = len(self.checkpoints)
+			self.checkpoints.append(checkpoint)
+		return checkpoint_id
+
+	def thread(self, checkpoint_id):
+		return self.checkpoints[checkpoint_id][0]
+
+	def location(self, checkpoint_id):
+		return self.checkpoints[checkpoint_id][1]
+
+	def describe(self, checkpoint_id):
+		if checkpoint_id is None:
+			return "nothing"
+		thread, location = self.checkpoints[checkpoint_id]
+		return f"thread {thread} at {location}"
+
+# The order in which the checkpoints of a trace were hit, along with the shared
+# variable accessed at each location, which only traces recorded with the
+# access sites know.
+class Trace:
+	def __init__(self, file_name, checkpoint_table, module_bases=None):
+		module_bases = module_bases or {}
+		checkpoints, shared_variable_accesses = read_trace(file_name)
+		self.file_name = file_name
+		self.kind = trace_file_kind(file_name)
+		self.checkpoints = []
+		# Traces hit few distinct locations many times over, so each is only
+		# normalised once.
+		normalised_locations = {}
+		for thread, location in checkpoints:
+			normalised = normalised_locations.get(location)
+			if normalised is None:
+				normalised = normalised_locations[location] = normalised_location(location, module_bases)
+			self.checkpoints.append(checkpoint_table.intern((thread, normalised)))
+		self.shared_variable_accesses = {
+			normalised_location(location, module_bases): access
+			for location, access in shared_variable_accesses.items()
+		}
+		self._checkpoint_table = checkpoint_table
+
+	def checkpoints_by_thread(self):
+		checkpoints_by_thread = collections.defaultdict(list)
+		for checkpoint_id in self.checkpoints:
+			checkpoints_by_thread[self._checkpoint_table.thread(checkpoint_id)].append(checkpoint_id)
+		return checkpoints_by_thread
+
+	def __len__(self):
+		return len(self.checkpoints)
+
+# Traces are read in any of the formats that checkpoint_parser reads, from the
+# simulated files, and from the logs of GDB sessions running syrup, such as the
+# actual files under simulations.
+def trace_file_kind(file_name):
+	if is_trace_archive(file_name):
+		return TRACE_KIND_TRACE
+	with open(file_name, errors="replace") as trace_file:
+		start = trace_file.read(2)
+	if start == "[{":
+		return TRACE_KIND_SIMULATED
+	if start.lstrip().startswith("{"):
+		return TRACE_KIND_TRACE
+	return TRACE_KIND_LOG
+
+# Returns the thread and location of each checkpoint, in order, and the shared
+# variable accesses of the trace by location.
+def read_trace(file_name):
+	kind = trace_file_kind(file_name)
+	if kind == TRACE_KIND_LOG:
+		checkpoints = []
+		LogAnalyzer(lambda thread, location: checkpoints.append((thread, location))).analyse_file(file_name)
+		return checkpoints, {}
+	if kind == TRACE_KIND_SIMULATED:
+		return iter_expected_checkpoints(file_name), {}
+	trace = checkpoint_parser(file_name)
+	return (
+		(checkpoint[THREAD_TAG], checkpoint[LOCATION_TAG]) for checkpoint in trace.iter_checkpoints()
+	), trace.get_shared_variable_accesses()
+
+# Comparisons
+# Returns the first position at which the lists differ, or None if they are
+# the same. Blocks of them are compared at a time, and only the block that
+# differs is searched, so the common prefix is found at the speed of comparing
+# lists.
+def first_difference(first, second):
+	length = min(len(first), len(second))
+	start = 0
+	while start < length:
+		stop = min(start + COMPARISON_BLOCK_SIZE, length)
+		if first[start:stop] != second[start:stop]:
+			for position in range(start, stop):
+				if first[position] != second[position]:
+					return position
+		start = stop
+	return None if len(first) == len(second) else length
+
+# Counts the pairs of values that are out of order, in O(n log n) with a
+# Fenwick tree over values below the bound.
+def count_inversions(values, bound):
+	tree = [0] * (bound + 1)
+	inversions = 0
+	for seen, value in enumerate(values):
+		smaller_or_equal = 0
+		position = value + 1
+		while position > 0:
+			smaller_or_equal += tree[position]
+			position -= position & -position
+		inversions += seen - smaller_or_equal
+		position = value + 1
+		while position <= bound:
+			tree[position] += 1
+			position += position & -position
+	return inversions
+
+# The checkpoints of a thread in both traces, and where they first differ.
+class ThreadDiff:
+	def __init__(self, thread, first_checkpoints, second_checkpoints):
+		self.thread = thread
+		self.first_count = len(first_checkpoints)
+		self.second_count = len(second_checkpoints)
+		self.divergence = first_difference(first_checkpoints, second_checkpoints)
+		self.first_checkpoint = _checkpoint_at(first_checkpoints, self.divergence)
+		self.second_checkpoint = _checkpoint_at(second_checkpoints, self.divergence)
+
+	def is_same(self):
+		return self.divergence is None
+
+# The accesses to a shared variable, in the order they were made in each
+# trace, are matched up by thread and by how many accesses the thread made to
+# it before. Accesses conflict when they come from different threads and at
+# least one of them writes. Threads keep the order of their own accesses, so
+# the conflicting pairs that are reordered are the pairs of matched accesses
+# that are out of order, less the pairs of reads that are.
+class VariableDiff:
+	def __init__(self, variable, first_accesses, second_accesses):
+		self.variable = variable
+		self.first_count = len(first_accesses)
+		self.second_count = len(second_accesses)
+		second_positions = {
+			(thread, occurrence): position
+			for position, (thread, occurrence, _) in enumerate(second_accesses)
+		}
+		positions = []
+		read_positions = []
+		for thread, occurrence, is_read in first_accesses:
+			position = second_positions.get((thread, occurrence))
+			if position is None:
+				continue
+			positions.append(position)
+			if is_read:
+				read_positions.append(position)
+		self.matched_count = len(positions)
+		self.reordered_count = count_inversions(positions, len(second_accesses)) - \
+			count_inversions(read_positions, len(second_accesses))
+		self.divergence = first_difference(
+			[thread for thread, _, _ in first_accesses],
+			[thread for thread, _, _ in second_accesses]
+		)
+		self.first_thread = _access_thread_at(first_accesses, self.divergence)
+		self.second_thread = _access_thread_at(second_accesses, self.divergence)
+
+# Compares two traces, which may be of different formats, position by position
+# and thread by thread. Every step is linear in the length of the traces,
+# other than counting the reordered conflicting accesses, which takes
+# O(n log n).
+class TraceDiff:
+	def __init__(self, first_file_name, second_file_name, module_bases=None):
+		self.checkpoint_table = CheckpointTable()
+		self.first = Trace(first_file_name, self.checkpoint_table, module_bases)
+		self.second = Trace(second_file_name, self.checkpoint_table, module_bases)
+		self.divergence = first_difference(self.first.checkpoints, self.second.checkpoints)
+		self.first_checkpoint = _checkpoint_at(self.first.checkpoints, self.divergence)
+		self.second_checkpoint = _checkpoint_at(self.second.checkpoints, self.divergence)
+		self.thread_diffs = self._thread_diffs()
+		self.variable_diffs = [] if self.is_same() else self._variable_diffs()
+
+	def is_same(self):
+		return self.divergence is None
+
+	# The traces run the same checkpoints in each thread, only interleaved
+	# differently.
+	def is_reordering(self):
+		return all(thread_diff.is_same() for thread_diff in self.thread_diffs)
+
+	def reordered_count(self):
+		return sum(variable_diff.reordered_count for variable_diff in self.variable_diffs)
+
+	def as_dictionary(self, example_limit=DEFAULT_EXAMPLE_LIMIT):
+		return {
+			"first": {"file": self.first.file_name, "kind": self.first.kind, "checkpoints": len(self.first)},
+			"second": {"file": self.second.file_name, "kind": self.second.kind, "checkpoints": len(self.second)},
+			"divergence": None if self.is_same() else {
+				"position": self.divergence,
+				"first": self._checkpoint_dictionary(self.first_checkpoint),
+				"second": self._checkpoint_dictionary(self.second_checkpoint)
+			},
+			"is_reordering": self.is_reordering(),
+			"threads": [
+				{
+					"thread": thread_diff.thread,
+					"first_checkpoints": thread_diff.first_count,
+					"second_checkpoints": thread_diff.second_count,
+					"divergence": thread_diff.divergence,
+					"first": self._checkpoint_dictionary(thread_diff.first_checkpoint),
+					"second": self._checkpoint_dictionary(thread_diff.second_checkpoint)
+				}
+				for thread_diff in self.thread_diffs if not thread_diff.is_same()
+			][:example_limit],
+			"reordered_conflicting_accesses": self.reordered_count(),
+			"variables": [
+				{
+					"variable": variable_diff.variable,
+					"first_accesses": variable_diff.first_count,
+					"second_accesses": variable_diff.second_count,
+					"matched_accesses": variable_diff.matched_count,
+					"reordered_conflicting_pairs": variable_diff.reordered_count,
+					"divergence": variable_diff.divergence,
+					"first_thread": variable_diff.first_thread,
+					"second_thread": variable_diff.second_thread
+				}
+				for variable_diff in self.variable_diffs
+			]
+		}
+
+	def _thread_diffs(self):
+		first_checkpoints = self.first.checkpoints_by_thread()
+		second_checkpoints = self.second.checkpoints_by_thread()
+		return [
+			ThreadDiff(thread, first_checkpoints.get(thread, []), second_checkpoints.get(thread, []))
+			for thread in sorted(set(first_checkpoints).union(second_checkpoints))
+		]
+
+	def _variable_diffs(self):
+		shared_variable_accesses = dict(self.second.shared_variable_accesses)
+		shared_variable_accesses.update(self.first.shared_variable_accesses)
+		first_accesses = self._accesses_by_variable(self.first, shared_variable_accesses)
+		second_accesses = self._accesses_by_variable(self.second, shared_variable_accesses)
+		return [
+			VariableDiff(variable, first_accesses.get(variable, []), second_accesses.get(variable, []))
+			for variable in sorted(set(first_accesses).union(second_accesses), key=str)
+		]
+
+	# Without the access sites, as for the simulated files, each location is
+	# taken to be a variable of its own that every access writes to.
+	def _accesses_by_variable(self, trace, shared_variable_accesses):
+		variable_accesses = [
+			self._variable_access(location, shared_variable_accesses)
+			for _, location in self.checkpoint_table.checkpoints
+		]
+		accesses = collections.defaultdict(list)
+		occurrences = collections.Counter()
+		for checkpoint_id in trace.checkpoints:
+			variable_access = variable_accesses[checkpoint_id]
+			if variable_access is None:
+				continue
+			variable, is_read = variable_access
+			thread = self.checkpoint_table.thread(checkpoint_id)
+			accesses[variable].append((thread, occurrences[thread, variable], is_read))
+			occurrences[thread, variable] += 1
+		return accesses
+
+	# Returns the variable accessed at the location and whether it is only
+	# read, or None if the location is not an access.
+	def _variable_access(self, location, shared_variable_accesses):
+		if len(shared_variable_accesses) == 0:
+			return location, False
+		access = shared_variable_accesses.get(location)
+		if access is None:
+			return None
+		return access[SHARED_VARIABLE_TAG], access[ACCESS_TAG] == ACCESS_READ
+
+	def _checkpoint_dictionary(self, checkpoint_id):
+		if checkpoint_id is None:
+			return None
+		thread, location = self.checkpoint_table.checkpoints[checkpoint_id]
+		return {THREAD_TAG: thread, LOCATION_TAG: location}
+
+def _checkpoint_at(checkpoints, position):
+	if position is None or position >= len(checkpoints):
+		return None
+	return checkpoints[position]
+
+def _access_thread_at(accesses, position):
+	if position is None or position >= len(accesses):
+		return None
+	return accesses[position][0]
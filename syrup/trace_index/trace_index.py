@@ -0,0 +1,169 @@
+#!/bin/python3
+import bisect
+import heapq
+import json
+import os
+from trace_writer.trace_writer import is_trace_header
+from trace_archive.trace_archive import is_trace_archive
+from replay_reader.checkpoint_parser import checkpoint_parser
+
+INDEX_FORMAT_TAG = "format"
+INDEX_FORMAT = "syrup-trace-index"
+INDEX_VERSION_TAG = "version"
+INDEX_VERSION = 1
+INDEX_FILE_SUFFIX = ".index"
+THREAD_ID_TAG = "thread"
+CHECKPOINT_LOCATION_TAG = "location"
+DEFAULT_OFFSET_STRIDE = 256
+
+_TRACE_SIZE_TAG = "trace_size"
+_TRACE_MODIFICATION_TIME_TAG = "trace_modification_time"
+_CHECKPOINT_COUNT_TAG = "checkpoint_count"
+_OFFSET_STRIDE_TAG = "offset_stride"
+_OFFSETS_TAG = "offsets"
+_POSITIONS_TAG = "positions"
+
+# An index of a trace, kept next to it, that lets a window of its checkpoints
+# be read without parsing everything before it. For traces streamed as JSON
+# Lines it holds the byte offset of every offset_stride-th checkpoint, so
+# reading can seek close to any position. For every thread, it also holds the
+# positions at which the thread hit each location, so that how often a thread
+# passed a location before any position can be found without reading the trace
+# up to there. The size and modification time of the trace are kept too, so a
+# stale index is rebuilt rather than used.
+class TraceIndex:
+	def __init__(self, trace_size, trace_modification_time, checkpoint_count,
+			offset_stride, offsets, positions):
+		self.trace_size = trace_size
+		self.trace_modification_time = trace_modification_time
+		self.checkpoint_count = checkpoint_count
+		self.offset_stride = offset_stride
+		self.offsets = offsets
+		self.positions = positions
+
+	@classmethod
+	def build(cls, trace_file_name, offset_stride=DEFAULT_OFFSET_STRIDE):
+		offsets = None
+		positions = {}
+		checkpoint_count = 0
+		for offset, checkpoint in _iter_checkpoints_with_offsets(trace_file_name):
+			if offset is not None:
+				if offsets is None:
+					offsets = []
+				if checkpoint_count % offset_stride == 0:
+					offsets.append(offset)
+			positions.setdefault(checkpoint[THREAD_ID_TAG], {}).setdefault(
+				checkpoint[CHECKPOINT_LOCATION_TAG], []
+			).append(checkpoint_count)
+			checkpoint_count += 1
+		trace_status = os.stat(trace_file_name)
+		return cls(trace_status.st_size, trace_status.st_mtime_ns, checkpoint_count,
+			offset_stride, offsets, positions)
+
+	@classmethod
+	def load(cls, index_file_name):
+		with open(index_file_name) as index_file:
+			information = json.load(index_file)
+		if information.get(INDEX_FORMAT_TAG) != INDEX_FORMAT:
+			raise ValueError(f"{index_file_name} is not a trace index")
+		if information[INDEX_VERSION_TAG] != INDEX_VERSION:
+			raise ValueError(f"Unsupported trace index version {information[INDEX_VERSION_TAG]}")
+		return cls(
+			information[_TRACE_SIZE_TAG],
+			information[_TRACE_MODIFICATION_TIME_TAG],
+			information[_CHECKPOINT_COUNT_TAG],
+			information[_OFFSET_STRIDE_TAG],
+			information[_OFFSETS_TAG],
+			{
+				int(thread): locations
+				for thread, locations in information[_POSITIONS_TAG].items()
+			}
+		)
+
+	# Loads the index next to a trace, building and saving it first if there is
+	# none or the trace has changed since. The index is still returned if it
+	# cannot be saved, such as next to a trace in a read-only directory.
+	@classmethod
+	def load_or_build(cls, trace_file_name):
+		index_file_name = index_file_name_for(trace_file_name)
+		if os.path.isfile(index_file_name):
+			index = cls.load(index_file_name)
+			if index.describes(trace_file_name):
+				return index
+		index = cls.build(trace_file_name)
+		try:
+			index.save(index_file_name)
+		except OSError:
+			pass
+		return index
+
+	def save(self, index_file_name):
+		with open(index_file_name, "w+") as index_file:
+			json.dump({
+				INDEX_FORMAT_TAG: INDEX_FORMAT,
+				INDEX_VERSION_TAG: INDEX_VERSION,
+				_TRACE_SIZE_TAG: self.trace_size,
+				_TRACE_MODIFICATION_TIME_TAG: self.trace_modification_time,
+				_CHECKPOINT_COUNT_TAG: self.checkpoint_count,
+				_OFFSET_STRIDE_TAG: self.offset_stride,
+				_OFFSETS_TAG: self.offsets,
+				_POSITIONS_TAG: self.positions
+			}, index_file, separators=(",", ":"))
+
+	def describes(self, trace_file_name):
+		trace_status = os.stat(trace_file_name)
+		return trace_status.st_size == self.trace_size and \
+			trace_status.st_mtime_ns == self.trace_modification_time
+
+	def threads(self):
+		return sorted(self.positions)
+
+	def thread_locations(self, thread):
+		return list(self.positions.get(thread, {}))
+
+	# Positions of the checkpoints of a thread, in the order the thread hit them.
+	def thread_positions(self, thread):
+		return list(heapq.merge(*self.positions.get(thread, {}).values()))
+
+	def thread_checkpoint_count(self, thread):
+		return sum(map(len, self.positions.get(thread, {}).values()))
+
+	# How often a thread hit a location at positions before the given one.
+	def hits_before(self, thread, location, position):
+		return bisect.bisect_left(self.positions.get(thread, {}).get(location, ()), position)
+
+	# The closest indexed position at or before the given one and the byte
+	# offset of its checkpoint, or None if the trace is not streamed.
+	def seek(self, position):
+		if self.offsets is None or len(self.offsets) == 0:
+			return None
+		offset_index = min(position // self.offset_stride, len(self.offsets) - 1)
+		return offset_index * self.offset_stride, self.offsets[offset_index]
+
+def index_file_name_for(trace_file_name):
+	return trace_file_name + INDEX_FILE_SUFFIX
+
+# Offsets are None for traces other than streamed ones, as their checkpoints
+# cannot be read from the middle of the file.
+def _iter_checkpoints_with_offsets(trace_file_name):
+	if not is_trace_archive(trace_file_name):
+		with open(trace_file_name, "rb") as trace_file:
+			header_line = trace_file.readline()
+			if _is_trace_header_line(header_line):
+				offset = trace_file.tell()
+				for line in trace_file:
+					# The last line of an interrupted recording may be incomplete
+					if not line.endswith(b"\n"):
+						return
+					if line.strip():
+						yield offset, json.loads(line)
+					offset += len(line)
+				return
+	for checkpoint in checkpoint_parser(trace_file_name).iter_checkpoints():
+		yield None, checkpoint
+
+def _is_trace_header_line(line):
+	try:
+		return is_trace_header(json.loads(line))
+	except ValueError:
+		return False
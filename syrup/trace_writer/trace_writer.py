@@ -0,0 +1,33 @@
+#!/bin/python3
+import json
+
+TRACE_FORMAT_TAG = "format"
+TRACE_FORMAT = "syrup-checkpoints"
+TRACE_VERSION_TAG = "version"
+TRACE_VERSION = 1
+LINE_BUFFERED = 1
+
+# Traces are written as JSON Lines. The first line is a header holding
+# everything about the recording other than the checkpoints, and each following
+# line holds a single checkpoint. Lines are flushed as soon as they are written,
+# so an interrupted recording keeps every checkpoint that was hit before then.
+class TraceWriter:
+	def __init__(self, trace_file_name, header):
+		self._trace_file = open(trace_file_name, "w+", buffering=LINE_BUFFERED)
+		self._write_record({
+			TRACE_FORMAT_TAG: TRACE_FORMAT,
+			TRACE_VERSION_TAG: TRACE_VERSION,
+			**header
+		})
+
+	def write_checkpoint(self, checkpoint):
+		self._write_record(checkpoint)
+
+	def close(self):
+		self._trace_file.close()
+
+	def _write_record(self, record):
+		self._trace_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+def is_trace_header(record):
+	return isinstance(record, dict) and record.get(TRACE_FORMAT_TAG) == TRACE_FORMAT
@@ -1,15 +1,34 @@
 #!/bin/python3
+
+# Records the order in which the threads of a program hit the checkpoints in
+# it. GDB does not add the directory of a script it sources to the path, so it
+# is added here to import the other modules. Run by record.py, or directly:
+#
+# Usage: gdb -x syrup/write-json.py --args program arguments
+import os
 import sys
-CURRENT_DIRECTORY = "syrup"
+CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(CURRENT_DIRECTORY)
 
 import gdb
-import json
-from pprint import pprint
+import collections
+import functools
+import tempfile
 from gdb_wrapper import gdb_wrapper
-from logger.logger import log
+from logger.logger import log, debug, warning
+from clone_site_cache.clone_site_cache import CloneSiteCache, current_binary_key
+from trace_writer.trace_writer import TraceWriter
+from replay_reader.checkpoint_parser import checkpoint_parser
+from snapshot.snapshot import Snapshotter, SNAPSHOT_TAG, SNAPSHOT_SHARED_VARIABLES_TAG
+from site_discovery.site_discovery import discover_start_routines, discover_shared_variable_accesses, \
+		SHARED_VARIABLE_TAG
+from location_resolver.location_resolver import LocationResolver, split_location
+from target_spec.target_spec import TargetSpec
+from thread_registry.thread_registry import ThreadRegistry, reports_thread_exits
+from metrics import metrics
 
 START_ROUTINE_TAG = "thread_start_routines"
+SHARED_VARIABLE_ACCESSES_TAG = "shared_variable_accesses"
 THREAD_ID_TAG = "thread"
 CHECKPOINT_LOCATION_TAG = "location"
 CHECKPOINT_ID_TAG = "id"
@@ -18,58 +37,63 @@ CHECKPOINT_ACTION_CREATOR_THREAD_TAG = "creator_thread"
 CHECKPOINT_ACTION_CREATED_THREAD_TAG = "created_thread"
 CHECKPOINT_ACTION_UNTRACKED_TAG = ""
 MAIN_THREAD_ID = 1
-CHECKPOINT_TAG = "checkpoints"
-OUTPUT_FILE = "./checkpoints.json"
-OUTPUT_FILE_INDENT_WIDTH = 2
+OUTPUT_FILE_ENVIRONMENT_VARIABLE = "SYRUP_OUTPUT_FILE"
+OUTPUT_FILE = os.environ.get(OUTPUT_FILE_ENVIRONMENT_VARIABLE, "./checkpoints.jsonl")
+# A JSON file describing which sites to record, as read by TargetSpec. Every
+# site that is discovered is recorded without one.
+TARGET_SPEC_ENVIRONMENT_VARIABLE = "SYRUP_TARGET_SPEC"
+TARGET_SPEC_FILE = os.environ.get(TARGET_SPEC_ENVIRONMENT_VARIABLE, "")
 GDB_CONTINUE_INSTRUCTION = "continue"
 GDB_DELETE_BREAKPOINTS_INSTRUCTION = "delete"
 GDB_RUN_INSTRUCTION = "run"
-COUNTER_READ_INSTRUCTION_ADDRESS = "*0x5555555551bb"
-COUNTER_WRITE_INSTRUCTION_ADDRESS = "*0x5555555551c4"
-
+RECORD_IN_SINGLE_PASS = True
+# Registers and shared variables, by name and size in bytes, to record with
+# the checkpoints, such as ["eax"] and {"counter": 4}.
+SNAPSHOT_REGISTERS = []
+SNAPSHOT_SHARED_VARIABLES = {}
+SNAPSHOT_EVERY_NTH_CHECKPOINT = 1
+CLONE_SITE_CACHE_FILE = "./clone_sites.json"
+# Stops at the clone catchpoint are told apart from other stops by the syscall
+# the thread has just made, as x86-64 Linux keeps its number in orig_rax.
+CLONE_SYSCALL_NUMBER = 56
+SYSCALL_NUMBER_REGISTER = "orig_rax"
+SYSCALL_INSTRUCTION = b"\x0f\x05"
+MATCH_THREAD_CREATIONS = True
+CHECKPOINT_BREAKPOINT_TIMER = metrics.BREAKPOINT_TIMER_PREFIX + "CheckpointBreakpoint.stop"
+
+# The threads created while recording, and the thread that created each of
+# them, are kept so that thread creations can be matched to the thread creation
+# checkpoints of their creators once the recording has finished.
 class ThreadCreationListener:
 	def __init__(self):
-		self._created_threads = set([MAIN_THREAD_ID])
+		self._thread_registry = ThreadRegistry()
 		self._is_constrained_execution = False
-		self._thread_creations = []
 
 	def __call__(self, event):
-		log("ThreadCreationListener was called")
-		newly_created_thread = self._newly_created_thread()
-		self._record_new_thread_creation(event.inferior_thread.num, newly_created_thread)
-		self._handle_newly_created_thread(newly_created_thread)
+		debug("ThreadCreationListener was called")
+		self._thread_registry.new_thread(event)
 		#self._constrain_execution_to_thread(newly_created_thread)
 		#self._run_thread_to_start_routine(newly_created_thread)
 		#self._resume_unconstrained_execution()
 
-	def get_thread_creations(self):
-		return self._thread_creations
+	def thread_exited(self, event):
+		self._thread_registry.thread_exited(event)
 
-	def _record_new_thread_creation(self, creator_thread, created_thread):
-		self._thread_creations.append({
-				CHECKPOINT_ACTION_CREATOR_THREAD_TAG: creator_thread,
-				CHECKPOINT_ACTION_CREATED_THREAD_TAG: created_thread
-		})
+	def get_thread_creations(self):
+		thread_creations = []
+		for creator, created in self._thread_registry.creations():
+			if creator is None:
+				warning("Thread %d was created by an unknown thread", created.num)
+				continue
+			thread_creations.append({
+				CHECKPOINT_ACTION_CREATOR_THREAD_TAG: creator.num,
+				CHECKPOINT_ACTION_CREATED_THREAD_TAG: created.num
+			})
+		return thread_creations
 
 	def _run_thread_to_start_routine(self, thread):
 		gdb_wrapper.enqueue_execute(GDB_CONTINUE_INSTRUCTION)
 
-	def _newly_created_thread(self):
-		alive_threads = set(map(
-			lambda thread: thread.global_num,
-			gdb.inferiors()[0].threads()
-		))
-		log("alive_threads:")
-		pprint(alive_threads)
-		newly_created_threads = alive_threads.difference(self._created_threads)
-		log("newly_created_threads:")
-		pprint(newly_created_threads)
-		assert len(newly_created_threads) == 1, "More than one newly created thread"
-		return next(iter(newly_created_threads))
-
-	def _handle_newly_created_thread(self, thread_id):
-		self._created_threads.add(thread_id)
-
 	def _constrain_execution_to_thread(self, thread_id):
 		gdb_wrapper.enqueue_execute("set scheduler-locking on")
 		gdb_wrapper.enqueue_execute(f"thread {thread_id}")
@@ -82,53 +106,128 @@ class ThreadCreationListener:
 class SyscallRecorder:
 	def __init__(self):
 		self.checkpoints = set()
+		self._location_resolver = LocationResolver()
+
+	def __call__(self, event):
+		debug("Hit SyscallRecorder")
+		clone_site = gdb.selected_frame().older().pc()
+		self.checkpoints.add(self._location_resolver.symbolic_location(clone_site))
+		gdb_wrapper.enqueue_execute(GDB_CONTINUE_INSTRUCTION)
+
+# When recording in a single pass, the clone syscall is caught while the
+# checkpoints are being recorded. The first time a clone site is seen, a
+# breakpoint is placed on it before the creator thread returns to it, so the
+# thread creation checkpoint is still recorded for that first thread.
+class CloneSiteRecorder:
+	def __init__(self, thread_creation_checkpoints, checkpoint_breakpoint_class, location_resolver):
+		self.checkpoints = thread_creation_checkpoints
+		self.discovered_new_checkpoints = False
+		self._checkpoint_breakpoint_class = checkpoint_breakpoint_class
+		self._location_resolver = location_resolver
 
 	def __call__(self, event):
-		log("Hit SyscallRecorder")
-		self.checkpoints.add(hex(gdb.selected_frame().older().pc()))
+		debug("Hit CloneSiteRecorder")
+		clone_site = self._location_resolver.symbolic_location(gdb.selected_frame().older().pc())
+		if clone_site not in self.checkpoints:
+			log(f"Discovered clone site {clone_site}")
+			self.checkpoints.add(clone_site)
+			self.discovered_new_checkpoints = True
+			set_syscall_breakpoints(
+				[clone_site],
+				self._checkpoint_breakpoint_class,
+				self._location_resolver
+			)
 		gdb_wrapper.enqueue_execute(GDB_CONTINUE_INSTRUCTION)
 
+class SinglePassStopListener:
+	def __init__(self, clone_site_recorder, checkpoint_recorder):
+		self._clone_site_recorder = clone_site_recorder
+		self._checkpoint_recorder = checkpoint_recorder
+
+	def __call__(self, event):
+		if is_clone_catchpoint_stop(event):
+			self._clone_site_recorder(event)
+			return
+		if not isinstance(event, (gdb.BreakpointEvent, gdb.SignalEvent)):
+			warning("Continuing from a stop that is not at the clone syscall")
+		self._checkpoint_recorder(event)
+
+# Older versions of GDB do not expose catchpoints to Python, so stopping at one
+# produces a plain stop event rather than a breakpoint event, as interrupting or
+# stepping the inferior does. Those are only taken for the clone catchpoint if
+# the thread has just executed a syscall instruction for clone.
+def is_clone_catchpoint_stop(event):
+	if isinstance(event, gdb.BreakpointEvent):
+		return event.breakpoint.type == getattr(gdb, "BP_CATCHPOINT", None)
+	if isinstance(event, gdb.SignalEvent):
+		return False
+	return is_at_clone_syscall()
+
+def is_at_clone_syscall():
+	frame = gdb.selected_frame()
+	instruction_address = frame.pc() - len(SYSCALL_INSTRUCTION)
+	try:
+		syscall_number = int(frame.read_register(SYSCALL_NUMBER_REGISTER))
+		instruction = bytes(gdb.selected_inferior().read_memory(instruction_address, len(SYSCALL_INSTRUCTION)))
+	except gdb.error:
+		return False
+	return syscall_number == CLONE_SYSCALL_NUMBER and instruction == SYSCALL_INSTRUCTION
+
 # This class records the order in which checkpoints are hit when the program
 # executes. A checkpoint is an assembly instruction which reads from or writes
 # to a variable that is shared between threads.
 class CheckpointRecorder:
-	def __init__(self, thread_creation_checkpoints):
+	def __init__(self, thread_creation_checkpoints, trace_writer, location_resolver, snapshotter):
 		self._thread_creation_checkpoints = thread_creation_checkpoints
-		self.hit_checkpoints = []
+		self._trace_writer = trace_writer
+		self._location_resolver = location_resolver
+		self._snapshotter = snapshotter if snapshotter.is_enabled() else None
 		self._checkpoint_id = 0
 
+	# Hits are recorded by CheckpointBreakpoint without a full stop, so the
+	# recorder only sees stops it did not ask for.
 	def __call__(self, event):
-		self._record_hit_checkpoint()
-		self._print_eax_of_each_thread()
 		gdb_wrapper.enqueue_execute(GDB_CONTINUE_INSTRUCTION)
 
-	def _print_eax_of_each_thread(self):
-		log("PRINTING THE EAX OF EACH THREAD")
-		current_thread = gdb.selected_thread().global_num
-		for thread in gdb.inferiors()[0].threads():
-			thread_id = thread.global_num
-			log(f"WE ARE IN THREAD #{thread_id}")
-			gdb_wrapper.immediate_execute(f"thread {thread_id}")
-			log("EAX VALUE iS")
-			gdb_wrapper.immediate_execute("info registers eax")
-		gdb_wrapper.immediate_execute(f"thread {current_thread}")
-
-	def _record_hit_checkpoint(self):
+	def record_hit_checkpoint(self):
 		thread_id = gdb.selected_thread().num
-		checkpoint_location = hex(gdb.selected_frame().pc())
+		checkpoint_location = self._location_resolver.symbolic_location(gdb.selected_frame().pc())
 		self._add_checkpoint(thread_id, checkpoint_location, self._checkpoint_id)
 		self._checkpoint_id += 1
+		metrics.count(metrics.CHECKPOINTS_COUNTER)
 
 	def _add_checkpoint(self, thread_id, checkpoint_location, checkpoint_id):
-		log(f"Appending hit checkpoint {checkpoint_id} at {checkpoint_location} by thread {thread_id}")
-		self.hit_checkpoints.append({
+		debug("Writing hit checkpoint %d at %s by thread %d", checkpoint_id, checkpoint_location, thread_id)
+		checkpoint = {
 				CHECKPOINT_ID_TAG: checkpoint_id,
 				THREAD_ID_TAG: thread_id,
-				CHECKPOINT_LOCATION_TAG: checkpoint_location
-		})
+				CHECKPOINT_LOCATION_TAG: checkpoint_location,
+				CHECKPOINT_ACTION_TAG: CHECKPOINT_ACTION_UNTRACKED_TAG
+		}
+		snapshot = None if self._snapshotter is None else self._snapshotter.snapshot()
+		if snapshot is not None:
+			checkpoint[SNAPSHOT_TAG] = snapshot
+		self._trace_writer.write_checkpoint(checkpoint)
+
+	def finish(self):
+		self._trace_writer.close()
+
+# Checkpoints are recorded from inside GDB's breakpoint condition check rather
+# than from a stop event listener. Returning False from stop() lets the thread
+# carry on without a full stop, so hits never leave GDB's fast path.
+class CheckpointBreakpoint(gdb.Breakpoint):
+	def __init__(self, spec, *arguments, checkpoint_recorder, **keyword_arguments):
+		super().__init__(spec, *arguments, **keyword_arguments)
+		self._checkpoint_recorder = checkpoint_recorder
+
+	def stop(self):
+		started_at = metrics.start_timer()
+		self._checkpoint_recorder.record_hit_checkpoint()
+		metrics.stop_timer(CHECKPOINT_BREAKPOINT_TIMER, started_at)
+		return False
 
-	def get_hit_checkpoints(self):
-		return self.hit_checkpoints
+def checkpoint_breakpoint_class(checkpoint_recorder):
+	return functools.partial(CheckpointBreakpoint, checkpoint_recorder=checkpoint_recorder)
 
 class InferiorExitListener:
 	def __init__(self, syscall_recorder):
@@ -139,9 +238,10 @@ class InferiorExitListener:
 		if not self._inferior_has_already_exited:
 			log("InferiorExitListener has been called")
 			self._inferior_has_already_exited = True
-			gdb_wrapper.enqueue_execute(GDB_DELETE_BREAKPOINTS_INSTRUCTION)
-			gdb_wrapper.enqueue_disconnect(gdb.events.stop, self._syscall_recorder)
-			enqueue_run_sut_second_pass(self._syscall_recorder.checkpoints)
+			with gdb_wrapper.batched_actions():
+				gdb_wrapper.enqueue_execute(GDB_DELETE_BREAKPOINTS_INSTRUCTION)
+				gdb_wrapper.enqueue_disconnect(gdb.events.stop, self._syscall_recorder)
+				enqueue_run_sut_second_pass(self._syscall_recorder.checkpoints)
 
 class RunSUTSecondPass:
 	def __init__(self, thread_creation_checkpoints):
@@ -181,13 +281,20 @@ def run_sut_second_pass(thread_creation_checkpoints):
 	pause_target_at_start()
 
 def continue_sut_second_pass(thread_creation_checkpoints):
-	set_syscall_breakpoints(thread_creation_checkpoints)
-	set_shared_variable_breakpoints()
-	set_thread_start_routine_breakpoints()
-	checkpoint_recorder = CheckpointRecorder(thread_creation_checkpoints)
+	location_resolver = LocationResolver()
+	recording_targets = RecordingTargets(load_target_spec(), location_resolver)
+	checkpoint_recorder = CheckpointRecorder(
+		thread_creation_checkpoints,
+		open_trace_writer(recording_targets, location_resolver),
+		location_resolver,
+		open_snapshotter()
+	)
+	breakpoint_class = checkpoint_breakpoint_class(checkpoint_recorder)
+	set_syscall_breakpoints(thread_creation_checkpoints, breakpoint_class, location_resolver)
+	set_shared_variable_breakpoints(recording_targets, breakpoint_class)
+	set_thread_start_routine_breakpoints(recording_targets, breakpoint_class)
 	gdb_wrapper.immediate_connect(gdb.events.stop, checkpoint_recorder)
-	thread_creation_listener = ThreadCreationListener()
-	gdb_wrapper.immediate_connect(gdb.events.new_thread, thread_creation_listener)
+	thread_creation_listener = connect_thread_creation_listener()
 	inferior_exit_listener = SecondPassInferiorExitListener(
 		checkpoint_recorder,
 		thread_creation_listener,
@@ -196,6 +303,90 @@ def continue_sut_second_pass(thread_creation_checkpoints):
 	gdb_wrapper.immediate_connect(gdb.events.exited, inferior_exit_listener)
 	gdb_wrapper.immediate_execute(GDB_CONTINUE_INSTRUCTION)
 
+def run_sut_single_pass():
+	log("Pausing at the start")
+	target_pause_listener = SinglePassTargetPauseListener()
+	gdb_wrapper.immediate_connect(gdb.events.stop, target_pause_listener)
+	pause_target_at_start()
+
+class SinglePassTargetPauseListener:
+	def __call__(self, _):
+		log("SinglePassTargetPauseListener has been called")
+		gdb_wrapper.post_event(ContinueSUTSinglePass())
+		gdb_wrapper.immediate_disconnect(gdb.events.stop, self)
+
+class ContinueSUTSinglePass:
+	def __call__(self):
+		log("ContinueSUTSinglePass has been called")
+		continue_sut_single_pass()
+
+def continue_sut_single_pass():
+	binary_key = current_binary_key()
+	clone_site_cache = CloneSiteCache(CLONE_SITE_CACHE_FILE)
+	cached_thread_creation_checkpoints = clone_site_cache.get_clone_sites(binary_key)
+	thread_creation_checkpoints = cached_thread_creation_checkpoints or set()
+	location_resolver = LocationResolver()
+	recording_targets = RecordingTargets(load_target_spec(), location_resolver)
+	checkpoint_recorder = CheckpointRecorder(
+		thread_creation_checkpoints,
+		open_trace_writer(recording_targets, location_resolver),
+		location_resolver,
+		open_snapshotter()
+	)
+	breakpoint_class = checkpoint_breakpoint_class(checkpoint_recorder)
+	if not load_target_spec().thread_creations:
+		log("Not recording thread creations, as the target spec leaves them out")
+	elif cached_thread_creation_checkpoints is None:
+		log("No cached clone sites, discovering them while recording")
+		gdb_wrapper.immediate_execute("catch syscall clone")
+	else:
+		log(f"Using cached clone sites {thread_creation_checkpoints}")
+		set_syscall_breakpoints(thread_creation_checkpoints, breakpoint_class, location_resolver)
+	set_shared_variable_breakpoints(recording_targets, breakpoint_class)
+	set_thread_start_routine_breakpoints(recording_targets, breakpoint_class)
+	clone_site_recorder = CloneSiteRecorder(
+		thread_creation_checkpoints,
+		breakpoint_class,
+		location_resolver
+	)
+	gdb_wrapper.immediate_connect(
+		gdb.events.stop,
+		SinglePassStopListener(clone_site_recorder, checkpoint_recorder)
+	)
+	thread_creation_listener = connect_thread_creation_listener()
+	inferior_exit_listener = SinglePassInferiorExitListener(
+		checkpoint_recorder,
+		thread_creation_listener,
+		clone_site_recorder,
+		clone_site_cache,
+		binary_key
+	)
+	gdb_wrapper.immediate_connect(gdb.events.exited, inferior_exit_listener)
+	gdb_wrapper.immediate_execute(GDB_CONTINUE_INSTRUCTION)
+
+class SinglePassInferiorExitListener:
+	def __init__(self, checkpoint_recorder, thread_creation_listener,
+			clone_site_recorder, clone_site_cache, binary_key):
+		self._checkpoint_recorder = checkpoint_recorder
+		self._thread_creation_listener = thread_creation_listener
+		self._clone_site_recorder = clone_site_recorder
+		self._clone_site_cache = clone_site_cache
+		self._binary_key = binary_key
+
+	def __call__(self, _):
+		log("SinglePassInferiorExitListener has been called")
+		if self._clone_site_recorder.discovered_new_checkpoints:
+			self._clone_site_cache.put_clone_sites(
+				self._binary_key,
+				self._clone_site_recorder.checkpoints
+			)
+		enqueue_finish_sut_second_pass(
+			self._checkpoint_recorder,
+			self._thread_creation_listener,
+			self._clone_site_recorder.checkpoints
+		)
+		gdb_wrapper.immediate_disconnect(gdb.events.exited, self)
+
 class SecondPassInferiorExitListener:
 	def __init__(self, checkpoint_recorder, thread_creation_listener, thread_creation_checkpoints):
 		self._checkpoint_recorder = checkpoint_recorder
@@ -238,49 +429,59 @@ def finish_sut_second_pass(
 		checkpoint_recorder,
 		thread_creation_listener,
 		thread_creation_checkpoints):
-	replay = {}
-	checkpoint_matcher = CheckpointMatcher(
-			checkpoint_recorder.get_hit_checkpoints(),
+	checkpoint_recorder.finish()
+	if MATCH_THREAD_CREATIONS and load_target_spec().thread_creations:
+		reorder_thread_creations_in_trace(
 			thread_creation_listener.get_thread_creations(),
 			thread_creation_checkpoints
+		)
+	gdb_wrapper.enqueue_quit()
+
+# Checkpoints are streamed to the trace in the order they are hit, so matching
+# thread creations rewrites the trace once the recording has finished. The
+# rewritten trace is written beside it and only replaces it once complete, so
+# the recorded trace is kept if rewriting fails.
+def reorder_thread_creations_in_trace(thread_creations, thread_creation_checkpoints):
+	trace = checkpoint_parser(OUTPUT_FILE)
+	checkpoint_matcher = CheckpointMatcher(trace, thread_creations, thread_creation_checkpoints)
+	trace_directory = os.path.dirname(os.path.abspath(OUTPUT_FILE))
+	trace_file_descriptor, reordered_trace_file_name = tempfile.mkstemp(
+		dir=trace_directory, prefix=".checkpoints.", suffix=".tmp"
 	)
-
-	checkpoints = checkpoint_matcher.checkpoints_with_correctly_ordered_thread_creations()
-	replay[CHECKPOINT_TAG] = checkpoints
-
-	start_routines = get_start_routines()
-	replay[START_ROUTINE_TAG] = start_routines
-
-	for checkpoint in checkpoints:
-		checkpoint[CHECKPOINT_LOCATION_TAG] = \
-				"*" + checkpoint[CHECKPOINT_LOCATION_TAG]
-
-	for checkpoint in checkpoints:
-		if CHECKPOINT_ACTION_TAG not in checkpoint:
-			checkpoint[CHECKPOINT_ACTION_TAG] = CHECKPOINT_ACTION_UNTRACKED_TAG
-
-	with open(OUTPUT_FILE, "w+") as output_file:
-		json.dump(replay, output_file, indent=OUTPUT_FILE_INDENT_WIDTH)
-
-	gdb_wrapper.enqueue_execute("quit")
+	os.close(trace_file_descriptor)
+	try:
+		trace_writer = TraceWriter(reordered_trace_file_name, trace.get_header())
+		try:
+			for checkpoint in checkpoint_matcher.checkpoints_with_correctly_ordered_thread_creations():
+				trace_writer.write_checkpoint(checkpoint)
+		finally:
+			trace_writer.close()
+		os.replace(reordered_trace_file_name, OUTPUT_FILE)
+	except BaseException:
+		os.remove(reordered_trace_file_name)
+		raise
 
 # We want the interleavings of threads with respect to shared variables to be
 # recorded. Therefore, we only need to record the ordering of writes and reads
-# to shared variables.
-def set_shared_variable_breakpoints():
-	#shared_variables = ["counter"]
-	#for shared_variable in shared_variables:
-	#	gdb_wrapper.immediate_breakpoint_at(
-	#		shared_variable,
-	#		breakpoint_type=gdb.BP_WATCHPOINT,
-	#		wp_class=gdb.WP_ACCESS
-	#	)
-	gdb_wrapper.immediate_breakpoint_at(COUNTER_READ_INSTRUCTION_ADDRESS)
-	gdb_wrapper.immediate_breakpoint_at(COUNTER_WRITE_INSTRUCTION_ADDRESS)
-
-def set_syscall_breakpoints(checkpoints):
+# to shared variables. Breaking on the instructions that access them is much
+# cheaper than watching the variables themselves.
+def set_shared_variable_breakpoints(recording_targets, breakpoint_class):
+	for location in recording_targets.shared_variable_accesses:
+		gdb_wrapper.immediate_breakpoint_at(location, breakpoint_class=breakpoint_class)
+
+# Clone sites are still discovered and cached when the target spec leaves them
+# out, so that a later recording that includes them does not have to.
+def set_syscall_breakpoints(checkpoints, breakpoint_class, location_resolver):
+	target_spec = load_target_spec()
 	for checkpoint in checkpoints:
-		gdb_wrapper.immediate_breakpoint_at(f"*{checkpoint}")
+		module, _ = split_location(checkpoint)
+		if not target_spec.includes_thread_creation_site(module):
+			debug("Not recording thread creations at %s, as the target spec leaves it out", checkpoint)
+			continue
+		gdb_wrapper.immediate_breakpoint_at(
+			location_resolver.live_location(checkpoint),
+			breakpoint_class=breakpoint_class
+		)
 
 def get_thread_creation_checkpoints():
 	gdb_wrapper.immediate_execute("catch syscall clone")
@@ -290,155 +491,180 @@ def get_thread_creation_checkpoints():
 	gdb_wrapper.immediate_connect(gdb.events.exited, exit_listener)
 	gdb_wrapper.immediate_execute(GDB_RUN_INSTRUCTION)
 
-def set_thread_start_routine_breakpoints():
-	start_routines = ["increment"]
-	for start_routine in start_routines:
-		gdb_wrapper.immediate_breakpoint_at(start_routine)
+def set_thread_start_routine_breakpoints(recording_targets, breakpoint_class):
+	for start_routine in recording_targets.start_routines:
+		gdb_wrapper.immediate_breakpoint_at(start_routine, breakpoint_class=breakpoint_class)
+
+def connect_thread_creation_listener():
+	thread_creation_listener = ThreadCreationListener()
+	gdb_wrapper.immediate_connect(gdb.events.new_thread, thread_creation_listener)
+	if reports_thread_exits():
+		gdb_wrapper.immediate_connect(gdb.events.thread_exited, thread_creation_listener.thread_exited)
+	return thread_creation_listener
 
 def pause_target_at_start():
 	gdb_wrapper.immediate_breakpoint_at("main")
 	gdb_wrapper.immediate_execute(GDB_RUN_INSTRUCTION)
 
+# A created thread can hit its first checkpoint before the thread that created
+# it returns from the clone syscall and hits its thread creation checkpoint.
+# Replay can only switch to a thread once it exists, so the creator's thread
+# creation checkpoint is moved to just before the first checkpoint of the thread
+# it created. The creator hits no checkpoints while inside the syscall, so this
+# keeps the order of the checkpoints of every thread. The nth thread creation
+# checkpoint hit by a thread is matched with the nth thread that it created.
+# Checkpoints are read twice from the trace, once to find the creator
+# checkpoints that were hit after the first checkpoint of the thread they
+# created, and once to move each of them just before that checkpoint. Only the
+# creator checkpoints that are moved are kept between the passes, along with
+# the position of the first checkpoint of each thread.
 class CheckpointMatcher:
-	def __init__(self, checkpoints, thread_creations,
+	def __init__(self, trace, thread_creations,
 			thread_creation_checkpoints):
-		self._checkpoints = checkpoints
-		self._thread_creations = thread_creations
+		self._trace = trace
 		self._thread_creation_checkpoints = thread_creation_checkpoints
-		self._unmatched_created_thread_checkpoint_ids = []
-		self._unmatched_creator_thread_checkpoint_ids = []
-		self._seen_threads = set([MAIN_THREAD_ID])
-		self._required_reorderings = set()
+		self._created_threads_by_creator = collections.defaultdict(collections.deque)
+		for thread_creation in thread_creations:
+			self._created_threads_by_creator[
+				thread_creation[CHECKPOINT_ACTION_CREATOR_THREAD_TAG]
+			].append(thread_creation[CHECKPOINT_ACTION_CREATED_THREAD_TAG])
 
 	def checkpoints_with_correctly_ordered_thread_creations(self):
-		return self._checkpoints
-		return self._associated_checkpoints()
-
-	def _associated_checkpoints(self):
-		main_thread_id = 1
-		seen_threads = set([main_thread_id])
-		for checkpoint in self._checkpoints:
-			self._handle_checkpoint(checkpoint)
-		assert len(self._unmatched_creator_thread_checkpoint_ids) == 0, \
-				"Unmatched creator threads remain after matching"
-		assert len(self._unmatched_created_thread_checkpoint_ids) == 0, \
-				"Unmatched created threads remain after matching"
-		return self._reordered_checkpoints()
-
-	def _reordered_checkpoints(self):
-		for reordering in self._required_reorderings:
-			self._apply_reordering(reordering)
-		return self._checkpoints
-
-	def _apply_reordering(self, reordering):
-		checkpoint_to_move_id = reordering[0]
-		checkpoint_to_move_to_id = reordering[1]
-		checkpoint_to_move_index = \
-				self._get_checkpoint_index_by_id(checkpoint_to_move_id)
-		checkpoint_to_move_to_index = \
-				self._get_checkpoint_index_by_id(checkpoint_to_move_to_id)
-		self._move(checkpoint_to_move_index, checkpoint_to_move_to_index)
-
-	def _move(self, index_to_move_from, index_to_move_to):
-		checkpoint_to_move = self._checkpoints[index_to_move_from]
-		self._checkpoints.pop(index_to_move_from)
-		self._checkpoints.insert(index_to_move_to, checkpoint_to_move)
-
-	def _get_checkpoint_index_by_id(self, checkpoint_id):
-		return self._checkpoints.index(next(filter(lambda checkpoint: \
-				checkpoint[CHECKPOINT_ID_TAG] == checkpoint_id, self._checkpoints)))
-
-	def _handle_checkpoint(self, checkpoint):
-		if checkpoint[THREAD_ID_TAG] not in self._seen_threads:
-			self._handle_created_thread(checkpoint)
-		elif checkpoint[CHECKPOINT_LOCATION_TAG] in \
-				self._thread_creation_checkpoints:
-			self._handle_creator_thread(checkpoint)
-		self._attempt_to_match()
-
-	def _handle_creator_thread(self, checkpoint):
-		checkpoint[CHECKPOINT_ACTION_TAG] = CHECKPOINT_ACTION_CREATOR_THREAD_TAG
-		self._unmatched_creator_thread_checkpoint_ids.append(checkpoint)
-
-	def _handle_created_thread(self, checkpoint):
-		checkpoint[CHECKPOINT_ACTION_TAG] = CHECKPOINT_ACTION_CREATED_THREAD_TAG
-		self._unmatched_created_thread_checkpoint_ids.append(checkpoint)
-		self._seen_threads.add(checkpoint[THREAD_ID_TAG])
-
-	def _attempt_to_match(self):
-		for checkpoint in self._unmatched_creator_thread_checkpoint_ids:
-			next_thread_creation = \
-					self._next_thread_creation_by_thread(checkpoint[THREAD_ID_TAG])
-			match = self._matching_checkpoint(next_thread_creation[CHECKPOINT_ACTION_CREATED_THREAD_TAG])
-			if match != None and not self._is_correct_order(checkpoint, match):
-				self._add_reorder(checkpoint[CHECKPOINT_ID_TAG],
-						match[CHECKPOINT_ID_TAG])
-			if match != None:
-				self._remove_checkpoints_for_reordering(checkpoint[CHECKPOINT_ID_TAG],
-						match[CHECKPOINT_ID_TAG])
-				self._remove_thread_creation(checkpoint[THREAD_ID_TAG],
-						match[THREAD_ID_TAG])
-				return
-
-	def _is_correct_order(self, potential_creator_checkpoint,
-			potential_created_checkpoint):
-		return potential_creator_checkpoint[CHECKPOINT_ID_TAG] < \
-				potential_created_checkpoint[CHECKPOINT_ID_TAG]
-
-	def _remove_thread_creation(self, creator_thread_checkpoint_id,
-			created_thread_checkpoint_id):
-		thread_creation_to_remove = ({
-				CHECKPOINT_ACTION_CREATOR_THREAD_TAG: creator_thread_checkpoint_id,
-				CHECKPOINT_ACTION_CREATED_THREAD_TAG: created_thread_checkpoint_id
-		})
-		self._thread_creations.remove(thread_creation_to_remove)
-
-	def _remove_checkpoints_for_reordering(self, creator_thread_checkpoint_id,
-			created_thread_checkpoint_id):
-		self._unmatched_creator_thread_checkpoint_ids = \
-				self._remove_checkpoint_with_id(
-						self._unmatched_creator_thread_checkpoint_ids,
-						creator_thread_checkpoint_id
-				)
-		self._unmatched_created_thread_checkpoint_ids = \
-				self._remove_checkpoint_with_id(
-						self._unmatched_created_thread_checkpoint_ids,
-						created_thread_checkpoint_id
-				)
-
-	def _remove_checkpoint_with_id(self, checkpoint_list, checkpoint_id):
-		return list(filter(lambda checkpoint: \
-				checkpoint[CHECKPOINT_ID_TAG] != checkpoint_id, checkpoint_list))
-
-	def _add_reorder(self, creator_thread_checkpoint_id,
-			created_thread_checkpoint_id):
-		self._required_reorderings.add((
-				creator_thread_checkpoint_id,
-				created_thread_checkpoint_id
-		))
-
-	def _matching_checkpoint(self, thread_id):
-		matched_checkpoint = next(filter(lambda checkpoint: \
-				checkpoint[THREAD_ID_TAG] == thread_id,
-				self._unmatched_created_thread_checkpoint_ids), None)
-		return matched_checkpoint
-
-	def _next_thread_creation_by_thread(self, thread_id):
-		return next(filter(lambda thread_creation:
-				thread_creation[CHECKPOINT_ACTION_CREATOR_THREAD_TAG] == thread_id, self._thread_creations
-		))
-
-def get_start_routines():
-	return ["increment"]
+		moved_creator_checkpoints, moved_creator_positions = self._moved_creator_checkpoints()
+		log(f"Reordering {len(moved_creator_positions)} thread creation checkpoints")
+		for position, checkpoint in self._tagged_checkpoints():
+			yield from moved_creator_checkpoints.get(position, ())
+			if position not in moved_creator_positions:
+				yield checkpoint
+
+	# Returns the moved creator checkpoints by the position they are moved in
+	# front of, and the positions they are moved from.
+	def _moved_creator_checkpoints(self):
+		first_checkpoint_positions = {}
+		matched_threads = set()
+		moved_creator_checkpoints = collections.defaultdict(list)
+		moved_creator_positions = set()
+		for position, checkpoint in self._tagged_checkpoints():
+			thread = checkpoint[THREAD_ID_TAG]
+			action = checkpoint[CHECKPOINT_ACTION_TAG]
+			if action == CHECKPOINT_ACTION_CREATED_THREAD_TAG:
+				first_checkpoint_positions[thread] = position
+			elif action == CHECKPOINT_ACTION_CREATOR_THREAD_TAG:
+				created_threads = self._created_threads_by_creator[thread]
+				if len(created_threads) == 0:
+					warning("Thread creation checkpoint %d has no matching thread creation",
+						checkpoint[CHECKPOINT_ID_TAG])
+					continue
+				created_thread = created_threads.popleft()
+				matched_threads.add(created_thread)
+				created_position = first_checkpoint_positions.get(created_thread)
+				if created_position is not None:
+					moved_creator_checkpoints[created_position].append(checkpoint)
+					moved_creator_positions.add(position)
+		for created_thread in sorted(matched_threads.difference(first_checkpoint_positions)):
+			warning("Thread %d was created but never hit a checkpoint", created_thread)
+		unmatched_threads = set(first_checkpoint_positions).difference(matched_threads)
+		if len(unmatched_threads) > 0:
+			warning("No thread creation checkpoint matched threads %s", sorted(unmatched_threads))
+		return moved_creator_checkpoints, moved_creator_positions
+
+	# Marks the first checkpoint of each thread other than the main thread as
+	# where it was created, and the later checkpoints at thread creation sites
+	# as where their thread created another.
+	def _tagged_checkpoints(self):
+		seen_threads = set([MAIN_THREAD_ID])
+		for position, checkpoint in enumerate(self._trace.iter_checkpoints()):
+			thread = checkpoint[THREAD_ID_TAG]
+			if thread not in seen_threads:
+				checkpoint[CHECKPOINT_ACTION_TAG] = CHECKPOINT_ACTION_CREATED_THREAD_TAG
+				seen_threads.add(thread)
+			elif checkpoint[CHECKPOINT_LOCATION_TAG] in self._thread_creation_checkpoints:
+				checkpoint[CHECKPOINT_ACTION_TAG] = CHECKPOINT_ACTION_CREATOR_THREAD_TAG
+			yield position, checkpoint
+
+# The start routines of threads and the instructions that access shared
+# variables are found from the disassembly of the program. This has to happen
+# once the program has been paused, so that the addresses have been relocated.
+# Only the sites inside the target spec are kept.
+class RecordingTargets:
+	def __init__(self, target_spec, location_resolver):
+		start_routines = discover_start_routines()
+		shared_variable_accesses = discover_shared_variable_accesses(
+			start_routines,
+			target_spec.functions or None
+		)
+		self.start_routines = [
+			start_routine for start_routine in start_routines
+			if target_spec.includes_function(start_routine) and target_spec_includes_location(
+				target_spec, f"*{hex(function_address(start_routine))}", location_resolver
+			)
+		]
+		self.shared_variable_accesses = {
+			location: access for location, access in shared_variable_accesses.items()
+			if target_spec.includes_variable(access[SHARED_VARIABLE_TAG]) and
+				target_spec_includes_location(target_spec, location, location_resolver)
+		}
+		if len(self.start_routines) < len(start_routines) or \
+				len(self.shared_variable_accesses) < len(shared_variable_accesses):
+			log(f"Recording {len(self.start_routines)} of {len(start_routines)} start routines and "
+				f"{len(self.shared_variable_accesses)} of {len(shared_variable_accesses)} shared "
+				f"variable accesses inside the target spec")
+
+# The target spec is read once, the first time it is needed.
+@functools.lru_cache(maxsize=None)
+def load_target_spec():
+	if TARGET_SPEC_FILE == "":
+		return TargetSpec()
+	target_spec = TargetSpec.load(TARGET_SPEC_FILE)
+	log(f"Recording the sites inside the target spec {target_spec}")
+	return target_spec
+
+# Locations may be symbolic or live addresses.
+def target_spec_includes_location(target_spec, location, location_resolver):
+	module, offset = split_location(location)
+	if module is None and offset is not None:
+		module, offset = split_location(location_resolver.symbolic_location(offset))
+	address = int(location_resolver.live_location(location).lstrip("*"), 16)
+	return target_spec.includes_site(module, offset, address)
+
+def function_address(function):
+	return int(gdb.parse_and_eval(f"(long) &{function}"))
+
+def open_snapshotter():
+	return Snapshotter(
+		SNAPSHOT_REGISTERS,
+		SNAPSHOT_SHARED_VARIABLES,
+		SNAPSHOT_EVERY_NTH_CHECKPOINT
+	)
+
+def open_trace_writer(recording_targets, location_resolver):
+	shared_variable_accesses = {
+		location_resolver.symbolic_location(int(location.lstrip("*"), 16)): access
+		for location, access in recording_targets.shared_variable_accesses.items()
+	}
+	header = {
+		START_ROUTINE_TAG: recording_targets.start_routines,
+		SHARED_VARIABLE_ACCESSES_TAG: shared_variable_accesses
+	}
+	# Replay needs the sizes of the shared variables to check their snapshots
+	if len(SNAPSHOT_SHARED_VARIABLES) > 0:
+		header[SNAPSHOT_SHARED_VARIABLES_TAG] = SNAPSHOT_SHARED_VARIABLES
+	return TraceWriter(OUTPUT_FILE, header)
 
 def configure_gdb_to_run_as_a_script():
 	gdb_wrapper.immediate_execute("set pagination off")
 	gdb_wrapper.immediate_execute("set confirm off")
 
 def main():
+	metrics.write_summary_at_exit(OUTPUT_FILE, "record")
+	gdb_wrapper.connect_stop_counter()
 	configure_gdb_to_run_as_a_script()
-	log("First pass of program to find thread creation checkpoints")
-	thread_creation_checkpoints = get_thread_creation_checkpoints()
+	if RECORD_IN_SINGLE_PASS:
+		log("Single pass of program, finding thread creation checkpoints as they are hit")
+		run_sut_single_pass()
+	else:
+		log("First pass of program to find thread creation checkpoints")
+		get_thread_creation_checkpoints()
 
 if __name__ == "__main__":
 	main()
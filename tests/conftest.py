@@ -0,0 +1,10 @@
+#!/bin/python3
+import os
+import sys
+
+# The modules of syrup import each other from the syrup directory, as they do
+# when GDB sources its scripts, and import gdb, which is the fake GDB of the
+# benchmarks outside of GDB.
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("syrup", "benchmarks", os.path.join("benchmarks", "fake_gdb")):
+	sys.path.insert(0, os.path.join(REPOSITORY_DIRECTORY, directory))
@@ -0,0 +1,83 @@
+#!/bin/python3
+from explorer.explorer import random_schedules, thread_creation_dependencies, THREAD_ID_TAG, \
+		CHECKPOINT_ACTION_TAG, CHECKPOINT_ACTION_CREATOR_THREAD_TAG, \
+		CHECKPOINT_ACTION_CREATED_THREAD_TAG, MAIN_THREAD_ID
+from explorer.partial_order_reduction import ScheduleEnumerator, CHECKPOINT_LOCATION_TAG, \
+		SHARED_VARIABLE_TAG, ACCESS_TAG
+
+CHECKPOINT_ID_TAG = "id"
+CREATOR_LOCATION = "*libpthread.so.0+0xe2ec"
+START_ROUTINE_LOCATION = "*a.out+0x11a9"
+WRITE_LOCATION = "*a.out+0x1234"
+SHARED_VARIABLE_ACCESSES = {WRITE_LOCATION: {SHARED_VARIABLE_TAG: "x", ACCESS_TAG: "write"}}
+
+# The main thread creates threads 2 and 3. Thread 2 writes x and then creates
+# thread 4, while thread 3 creates thread 5 and then writes x, so writing x in
+# thread 3 first has thread 3 create its thread first.
+def two_creator_threads_trace():
+	steps = [
+		(MAIN_THREAD_ID, CREATOR_LOCATION, CHECKPOINT_ACTION_CREATOR_THREAD_TAG),
+		(MAIN_THREAD_ID, CREATOR_LOCATION, CHECKPOINT_ACTION_CREATOR_THREAD_TAG),
+		(2, START_ROUTINE_LOCATION, CHECKPOINT_ACTION_CREATED_THREAD_TAG),
+		(3, START_ROUTINE_LOCATION, CHECKPOINT_ACTION_CREATED_THREAD_TAG),
+		(2, WRITE_LOCATION, ""),
+		(2, CREATOR_LOCATION, CHECKPOINT_ACTION_CREATOR_THREAD_TAG),
+		(3, CREATOR_LOCATION, CHECKPOINT_ACTION_CREATOR_THREAD_TAG),
+		(3, WRITE_LOCATION, ""),
+		(4, START_ROUTINE_LOCATION, CHECKPOINT_ACTION_CREATED_THREAD_TAG),
+		(5, START_ROUTINE_LOCATION, CHECKPOINT_ACTION_CREATED_THREAD_TAG)
+	]
+	return [
+		{
+			CHECKPOINT_ID_TAG: position,
+			THREAD_ID_TAG: thread,
+			CHECKPOINT_LOCATION_TAG: location,
+			CHECKPOINT_ACTION_TAG: action
+		}
+		for position, (thread, location, action) in enumerate(steps)
+	]
+
+# Checks that every checkpoint of a schedule is numbered as replay numbers its
+# thread, the thread created by the nth thread creation checkpoint of the
+# schedule being the nth created thread. Returns whether any thread was
+# renumbered.
+def check_thread_numbers(checkpoints, schedule):
+	creator_positions = thread_creation_dependencies(checkpoints)
+	scheduled_creators = [
+		checkpoint[CHECKPOINT_ID_TAG] for checkpoint in schedule
+		if checkpoint[CHECKPOINT_ACTION_TAG] == CHECKPOINT_ACTION_CREATOR_THREAD_TAG
+	]
+	live_threads = {MAIN_THREAD_ID: MAIN_THREAD_ID}
+	for created_position, creator_position in creator_positions.items():
+		live_threads[checkpoints[created_position][THREAD_ID_TAG]] = \
+			MAIN_THREAD_ID + 1 + scheduled_creators.index(creator_position)
+	for checkpoint in schedule:
+		recorded_checkpoint = checkpoints[checkpoint[CHECKPOINT_ID_TAG]]
+		assert checkpoint[THREAD_ID_TAG] == live_threads[recorded_checkpoint[THREAD_ID_TAG]]
+		assert {**checkpoint, THREAD_ID_TAG: recorded_checkpoint[THREAD_ID_TAG]} == recorded_checkpoint
+	return any(recorded != live for recorded, live in live_threads.items())
+
+def test_recorded_order_keeps_its_thread_numbers():
+	checkpoints = two_creator_threads_trace()
+	recorded_order = next(random_schedules(checkpoints, 1))
+	assert recorded_order == checkpoints
+	assert not check_thread_numbers(checkpoints, recorded_order)
+
+def test_random_schedules_renumber_threads_created_out_of_order():
+	checkpoints = two_creator_threads_trace()
+	renumbered_count = 0
+	for schedule in random_schedules(checkpoints, 50):
+		if check_thread_numbers(checkpoints, schedule):
+			renumbered_count += 1
+	assert renumbered_count > 0
+
+def test_enumerated_schedules_renumber_threads_created_out_of_order():
+	checkpoints = two_creator_threads_trace()
+	schedules = list(ScheduleEnumerator(checkpoints, SHARED_VARIABLE_ACCESSES).schedules())
+	assert len(schedules) == 2
+	assert [check_thread_numbers(checkpoints, schedule) for schedule in schedules] == [False, True]
+	start_routine_threads = {
+		checkpoint[CHECKPOINT_ID_TAG]: checkpoint[THREAD_ID_TAG] for checkpoint in schedules[1]
+		if checkpoint[CHECKPOINT_ACTION_TAG] == CHECKPOINT_ACTION_CREATED_THREAD_TAG
+	}
+	assert start_routine_threads == {2: 2, 3: 3, 8: 5, 9: 4}
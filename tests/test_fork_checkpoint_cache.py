@@ -0,0 +1,42 @@
+#!/bin/python3
+import gdb
+import pytest
+from fork_checkpoint_cache import fork_checkpoint_cache
+from fork_checkpoint_cache.fork_checkpoint_cache import ForkCheckpointCache
+
+@pytest.fixture
+def simulator():
+	gdb.load_program(gdb.Program({}, []))
+	simulator = gdb.simulator()
+	simulator.inferior = gdb.Inferior(simulator, 4242)
+	simulator.executed = []
+	simulator.selected_thread = simulator._add_thread(1)
+	return simulator
+
+@pytest.fixture
+def warnings(monkeypatch):
+	warnings = []
+	monkeypatch.setattr(fork_checkpoint_cache, "warning", lambda text, *arguments: warnings.append(text % arguments))
+	return warnings
+
+def test_checkpoints_are_taken_while_single_threaded(simulator):
+	cache = ForkCheckpointCache(capacity=2)
+	cache.take_at_beginning()
+	assert cache.take([0, 1])
+	assert not cache.take([0, 1])
+	assert cache.take([0, 1, 2])
+	assert cache.take([0, 1, 2, 3])
+	assert len(simulator.forks) == 4
+
+def test_no_checkpoint_is_taken_with_several_threads(simulator):
+	simulator._add_thread(2)
+	assert not ForkCheckpointCache().take([0, 1])
+	assert simulator.forks == {}
+
+def test_each_skipped_id_is_warned_about_once(simulator, warnings):
+	cache = ForkCheckpointCache()
+	for checkpoint_id in [4, 7, 4, 4, 7]:
+		cache.skip(checkpoint_id)
+	assert len(warnings) == 2
+	assert "checkpoint 4 " in warnings[0]
+	assert "checkpoint 7 " in warnings[1]
@@ -0,0 +1,64 @@
+#!/bin/python3
+import pytest
+from orchestrator.gdb_mi import parse_record, parse_results, quote_c_string, MiParseError, \
+		RECORD_RESULT, RECORD_EXEC_ASYNC, RECORD_NOTIFY_ASYNC, RECORD_CONSOLE_STREAM, \
+		RECORD_LOG_STREAM, RECORD_INFERIOR_OUTPUT, RESULT_DONE, RESULT_ERROR, ASYNC_STOPPED
+
+def test_prompt_and_blank_lines_are_not_records():
+	assert parse_record("(gdb) \n") is None
+	assert parse_record("\n") is None
+
+def test_result_record_with_token():
+	record = parse_record('12^done,value="42"\n')
+	assert record.kind == RECORD_RESULT
+	assert record.token == 12
+	assert record.record_class == RESULT_DONE
+	assert record.results == {"value": "42"}
+
+def test_error_record():
+	record = parse_record('^error,msg="No symbol \\"counter\\" in current context."')
+	assert record.record_class == RESULT_ERROR
+	assert record.token is None
+	assert record.results["msg"] == 'No symbol "counter" in current context.'
+
+def test_stopped_record_with_nested_results():
+	record = parse_record(
+		'*stopped,reason="breakpoint-hit",bkptno="2",frame={addr="0x401136",func="main",'
+		'args=[{name="argc",value="1"}]},thread-id="1",stopped-threads="all"'
+	)
+	assert record.kind == RECORD_EXEC_ASYNC
+	assert record.record_class == ASYNC_STOPPED
+	assert record.results["frame"]["func"] == "main"
+	assert record.results["frame"]["args"] == [{"name": "argc", "value": "1"}]
+	assert record.results["thread-id"] == "1"
+
+def test_notify_record_without_results():
+	record = parse_record("=thread-group-started")
+	assert record.kind == RECORD_NOTIFY_ASYNC
+	assert record.results == {}
+
+def test_stream_records_unescape_their_text():
+	record = parse_record('~"Counter value is 4\\n"')
+	assert record.kind == RECORD_CONSOLE_STREAM
+	assert record.text == "Counter value is 4\n"
+	assert parse_record('&"\\tlog\\033"').text == "\tlog\x1b"
+	assert parse_record('&"\\tlog\\033"').kind == RECORD_LOG_STREAM
+
+def test_inferior_output_is_kept_as_it_is():
+	for line in ["Counter value is 4", "~not a stream", "^not a record,,", "1+1=2"]:
+		record = parse_record(line)
+		assert record.kind == RECORD_INFERIOR_OUTPUT
+		assert record.text == line
+
+def test_repeated_variables_become_lists():
+	assert parse_results('thread-id="1",thread-id="2",thread-id="3"') == {"thread-id": ["1", "2", "3"]}
+
+def test_results_that_do_not_parse_raise():
+	with pytest.raises(MiParseError):
+		parse_results('value="42"garbage')
+	with pytest.raises(MiParseError):
+		parse_results('value="unterminated')
+
+def test_quoted_strings_parse_back():
+	text = 'a "quoted"\tpath\\with\nnewlines'
+	assert parse_results(f"text={quote_c_string(text)}") == {"text": text}
@@ -0,0 +1,37 @@
+#!/bin/python3
+import gdb
+import pytest
+from gdb_wrapper import gdb_wrapper
+from metrics import metrics
+
+@pytest.fixture
+def enabled_metrics(monkeypatch):
+	gdb.load_program(gdb.Program({}, []))
+	monkeypatch.setattr(metrics, "IS_ENABLED", True)
+	metrics.reset()
+	yield
+	gdb_wrapper.disconnect_all()
+	metrics.reset()
+
+def stop_count():
+	return metrics._counters.get(metrics.STOPS_COUNTER, 0)
+
+def test_stops_are_counted_once_connected(enabled_metrics):
+	gdb.events.stop.fire(gdb.StopEvent())
+	assert stop_count() == 0
+	gdb_wrapper.connect_stop_counter()
+	gdb_wrapper.connect_stop_counter()
+	gdb.events.stop.fire(gdb.StopEvent())
+	assert stop_count() == 1
+
+def test_stop_counter_is_disconnected_with_the_other_listeners(enabled_metrics):
+	gdb_wrapper.connect_stop_counter()
+	gdb_wrapper.disconnect_all()
+	gdb.events.stop.fire(gdb.StopEvent())
+	assert stop_count() == 0
+
+def test_stop_counter_is_not_connected_without_metrics(monkeypatch):
+	gdb.load_program(gdb.Program({}, []))
+	monkeypatch.setattr(metrics, "IS_ENABLED", False)
+	gdb_wrapper.connect_stop_counter()
+	assert (gdb.events.stop, metrics.stop_reported) not in gdb_wrapper._connected_listeners
@@ -0,0 +1,47 @@
+#!/bin/python3
+from log_analyzer.log_analyzer import LogAnalyzer, Histogram, action_template, PHASE_SETUP, \
+		PHASE_REPLAY
+
+REPLAY_LOG = [
+	"Breakpoint 1 at 0x401136: file counter.c, line 8.",
+	"Breakpoint 2 at 0x401150: file counter.c, line 12.",
+	"syrup: [1.000] set scheduler-locking on",
+	'Thread 1 "counter" hit Breakpoint 1, 0x0000000000401136 in main ()',
+	"syrup: [1.001] Marked {'id': 0, 'thread': 1, 'location': '*a.out+0x1136'} as hit",
+	"syrup: [1.003] Switching to thread 2",
+	"[Switching to Thread 0x7ffff7d8a640 (LWP 4243)]",
+	'Thread 2 "counter" hit Breakpoint 2, 0x0000000000401150 in increment ()',
+	"syrup: [1.010] Marked {'id': 1, 'thread': 2, 'location': '*a.out+0x1150'} as hit",
+	"[Thread 0x7ffff7d8a640 (LWP 4243) exited]"
+]
+
+def test_replay_log_is_counted():
+	checkpoints = []
+	analyzer = LogAnalyzer(lambda thread, location: checkpoints.append((thread, location)))
+	for line in REPLAY_LOG:
+		analyzer.analyse_line(line + "\n")
+	analyzer.finish()
+	assert list(analyzer.phases) == [PHASE_SETUP, PHASE_REPLAY]
+	replay = analyzer.phases[PHASE_REPLAY]
+	assert analyzer.stop_count() == 2
+	assert analyzer.checkpoint_count() == 2
+	assert checkpoints == [(1, "*a.out+0x1136"), (2, "*a.out+0x1150")]
+	assert replay.stops_by_location == {"0x401136": 1, "0x401150": 1}
+	assert replay.thread_switch_count == 1
+	assert replay.exited_thread_count == 1
+	assert replay.actions_per_stop == {2: 1, 1: 1}
+	assert analyzer.checkpoint_interval.count == 1
+
+def test_action_template_hides_what_changes():
+	assert action_template("Marked {'id': 3} as hit") == action_template("Marked {'id': 4} as hit")
+	assert action_template("Switching to thread 2") == "Switching to thread <n>"
+
+def test_histogram_buckets_double():
+	histogram = Histogram(smallest_bound=1, bucket_count=4)
+	for value in [0.5, 1.5, 3, 3, 100]:
+		histogram.add(value)
+	assert histogram.count == 5
+	assert histogram.largest == 100
+	assert histogram.buckets() == [(1, 1), (2, 1), (4, 2), (8, 0), (float("inf"), 1)]
+	assert histogram.quantile(0.5) == 4
+	assert histogram.quantile(1) == 100
@@ -0,0 +1,133 @@
+#!/bin/python3
+import itertools
+import random
+import pytest
+from explorer.explorer import thread_creation_dependencies, positions_by_thread, THREAD_ID_TAG, CHECKPOINT_ACTION_TAG, \
+		CHECKPOINT_ACTION_CREATOR_THREAD_TAG, CHECKPOINT_ACTION_CREATED_THREAD_TAG, MAIN_THREAD_ID
+from explorer.partial_order_reduction import ScheduleEnumerator, CHECKPOINT_LOCATION_TAG, \
+		SHARED_VARIABLE_TAG, ACCESS_TAG, ACCESS_READ
+
+CREATOR_LOCATION = "*libpthread.so.0+0xe2ec"
+START_ROUTINE_LOCATION = "*a.out+0x11a9"
+ACCESS_KINDS = [ACCESS_READ, "write", "read_write"]
+VARIABLES = ["x", "y"]
+
+# The sites of every kind of access to every variable, as recorded in the
+# header of a trace.
+def shared_variable_accesses():
+	accesses = {}
+	for index, (variable, kind) in enumerate(itertools.product(VARIABLES, ACCESS_KINDS)):
+		accesses[f"*a.out+0x12{index:02x}"] = {SHARED_VARIABLE_TAG: variable, ACCESS_TAG: kind}
+	return accesses
+
+# A trace of the main thread creating up to three threads, every thread
+# accessing the shared variables a few times. Traces are kept short enough for
+# every order of them to be enumerated.
+def random_trace(seed):
+	generator = random.Random(seed)
+	access_locations = list(shared_variable_accesses())
+	checkpoints = []
+	def access(thread):
+		checkpoints.append({
+			THREAD_ID_TAG: thread,
+			CHECKPOINT_LOCATION_TAG: generator.choice(access_locations)
+		})
+	created_threads = list(range(MAIN_THREAD_ID + 1, MAIN_THREAD_ID + 1 + generator.randint(1, 3)))
+	for _ in range(generator.randint(0, 1)):
+		access(MAIN_THREAD_ID)
+	for created_thread in created_threads:
+		checkpoints.append({
+			THREAD_ID_TAG: MAIN_THREAD_ID,
+			CHECKPOINT_LOCATION_TAG: CREATOR_LOCATION,
+			CHECKPOINT_ACTION_TAG: CHECKPOINT_ACTION_CREATOR_THREAD_TAG
+		})
+	for created_thread in created_threads:
+		checkpoints.append({
+			THREAD_ID_TAG: created_thread,
+			CHECKPOINT_LOCATION_TAG: START_ROUTINE_LOCATION,
+			CHECKPOINT_ACTION_TAG: CHECKPOINT_ACTION_CREATED_THREAD_TAG
+		})
+	access_count = 2 if len(created_threads) < 3 else 1
+	for thread in [MAIN_THREAD_ID] + created_threads:
+		for _ in range(generator.randint(1, access_count)):
+			access(thread)
+	return checkpoints
+
+# Every order of the positions that keeps the order of each thread and creates
+# each thread before it runs, found by running each enabled thread next in turn.
+def all_schedules(checkpoints):
+	creator_positions = thread_creation_dependencies(checkpoints)
+	thread_positions = positions_by_thread(checkpoints)
+	next_indices = {thread: 0 for thread in thread_positions}
+	schedule = []
+	def extend():
+		if len(schedule) == len(checkpoints):
+			yield list(schedule)
+			return
+		for thread, positions in thread_positions.items():
+			if next_indices[thread] == len(positions):
+				continue
+			position = positions[next_indices[thread]]
+			if position in creator_positions and creator_positions[position] not in schedule:
+				continue
+			schedule.append(position)
+			next_indices[thread] += 1
+			yield from extend()
+			next_indices[thread] -= 1
+			schedule.pop()
+	yield from extend()
+
+# The Foata normal form of a schedule: the steps of checkpoints that can run
+# at once, each checkpoint in the step after the last checkpoint before it that
+# it depends on. Two schedules are equivalent when their normal forms are.
+def normal_form(enumerator, schedule):
+	steps = []
+	for index, position in enumerate(schedule):
+		step = 0
+		for earlier_index in range(index):
+			if enumerator._is_dependent(schedule[earlier_index], position):
+				step = max(step, steps[earlier_index][0] + 1)
+		steps.append((step, position))
+	return tuple(sorted(steps))
+
+def schedule_positions(checkpoints, schedule):
+	identities = {id(checkpoint): position for position, checkpoint in enumerate(checkpoints)}
+	return [identities[id(checkpoint)] for checkpoint in schedule]
+
+@pytest.mark.parametrize("seed", range(40))
+def test_one_schedule_for_every_class_of_equivalent_schedules(seed):
+	checkpoints = random_trace(seed)
+	enumerator = ScheduleEnumerator(checkpoints, shared_variable_accesses())
+	emitted_forms = [
+		normal_form(enumerator, schedule_positions(checkpoints, schedule))
+		for schedule in enumerator.schedules()
+	]
+	expected_forms = set(normal_form(enumerator, schedule) for schedule in all_schedules(checkpoints))
+	assert len(emitted_forms) == len(set(emitted_forms))
+	assert set(emitted_forms) == expected_forms
+
+@pytest.mark.parametrize("seed", range(10))
+def test_total_schedule_count_counts_every_valid_schedule(seed):
+	checkpoints = random_trace(seed)
+	enumerator = ScheduleEnumerator(checkpoints, shared_variable_accesses())
+	assert enumerator.total_schedule_count() == sum(1 for _ in all_schedules(checkpoints))
+	assert enumerator.skipped_count() is None
+	emitted_count = sum(1 for _ in enumerator.schedules())
+	assert enumerator.skipped_count() == enumerator.total_schedule_count() - emitted_count
+
+def test_reads_of_the_same_variable_are_independent():
+	accesses = shared_variable_accesses()
+	read_location = next(
+		location for location, access in accesses.items()
+		if access[SHARED_VARIABLE_TAG] == "x" and access[ACCESS_TAG] == ACCESS_READ
+	)
+	checkpoints = [
+		{THREAD_ID_TAG: MAIN_THREAD_ID, CHECKPOINT_LOCATION_TAG: CREATOR_LOCATION,
+			CHECKPOINT_ACTION_TAG: CHECKPOINT_ACTION_CREATOR_THREAD_TAG},
+		{THREAD_ID_TAG: MAIN_THREAD_ID + 1, CHECKPOINT_LOCATION_TAG: START_ROUTINE_LOCATION,
+			CHECKPOINT_ACTION_TAG: CHECKPOINT_ACTION_CREATED_THREAD_TAG},
+		{THREAD_ID_TAG: MAIN_THREAD_ID, CHECKPOINT_LOCATION_TAG: read_location},
+		{THREAD_ID_TAG: MAIN_THREAD_ID + 1, CHECKPOINT_LOCATION_TAG: read_location}
+	]
+	enumerator = ScheduleEnumerator(checkpoints, accesses)
+	assert len(list(enumerator.schedules())) == 1
@@ -0,0 +1,43 @@
+#!/bin/python3
+import json
+import pytest
+from orchestrator.orchestrator import Job, JobResult, JOB_RECORD, JOB_REPLAY
+from explorer.explorer import Outcome, STATUS_EXITED
+from session_server.protocol import encode_job, decode_job, encode_result, decode_result, \
+		encode_error, encode_shutdown, is_shutdown, SessionError
+
+def test_job_round_trip():
+	job = Job(JOB_REPLAY, "./counter", "trace.json", ["4"], None, {"SYRUP_LOG_LEVEL": "debug"})
+	line = encode_job(job)
+	assert line.endswith("\n")
+	assert decode_job(json.loads(line)) == job
+
+def test_job_defaults():
+	assert decode_job({"kind": JOB_RECORD, "program": "./counter", "trace": "trace.json"}) == \
+		Job(JOB_RECORD, "./counter", "trace.json")
+
+def test_unknown_job_kind_is_an_error():
+	with pytest.raises(SessionError):
+		decode_job({"kind": "explore", "program": "./counter", "trace": "trace.json"})
+
+def test_request_that_is_not_a_job_is_an_error():
+	with pytest.raises(SessionError):
+		decode_job({"kind": JOB_RECORD, "binary": "./counter"})
+
+def test_shutdown_is_not_a_job():
+	assert is_shutdown(json.loads(encode_shutdown()))
+	assert not is_shutdown({"kind": JOB_RECORD})
+	assert not is_shutdown([])
+
+def test_result_round_trip():
+	result = JobResult(
+		Job(JOB_REPLAY, "./counter", "trace.json", ["4"], None, {}),
+		Outcome(STATUS_EXITED, 0, 4),
+		17,
+		0.25
+	)
+	assert decode_result(encode_result(result)) == result
+
+def test_error_is_raised_when_decoded():
+	with pytest.raises(SessionError, match="not a job"):
+		decode_result(encode_error("{} is not a job"))
@@ -0,0 +1,37 @@
+#!/bin/python3
+import os
+import gdb
+import pytest
+from orchestrator.orchestrator import Job, JOB_REPLAY
+from explorer.explorer import Outcome, DIVERGENCE_EXIT_CODE, STATUS_EXITED, STATUS_DIVERGED
+from session_server.session_server import SessionServer
+
+@pytest.fixture
+def server(tmp_path):
+	gdb.load_program(gdb.Program({}, []))
+	return SessionServer(str(tmp_path / "syrup-session.sock"))
+
+# Stands in for a job whose inferior printed output and then exited.
+def finish_job(server, tmp_path, output, exit_code):
+	server._running_job = Job(JOB_REPLAY, "./counter", str(tmp_path / "trace.json"))
+	server._running_job_number = 1
+	server._started_at = 0
+	server._saved_environment = dict(os.environ)
+	server._output_file_name = str(tmp_path / "inferior.out")
+	with open(server._output_file_name, "w") as output_file:
+		output_file.write(output)
+	server._finish_job(exit_code)
+	job_number, result = server._results.get_nowait()
+	assert job_number == 1
+	assert not os.path.exists(str(tmp_path / "inferior.out"))
+	return result.outcome
+
+def test_value_is_found_in_the_output_of_the_inferior(server, tmp_path):
+	assert finish_job(server, tmp_path, "Starting\nCounter value is 7\n", 0) == Outcome(STATUS_EXITED, 0, "7")
+
+def test_output_without_a_value(server, tmp_path):
+	assert finish_job(server, tmp_path, "", 3) == Outcome(STATUS_EXITED, 3, None)
+
+def test_diverged_replay_has_no_value(server, tmp_path):
+	assert finish_job(server, tmp_path, "Counter value is 7\n", DIVERGENCE_EXIT_CODE) == \
+		Outcome(STATUS_DIVERGED, DIVERGENCE_EXIT_CODE, None)
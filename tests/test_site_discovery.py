@@ -0,0 +1,56 @@
+#!/bin/python3
+import gdb
+from simulated_program import INFO_FILES, TEXT_DISASSEMBLY_RANGE, TEXT_DISASSEMBLY
+from site_discovery.site_discovery import discover_start_routines, discover_shared_variable_accesses, \
+		SHARED_VARIABLE_TAG, ACCESS_TAG, ACCESS_READ, ACCESS_WRITE, ACCESS_READ_WRITE
+
+NON_PIE_INFO_FILES = """Symbols from "/work/a.out".
+Local exec file:
+	`/work/a.out', file type elf64-x86-64.
+	0x0000000000401000 - 0x0000000000401200 is .text
+	0x0000000000404000 - 0x0000000000404010 is .data
+	0x0000000000404010 - 0x0000000000404018 is .bss
+"""
+NON_PIE_DISASSEMBLY_RANGE = "0x401000,0x401200"
+# Start routines passed straight in %edx, and through %eax.
+NON_PIE_DISASSEMBLY = """Dump of assembler code from 0x401000 to 0x401200:
+   0x0000000000401136 <increment+0>:\tendbr64
+   0x000000000040113a <increment+4>:\tmov    0x404014,%eax
+   0x0000000000401141 <increment+11>:\tadd    $0x1,%eax
+   0x0000000000401144 <increment+14>:\tmov    %eax,0x404014
+   0x000000000040114a <increment+20>:\tret
+   0x000000000040114b <decrement+0>:\tendbr64
+   0x000000000040114f <decrement+4>:\tsubl   $0x1,0x404014
+   0x0000000000401157 <decrement+12>:\tret
+   0x0000000000401158 <main+0>:\tendbr64
+   0x000000000040115c <main+4>:\tmov    $0x401136,%edx
+   0x0000000000401161 <main+9>:\tmov    $0x0,%esi
+   0x0000000000401166 <main+14>:\tmov    %rbx,%rdi
+   0x0000000000401169 <main+17>:\tcall   0x401030 <pthread_create@plt>
+   0x000000000040116e <main+22>:\tmov    $0x40114b,%eax
+   0x0000000000401173 <main+27>:\tmov    %rax,%rdx
+   0x0000000000401176 <main+30>:\tmov    $0x0,%esi
+   0x000000000040117b <main+35>:\tcall   0x401030 <pthread_create@plt>
+   0x0000000000401180 <main+40>:\tmov    $0x401999,%edx
+   0x0000000000401185 <main+45>:\tcall   0x401030 <pthread_create@plt>
+End of assembler dump.
+"""
+
+def load_disassembly(files, disassembly_range, disassembly):
+	gdb.load_program(gdb.Program({}, [], files=files, disassembly={disassembly_range: disassembly}))
+
+def test_start_routine_loaded_relative_to_the_instruction_pointer():
+	load_disassembly(INFO_FILES, TEXT_DISASSEMBLY_RANGE, TEXT_DISASSEMBLY)
+	assert discover_start_routines() == ["increment"]
+
+def test_start_routines_loaded_as_immediates():
+	load_disassembly(NON_PIE_INFO_FILES, NON_PIE_DISASSEMBLY_RANGE, NON_PIE_DISASSEMBLY)
+	assert discover_start_routines() == ["increment", "decrement"]
+
+def test_absolute_accesses_of_start_routines():
+	load_disassembly(NON_PIE_INFO_FILES, NON_PIE_DISASSEMBLY_RANGE, NON_PIE_DISASSEMBLY)
+	assert discover_shared_variable_accesses(["increment", "decrement"]) == {
+		"*0x40113a": {SHARED_VARIABLE_TAG: "0x404014", ACCESS_TAG: ACCESS_READ},
+		"*0x401144": {SHARED_VARIABLE_TAG: "0x404014", ACCESS_TAG: ACCESS_WRITE},
+		"*0x40114f": {SHARED_VARIABLE_TAG: "0x404014", ACCESS_TAG: ACCESS_READ_WRITE}
+	}
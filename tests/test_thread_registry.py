@@ -0,0 +1,54 @@
+#!/bin/python3
+import gdb
+import pytest
+from thread_registry.thread_registry import ThreadRegistry, RegisteredThread, ThreadCreation
+
+@pytest.fixture
+def simulator():
+	gdb.load_program(gdb.Program({}, []))
+	simulator = gdb.simulator()
+	simulator.inferior = gdb.Inferior(simulator, 4242)
+	simulator.selected_thread = simulator._add_thread(1)
+	return simulator
+
+def create_thread(simulator, creator_num, created_num):
+	simulator.selected_thread = simulator.inferior._threads[creator_num]
+	return simulator._add_thread(created_num)
+
+def test_threads_already_there_are_registered(simulator):
+	registry = ThreadRegistry()
+	assert registry.alive_threads() == [RegisteredThread(1, 1)]
+	assert registry.creations() == []
+
+def test_selected_thread_is_the_creator(simulator):
+	registry = ThreadRegistry()
+	assert registry.add_created_thread(create_thread(simulator, 1, 2)) == [RegisteredThread(2, 2)]
+	assert registry.add_created_thread(create_thread(simulator, 2, 3)) == [RegisteredThread(3, 3)]
+	assert registry.creator_of(3) == RegisteredThread(2, 2)
+	assert registry.created_by(1) == [RegisteredThread(2, 2)]
+	assert registry.creations() == [
+		ThreadCreation(RegisteredThread(1, 1), RegisteredThread(2, 2)),
+		ThreadCreation(RegisteredThread(2, 2), RegisteredThread(3, 3))
+	]
+
+def test_thread_is_only_registered_once(simulator):
+	registry = ThreadRegistry()
+	created_thread = create_thread(simulator, 1, 2)
+	registry.add_created_thread(created_thread)
+	assert registry.add_created_thread(created_thread) == []
+
+def test_missed_threads_are_registered_in_order(simulator):
+	registry = ThreadRegistry()
+	create_thread(simulator, 1, 2)
+	create_thread(simulator, 1, 3)
+	registered_threads = registry.add_created_thread(create_thread(simulator, 1, 4))
+	assert registered_threads == [RegisteredThread(2, 2), RegisteredThread(3, 3), RegisteredThread(4, 4)]
+	assert registry.creator_of(2) is None
+	assert registry.creator_of(4) == RegisteredThread(1, 1)
+
+def test_exited_threads_are_noticed_from_the_inferior(simulator):
+	registry = ThreadRegistry()
+	registry.add_created_thread(create_thread(simulator, 1, 2))
+	del simulator.inferior._threads[2]
+	assert registry.alive_threads() == [RegisteredThread(1, 1)]
+	assert not registry.is_alive(2)
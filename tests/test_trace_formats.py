@@ -0,0 +1,119 @@
+#!/bin/python3
+import json
+import pytest
+from trace_writer.trace_writer import TraceWriter
+from trace_archive.trace_archive import TraceArchive, is_trace_archive, COMPRESSION_NONE, \
+		COMPRESSION_ZLIB, COMPRESSION_LZMA
+from trace_index.trace_index import TraceIndex
+from replay_reader.checkpoint_parser import checkpoint_parser
+
+HEADER = {
+	"thread_start_routines": ["*a.out+0x11a9"],
+	"shared_variable_accesses": {"*a.out+0x1234": {"variable": "counter", "access": "read_write"}}
+}
+LOCATIONS = ["*a.out+0x1234", "*a.out+0x11a9", "*libpthread.so.0+0xe2ec"]
+
+def checkpoints(count):
+	return [
+		{
+			"id": position,
+			"thread": 1 + position % 3,
+			"location": LOCATIONS[position * 7 % len(LOCATIONS)],
+			"action": "creator_thread" if position % 5 == 0 else "",
+			**({"snapshot": {"counter": position}} if position % 4 == 0 else {})
+		}
+		for position in range(count)
+	]
+
+def write_streamed_trace(trace_file_name, checkpoints):
+	writer = TraceWriter(trace_file_name, HEADER)
+	for checkpoint in checkpoints:
+		writer.write_checkpoint(checkpoint)
+	writer.close()
+
+@pytest.mark.parametrize("compression", [COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_LZMA])
+def test_archive_round_trip(tmp_path, compression):
+	trace_file_name = str(tmp_path / "trace.json")
+	archive_file_name = str(tmp_path / "trace.syrup")
+	recorded_checkpoints = checkpoints(50)
+	write_streamed_trace(trace_file_name, recorded_checkpoints)
+	recording = checkpoint_parser(trace_file_name)
+	TraceArchive.from_checkpoints(recording.get_header(), recording.iter_checkpoints()).save(
+		archive_file_name, compression
+	)
+	assert is_trace_archive(archive_file_name)
+	assert not is_trace_archive(trace_file_name)
+	archived = checkpoint_parser(archive_file_name)
+	assert archived.get_header() == recording.get_header()
+	assert archived.get_checkpoints() == recorded_checkpoints
+	assert list(archived.iter_checkpoints(10, 20)) == recorded_checkpoints[10:20]
+
+def test_archive_keeps_ids_that_are_not_positions(tmp_path):
+	archive_file_name = str(tmp_path / "trace.syrup")
+	renumbered_checkpoints = checkpoints(10)
+	for checkpoint in renumbered_checkpoints:
+		checkpoint["id"] += 100
+	TraceArchive.from_checkpoints(HEADER, renumbered_checkpoints).save(archive_file_name)
+	assert TraceArchive.load(archive_file_name).ids is not None
+	assert list(TraceArchive.load(archive_file_name).iter_checkpoints()) == renumbered_checkpoints
+
+def test_streamed_trace_ignores_an_incomplete_last_line(tmp_path):
+	trace_file_name = str(tmp_path / "trace.json")
+	write_streamed_trace(trace_file_name, checkpoints(3))
+	with open(trace_file_name, "a") as trace_file:
+		trace_file.write(json.dumps(checkpoints(4)[3])[:10])
+	assert checkpoint_parser(trace_file_name).get_checkpoints() == checkpoints(3)
+
+def test_single_document_trace_is_read(tmp_path):
+	trace_file_name = str(tmp_path / "trace.json")
+	with open(trace_file_name, "w") as trace_file:
+		json.dump({**HEADER, "checkpoints": checkpoints(5)}, trace_file)
+	recording = checkpoint_parser(trace_file_name)
+	assert recording.get_checkpoints() == checkpoints(5)
+	assert recording.get_start_routines() == HEADER["thread_start_routines"]
+	assert list(recording.iter_checkpoints(1, 3)) == checkpoints(5)[1:3]
+
+def test_index_seeks_to_a_window_of_a_streamed_trace(tmp_path):
+	trace_file_name = str(tmp_path / "trace.json")
+	recorded_checkpoints = checkpoints(100)
+	write_streamed_trace(trace_file_name, recorded_checkpoints)
+	index = TraceIndex.build(trace_file_name, offset_stride=8)
+	assert index.checkpoint_count == 100
+	assert index.seek(21) == (16, index.offsets[2])
+	assert list(checkpoint_parser(trace_file_name).iter_checkpoints(21, 30, index)) == \
+		recorded_checkpoints[21:30]
+
+def test_index_counts_hits_before_a_position(tmp_path):
+	trace_file_name = str(tmp_path / "trace.json")
+	recorded_checkpoints = checkpoints(60)
+	write_streamed_trace(trace_file_name, recorded_checkpoints)
+	index = TraceIndex.build(trace_file_name)
+	assert index.threads() == [1, 2, 3]
+	for thread in index.threads():
+		assert index.thread_positions(thread) == [
+			position for position, checkpoint in enumerate(recorded_checkpoints)
+			if checkpoint["thread"] == thread
+		]
+		for location in LOCATIONS:
+			assert index.hits_before(thread, location, 45) == sum(
+				1 for checkpoint in recorded_checkpoints[:45]
+				if checkpoint["thread"] == thread and checkpoint["location"] == location
+			)
+
+def test_index_is_saved_and_goes_stale(tmp_path):
+	trace_file_name = str(tmp_path / "trace.json")
+	index_file_name = str(tmp_path / "trace.json.index")
+	write_streamed_trace(trace_file_name, checkpoints(20))
+	TraceIndex.build(trace_file_name).save(index_file_name)
+	index = TraceIndex.load(index_file_name)
+	assert index.describes(trace_file_name)
+	assert index.thread_positions(2) == TraceIndex.build(trace_file_name).thread_positions(2)
+	write_streamed_trace(trace_file_name, checkpoints(25))
+	assert not index.describes(trace_file_name)
+
+def test_index_of_an_archive_has_no_offsets(tmp_path):
+	archive_file_name = str(tmp_path / "trace.syrup")
+	TraceArchive.from_checkpoints(HEADER, checkpoints(20)).save(archive_file_name)
+	index = TraceIndex.build(archive_file_name)
+	assert index.seek(10) is None
+	assert index.checkpoint_count == 20